@@ -0,0 +1,75 @@
+"""Add attendee search_text column with a trigram index
+
+Revision ID: 3d8f2a7c51e0
+Revises: 6b1e3f0c9a24
+Create Date: 2025-04-22 10:31:45.120374
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '3d8f2a7c51e0'
+down_revision = '6b1e3f0c9a24'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    op.add_column('attendee', sa.Column('search_text', sa.Unicode(), server_default='', nullable=False))
+
+    if not is_sqlite:
+        text_columns = [column['name'] for column in sa.inspect(op.get_bind()).get_columns('attendee')
+                        if isinstance(column['type'], sa.Text)
+                        and column['name'] not in ['other_accessibility_requests', 'search_text']]
+        op.execute("UPDATE attendee SET search_text = lower(concat_ws(E'\\n', {}))".format(
+            ', '.join("nullif(\"{}\", '')".format(name) for name in text_columns)))
+
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_attendee_search_text_trgm', 'attendee', ['search_text'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if is_sqlite:
+        with op.batch_alter_table('attendee', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+            batch_op.drop_column('search_text')
+    else:
+        op.drop_index('ix_attendee_search_text_trgm', table_name='attendee')
+        op.drop_column('attendee', 'search_text')
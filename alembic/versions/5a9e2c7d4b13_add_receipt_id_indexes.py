@@ -0,0 +1,61 @@
+"""Add receipt_id indexes to receipt items and transactions
+
+Revision ID: 5a9e2c7d4b13
+Revises: 8c4e1b9d2f76
+Create Date: 2025-05-09 11:46:31.208855
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9e2c7d4b13'
+down_revision = '8c4e1b9d2f76'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    op.create_index(op.f('ix_receipt_item_receipt_id'), 'receipt_item', ['receipt_id'], unique=False)
+    op.create_index(op.f('ix_receipt_transaction_receipt_id'), 'receipt_transaction', ['receipt_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_receipt_transaction_receipt_id'), table_name='receipt_transaction')
+    op.drop_index(op.f('ix_receipt_item_receipt_id'), table_name='receipt_item')
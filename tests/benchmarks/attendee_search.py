@@ -0,0 +1,89 @@
+"""
+Measures p50/p95 latency of attendee text searches, comparing an ILIKE
+against every searchable column behind the search joins with the
+Session.search lookup through Attendee.search_text.
+
+This needs the Postgres database from your config to be meaningful, since
+SQLite always uses the column-by-column search. The synthetic attendees it
+inserts are deleted again when it finishes.
+"""
+
+import argparse
+import random
+import string
+from statistics import quantiles
+from time import perf_counter
+
+from sqlalchemy import or_
+
+from uber.config import c
+from uber.models import Attendee, AttendeeAccount, Group, PromoCode, PromoCodeGroup, Session
+
+BENCHMARK_MARKER = 'searchbenchmark'
+
+
+def random_word(length=7):
+    return ''.join(random.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def insert_attendees(session, count):
+    attendees = []
+    for i in range(count):
+        attendee = Attendee(first_name=random_word().title(), last_name=random_word().title(),
+                            email='{}.{}@example.com'.format(random_word(), i),
+                            admin_notes=BENCHMARK_MARKER)
+        attendee._update_search_text()
+        attendees.append(attendee)
+    session.bulk_save_objects(attendees)
+    session.commit()
+    return [(a.first_name, a.last_name, a.email) for a in random.sample(attendees, 50)]
+
+
+def legacy_search(session, text):
+    attendees = session.query(Attendee).outerjoin(Group, Attendee.group_id == Group.id) \
+        .outerjoin(PromoCode).outerjoin(PromoCodeGroup)
+    conditions = [Group.name.ilike('%' + text + '%'), PromoCodeGroup.name.ilike('%' + text + '%')]
+    if c.ATTENDEE_ACCOUNTS_ENABLED:
+        attendees = attendees.outerjoin(AttendeeAccount, Attendee.managers)
+        conditions.append(AttendeeAccount.email.ilike('%' + text + '%'))
+    conditions.extend(getattr(Attendee, attr).ilike('%' + text + '%') for attr in Attendee.searchable_fields)
+    return attendees.filter(or_(*conditions)).limit(100).all()
+
+
+def indexed_search(session, text):
+    return session.search(text, limit=100)[0].ids
+
+
+def latencies(session, search, terms):
+    results = []
+    for term in terms:
+        start = perf_counter()
+        search(session, term)
+        results.append((perf_counter() - start) * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=50000, help='number of synthetic attendees to insert')
+    args = parser.parse_args()
+
+    with Session() as session:
+        try:
+            samples = insert_attendees(session, args.count)
+            terms = [first[:4] for first, _, _ in samples] + [email.split('@')[0] for _, _, email in samples] \
+                + [random_word(5) for _ in range(50)]
+
+            for name, search in [('before', legacy_search), ('after', indexed_search)]:
+                p50, p95 = [quantiles(latencies(session, search, terms), n=100)[i] for i in (49, 94)]
+                print('{:>6}: p50 {:.1f}ms, p95 {:.1f}ms over {} searches of {} attendees'.format(
+                    name, p50, p95, len(terms), args.count))
+        finally:
+            session.rollback()
+            session.query(Attendee).filter(Attendee.admin_notes == BENCHMARK_MARKER).delete(
+                synchronize_session=False)
+            session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares automated email renders/sec using a freshly compiled template and a
+freshly built template context for every recipient against the cached
+templates and context that AutomatedEmail.render_email uses.
+"""
+
+import argparse
+from time import perf_counter
+
+from uber.decorators import renderable_data
+from uber.jinja import JinjaEnv
+from uber.models import Attendee, AutomatedEmail
+from uber.utils import request_cached_context
+
+
+SUBJECT = '{{ c.EVENT_NAME }} registration confirmation for {{ attendee.full_name }}'
+BODY = '''{{ attendee.first_name }},
+
+Thanks for registering for {{ c.EVENT_NAME }}! Your badge type is {{ attendee.badge_type_label }}.
+{% if attendee.paid == c.HAS_PAID %}Your payment has been received.{% else %}You still owe us money.{% endif %}
+
+{% for dept in attendee.assigned_depts %}{{ dept.name }}{% if not loop.last %}, {% endif %}{% endfor %}
+
+{{ c.EVENT_NAME }} Staff
+'''
+
+
+def synthetic_attendees(count):
+    return [Attendee(first_name='First{}'.format(i), last_name='Last{}'.format(i),
+                     email='attendee{}@example.com'.format(i)) for i in range(count)]
+
+
+def render_uncached(automated_email, attendee):
+    data = renderable_data({'attendee': attendee})
+    with request_cached_context(clear_cache_on_start=True):
+        env = JinjaEnv.env()
+        return env.from_string(automated_email.subject).render(data), env.from_string(automated_email.body).render(data)
+
+
+def render_cached(automated_email, attendee):
+    return automated_email.render_email(attendee)
+
+
+def renders_per_second(render, automated_email, attendees):
+    start = perf_counter()
+    for attendee in attendees:
+        render(automated_email, attendee)
+    return len(attendees) / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=3000, help='number of synthetic attendees to render for')
+    args = parser.parse_args()
+
+    automated_email = AutomatedEmail(ident='benchmark', model='Attendee', subject=SUBJECT, body=BODY,
+                                     sender='test@example.com', format='text')
+    attendees = synthetic_attendees(args.count)
+
+    for name, render in [('before', render_uncached), ('after', render_cached)]:
+        print('{:>6}: {:,.0f} renders/sec over {} attendees'.format(
+            name, renders_per_second(render, automated_email, attendees), args.count))
+
+
+if __name__ == '__main__':
+    main()
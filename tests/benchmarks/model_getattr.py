@@ -0,0 +1,91 @@
+"""
+Compares rendering an admin-style attendee table, which looks up a dozen
+dynamic attributes per attendee, with the old MagModel.__getattr__ that
+re-checked every kind of dynamic attribute on each lookup against the
+per-class dispatch table it uses now.
+"""
+
+import argparse
+from time import perf_counter
+
+import uber
+from uber.config import c
+from uber.decorators import suffix_property
+from uber.jinja import JinjaEnv
+from uber.models import Attendee, MagModel
+from uber.utils import localized_now
+
+
+TEMPLATE = '''{% for attendee in attendees %}
+<tr>
+  <td>{{ attendee.full_name }}</td>
+  <td>{{ attendee.badge_type_label }}</td>
+  <td>{{ attendee.badge_status_label }}</td>
+  <td>{{ attendee.paid_label }}</td>
+  <td>{{ attendee.ribbon_labels|join(', ') }}</td>
+  <td>{{ attendee.shirt_label }}</td>
+  <td>{{ attendee.amount_extra_label }}</td>
+  <td>{{ attendee.registered_local.strftime('%Y-%m-%d') }}</td>
+  <td>{{ attendee.is_attendee }} {{ attendee.is_group }}</td>
+</tr>
+{% endfor %}'''
+
+
+def legacy_getattr(self, name):
+    suffixed = suffix_property.check(self, name)
+    if suffixed is not None:
+        return suffixed
+
+    choice = getattr(c, name, None)
+    if choice is not None:
+        if len(self.multichoice_columns) == 1:
+            multi = self.multichoice_columns[0]
+            if choice in multi.type.choices_dict:
+                return choice in getattr(self, multi.name + '_ints')
+
+    if name.startswith('is_'):
+        return self.__class__.__name__.lower() == name[3:]
+
+    receipt_items = uber.receipt_items.receipt_calculation.items
+    try:
+        cost_calc = receipt_items[self.__class__.__name__][name[8:]](self)
+        if not cost_calc:
+            return 0
+        return cost_calc[1] / 100
+    except Exception:
+        pass
+
+    raise AttributeError(self.__class__.__name__ + '.' + name)
+
+
+def synthetic_attendees(count):
+    return [Attendee(first_name='First{}'.format(i), last_name='Last{}'.format(i), badge_type=c.ATTENDEE_BADGE,
+                     paid=c.HAS_PAID, ribbon=c.VOLUNTEER_RIBBON, registered=localized_now())
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=2000, help='number of synthetic attendees in the table')
+    parser.add_argument('--repeat', type=int, default=5, help='number of times to render the table')
+    args = parser.parse_args()
+
+    template = JinjaEnv.env().from_string(TEMPLATE)
+    attendees = synthetic_attendees(args.count)
+    current_getattr = MagModel.__getattr__
+
+    for name, getattr_func in [('before', legacy_getattr), ('after', current_getattr)]:
+        MagModel.__getattr__ = getattr_func
+        try:
+            template.render(attendees=attendees, c=c)
+            start = perf_counter()
+            for _ in range(args.repeat):
+                template.render(attendees=attendees, c=c)
+            elapsed = (perf_counter() - start) / args.repeat
+        finally:
+            MagModel.__getattr__ = current_getattr
+        print('{:>6}: {:.3f}s per render of {:,} attendees'.format(name, elapsed, args.count))
+
+
+if __name__ == '__main__':
+    main()
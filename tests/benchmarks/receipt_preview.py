@@ -0,0 +1,64 @@
+"""
+Compares the latency of previewing receipt changes with ReceiptManager.auto_update_receipt,
+as the prereg and admin forms do on every change, for an attendee and for a group with many
+badges. "before" copies the model through to_dict() for its preview, as auto_update_receipt
+used to; "after" uses the column-only ReceiptManager.preview_model it uses now.
+
+Promo code changes need a database to look codes up, so they aren't included here.
+"""
+
+import argparse
+from time import perf_counter
+
+from uber.config import c
+from uber.models import Attendee, Group, ModelReceipt
+from uber.payments import ReceiptManager
+
+
+def synthetic_attendee():
+    return Attendee(first_name='Preview', last_name='Attendee', badge_type=c.ATTENDEE_BADGE,
+                    paid=c.HAS_PAID, extra_donation=5, amount_extra=0)
+
+
+def synthetic_group(badges):
+    group = Group(name='Preview Group', tables=1, auto_recalc=True)
+    group.attendees = [Attendee(first_name='' if i else 'Leader', paid=c.PAID_BY_GROUP) for i in range(badges)]
+    return group
+
+
+def time_previews(model, params, repeat):
+    receipt = ModelReceipt(owner_id=model.id, owner_model=model.__class__.__name__)
+    ReceiptManager.auto_update_receipt(model, receipt, dict(params), who='non-admin')
+    start = perf_counter()
+    for _ in range(repeat):
+        ReceiptManager.auto_update_receipt(model, receipt, dict(params), who='non-admin')
+    return (perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--badges', type=int, default=200, help='number of badges in the synthetic group')
+    parser.add_argument('--repeat', type=int, default=200, help='number of previews to time for each model')
+    args = parser.parse_args()
+
+    attendee = synthetic_attendee()
+    attendee_params = {'extra_donation': '20', 'amount_extra': '0', 'badge_type': str(c.ATTENDEE_BADGE)}
+    group = synthetic_group(args.badges)
+    group_params = {'tables': '2', 'badges': str(args.badges + 10), 'auto_recalc': '1'}
+
+    current_preview_model = ReceiptManager.preview_model
+    legacy_preview_model = staticmethod(lambda model: model.__class__(**model.to_dict()))
+
+    for name, preview_model in [('before', legacy_preview_model), ('after', current_preview_model)]:
+        ReceiptManager.preview_model = preview_model
+        try:
+            attendee_elapsed = time_previews(attendee, attendee_params, args.repeat)
+            group_elapsed = time_previews(group, group_params, args.repeat)
+        finally:
+            ReceiptManager.preview_model = staticmethod(current_preview_model)
+        print('{:>6}: {:.2f}ms per attendee preview, {:.2f}ms per preview of a {:,} badge group'.format(
+            name, attendee_elapsed * 1000, group_elapsed * 1000, args.badges))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Compares building per-day dietary headcounts by walking every day of every
+attendee's stay against the difference-array rollup that the statistics
+page uses, on synthetic arrival/departure data.
+"""
+
+import argparse
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+from time import perf_counter
+
+from uber.site_sections.statistics import _daily_headcounts
+
+
+LABELS = ['Vegan', 'Vegetarian', 'Gluten-free', 'Halal', 'Kosher', 'Nut allergy']
+
+
+def synthetic_stays(count, days):
+    first_day = date(2026, 6, 1)
+    stays = []
+    for _ in range(count):
+        arrival = first_day + timedelta(days=random.randrange(days))
+        departure = arrival + timedelta(days=random.randint(1, days))
+        stays.append((arrival, departure, random.sample(LABELS, random.randint(0, 2))))
+    return stays
+
+
+def rollup_per_day(stays):
+    day_counts = defaultdict(lambda: defaultdict(int))
+    for arrival, departure, restrictions in stays:
+        day = arrival
+        while day < departure:
+            day_counts[day]['total_present'] += 1
+            for label in LABELS:
+                if label in restrictions:
+                    day_counts[day][label] += 1
+            day += timedelta(days=1)
+    return day_counts
+
+
+def rollup_difference_array(stays):
+    first_day = min(arrival for arrival, _, _ in stays)
+    num_days = (max(departure for _, departure, _ in stays) - first_day).days + 1
+    grouped = defaultdict(lambda: defaultdict(int))
+    for arrival, departure, restrictions in stays:
+        grouped['total_present'][arrival, departure] += 1
+        for label in restrictions:
+            grouped[label][arrival, departure] += 1
+    return {label: _daily_headcounts(first_day, num_days, [(a, d, n) for (a, d), n in counts.items()])
+            for label, counts in grouped.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=60000, help='number of synthetic attendees')
+    parser.add_argument('--days', type=int, default=10, help='number of days attendees may arrive over')
+    args = parser.parse_args()
+
+    random.seed(0)
+    stays = synthetic_stays(args.count, args.days)
+    for name, rollup in [('before', rollup_per_day), ('after', rollup_difference_array)]:
+        start = perf_counter()
+        rollup(stays)
+        print('{:>6}: {:.3f}s for {:,} attendees over {} days'.format(
+            name, perf_counter() - start, args.count, args.days))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ from sqlalchemy import event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
+import uber
 from uber.config import c
 from uber.models import Attendee, Department, DeptMembership, DeptRole, Job, PromoCode, Session, WatchList, \
     initialize_db, register_session_listeners
@@ -94,6 +95,23 @@ def patch_send_email_delay(request, monkeypatch):
     monkeypatch.setattr(email_tasks.send_email, 'delay', email_tasks.send_email)
 
 
+@pytest.fixture(autouse=True)
+def patch_record_tracking_delay(request, monkeypatch):
+    from uber.tasks import tracking as tracking_tasks
+    monkeypatch.setattr(tracking_tasks.record_tracking, 'delay', tracking_tasks.record_tracking)
+
+
+@pytest.fixture(autouse=True)
+def no_badge_count_cache(monkeypatch):
+    # The database is reset between tests behind the shared Redis cache's back
+    monkeypatch.setattr(c, 'BADGE_COUNT_CACHE_SECONDS', 0)
+
+
+@pytest.fixture(autouse=True)
+def clear_option_cache(monkeypatch):
+    monkeypatch.setattr(uber.config, '_option_cache', {})
+
+
 @pytest.fixture(scope='session', autouse=True)
 def init_db(request):
     if os.path.exists(TEST_DB_FILE):
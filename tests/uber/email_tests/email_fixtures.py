@@ -11,7 +11,7 @@ import pytest
 from pockets import listify
 
 from uber import decorators, utils
-from uber.amazon_ses import AmazonSES
+from uber.amazon_ses import AmazonSES, TokenBucket
 from uber.automated_emails import AutomatedEmailFixture
 from uber.config import c
 from uber.models import Attendee, AutomatedEmail, Session
@@ -52,11 +52,31 @@ ACTIVE_WHEN_LABELS = [
 ]
 
 
+class FakeRedisStore(object):
+    """
+    Just enough of a Redis client for the EmailRecorder journal.
+    """
+    def __init__(self):
+        self.hashes = {}
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+
 @pytest.fixture(autouse=True)
 def mock_send_email(monkeypatch):
+    monkeypatch.setattr(c, 'REDIS_STORE', FakeRedisStore())
     monkeypatch.setattr(c, 'DEV_BOX', False)
     monkeypatch.setattr(c, 'SEND_EMAILS', True)
     monkeypatch.setattr(AmazonSES, 'sendEmail', Mock(return_value=None))
+    monkeypatch.setattr(TokenBucket, 'acquire', Mock(return_value=None))
     return AmazonSES.sendEmail
 
 
@@ -6,6 +6,7 @@ import pytest
 
 from uber.config import c
 from uber.models import Attendee, AutomatedEmail, Email, Group, Session
+from uber.models.email import compile_template
 
 from tests.uber.email_tests.email_fixtures import ACTIVE_WHEN, ACTIVE_WHEN_LABELS, NOW, TOMORROW, YESTERDAY
 from tests.uber.email_tests.email_fixtures import *  # noqa: F401,F403
@@ -185,6 +186,16 @@ class TestAutomatedEmail(object):
             assert email.render_body(Attendee(first_name='A', last_name='Z')) == 'A Z\nCoolCon9000\nEXTRA DATA'
             assert email.render_subject(Attendee(first_name='A', last_name='Z')) == 'CoolCon9000 2016 Jan 2016 A Z'
 
+    def test_render_reuses_compiled_templates(self, automated_email_fixture):
+        with Session() as session:
+            email = session.query(AutomatedEmail).one()
+            compile_template.cache_clear()
+            for first_name in ['A', 'B', 'C']:
+                rendered = email.render_email(Attendee(first_name=first_name, last_name='Z', email='az@example.com'))
+                assert rendered['body'] == '{} Z\nCoolCon9000\nEXTRA DATA'.format(first_name)
+            assert compile_template.cache_info().misses == 2
+            assert compile_template.cache_info().hits == 4
+
     def test_would_send_if_approved(self, automated_email_fixture):
         with Session() as session:
             email = session.query(AutomatedEmail).one()
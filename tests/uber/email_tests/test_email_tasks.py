@@ -2,11 +2,17 @@
 Tests for uber.tasks.email scheduled tasks.
 """
 
+from unittest.mock import Mock
+
 import pytest
 
+from uber.amazon_ses import FakeAmazonSES
+from uber.automated_emails import AutomatedEmailFixture
 from uber.config import c, Config
-from uber.models import AutomatedEmail, Session
-from uber.tasks.email import notify_admins_of_pending_emails, send_automated_emails
+from uber.models import Attendee, AutomatedEmail, Email, Session
+from uber.tasks import email as email_tasks
+from uber.tasks.email import EmailRecorder, notify_admins_of_pending_emails, send_automated_emails, \
+    send_emails_in_batch
 
 from tests.uber.email_tests.email_fixtures import *  # noqa: F401,F403
 
@@ -137,3 +143,137 @@ class TestSendAutomatedEmails(object):
                             ('Attendee', '00000000-0000-0000-0000-000000000004')]
                     else:
                         assert len(automated_email.emails) == 0
+
+    @pytest.mark.usefixtures('create_test_attendees', 'automated_email_fixtures', 'fixed_localized_now')
+    def test_model_query_runs_once_per_model(self, monkeypatch, mock_send_email):
+        query_func = Mock(side_effect=AutomatedEmailFixture.queries[Attendee])
+        monkeypatch.setitem(AutomatedEmailFixture.queries, Attendee, query_func)
+        monkeypatch.setattr(c, 'AUTOMATED_EMAIL_BATCH_SIZE', 2)
+
+        with Session() as session:
+            for automated_email in session.query(AutomatedEmail):
+                automated_email.approved = True
+
+        assert send_automated_emails() == {}
+        assert query_func.call_count == 1
+        assert mock_send_email.call_count == 20
+
+    @pytest.mark.usefixtures(
+        'create_test_attendees', 'clear_automated_email_fixtures', 'render_empty_attendee_template')
+    def test_query_fixture_only_sends_to_unsent_matches(self, mock_send_email):
+        AutomatedEmailFixture(
+            Attendee,
+            'Odd attendees',
+            'attendee.txt',
+            filter=lambda a: True,
+            query=Attendee.first_name.in_(['1', '3']),
+            ident='attendee_txt_query',
+            sender='test@example.com',
+            needs_approval=False)
+        AutomatedEmail.reconcile_fixtures()
+
+        assert send_automated_emails() == {}
+        assert mock_send_email.call_count == 2
+
+        assert send_automated_emails() == {}
+        assert mock_send_email.call_count == 2
+
+        with Session() as session:
+            automated_email = session.query(AutomatedEmail).filter_by(ident='attendee_txt_query').one()
+            assert sorted(e.fk_id for e in automated_email.emails) == [
+                '00000000-0000-0000-0000-000000000001',
+                '00000000-0000-0000-0000-000000000003']
+
+
+class TestSendEmailsInBatch(object):
+    def _emails(self, count):
+        return [{
+            'sender': 'test@example.com',
+            'to': '{}@example.com'.format(i),
+            'subject': 'Batch test',
+            'body': 'Body {}'.format(i),
+            'model': {'id': '00000000-0000-0000-0000-00000000000{}'.format(i), '_model': 'Attendee'},
+            'ident': 'batch_test',
+        } for i in range(count)]
+
+    def test_sends_and_records_all(self, monkeypatch):
+        fake_ses = FakeAmazonSES()
+        monkeypatch.setattr(email_tasks, 'email_sender', fake_ses)
+
+        with Session() as session, EmailRecorder(session) as recorder:
+            assert send_emails_in_batch(self._emails(5), recorder) == 5
+            recorder.flush()
+            assert sorted(e['toAddresses'][0] for e in fake_ses.sent) == [
+                '{}@example.com'.format(i) for i in range(5)]
+            assert session.query(Email).filter_by(ident='batch_test').count() == 5
+
+    def test_failed_sends_are_not_recorded(self, monkeypatch):
+        monkeypatch.setattr(email_tasks, 'email_sender', FakeAmazonSES(error='Throttling'))
+
+        with Session() as session, EmailRecorder(session) as recorder:
+            assert send_emails_in_batch(self._emails(3), recorder) == 0
+            recorder.flush()
+            assert session.query(Email).filter_by(ident='batch_test').count() == 0
+
+    @pytest.mark.parametrize('error,expected', [(None, 3), ('Throttling', 0)])
+    def test_sent_counts_only_delivered(self, monkeypatch, error, expected):
+        monkeypatch.setattr(email_tasks, 'email_sender', FakeAmazonSES(error=error))
+
+        with Session() as session, EmailRecorder(session) as recorder:
+            automated_email = AutomatedEmail(ident='batch_test', model='Attendee', sender='test@example.com',
+                                             subject='Batch test', body='Body')
+            session.add(automated_email)
+            session.commit()
+
+            emails = [dict(email, automated_email={'id': automated_email.id}) for email in self._emails(3)]
+            send_emails_in_batch(emails, recorder)
+            assert recorder.sent_counts[automated_email.id] == expected
+
+
+class TestEmailRecorder(object):
+    def _email(self, i):
+        return Email(sender='test@example.com', to='{}@example.com'.format(i), subject='Recorder test',
+                     body='Body', model='Attendee', ident='recorder_test')
+
+    def _count(self, session):
+        return session.query(Email).filter_by(ident='recorder_test').count()
+
+    def test_flushes_every_flush_size_rows(self):
+        with Session() as session:
+            recorder = EmailRecorder(session, flush_size=3, flush_seconds=3600)
+            for i in range(4):
+                recorder.add(self._email(i))
+            assert self._count(session) == 3
+            assert len(c.REDIS_STORE.hgetall(EmailRecorder.journal_key)) == 1
+
+            recorder.flush()
+            assert self._count(session) == 4
+            assert not c.REDIS_STORE.hgetall(EmailRecorder.journal_key)
+
+    def test_flushes_on_exit(self):
+        with Session() as session:
+            with EmailRecorder(session, flush_size=100) as recorder:
+                recorder.add(self._email(0))
+                assert self._count(session) == 0
+            assert self._count(session) == 1
+
+    def test_recovers_unflushed_rows(self):
+        with Session() as session:
+            crashed = EmailRecorder(session, flush_size=100)
+            crashed.add(self._email(0))
+            crashed.add(self._email(1))
+            assert self._count(session) == 0
+
+        with Session() as session:
+            with EmailRecorder(session):
+                assert self._count(session) == 2
+            assert not c.REDIS_STORE.hgetall(EmailRecorder.journal_key)
+
+    def test_recovery_skips_rows_already_inserted(self):
+        with Session() as session:
+            recorder = EmailRecorder(session, flush_size=100)
+            recorder.add(self._email(0))
+            session.bulk_insert(list(recorder.pending))
+
+            EmailRecorder(session).recover()
+            assert self._count(session) == 1
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import pytest
@@ -5,7 +6,7 @@ from pytz import UTC
 
 from uber.badge_funcs import needs_badge_num, reset_badge_if_unchanged
 from uber.config import c
-from uber.models import Attendee, Session
+from uber.models import Attendee, Session, Tracking
 from uber.decorators import presave_adjustment
 from uber.utils import check
 
@@ -264,6 +265,51 @@ class TestAutoBadgeNum:
         assert 3001 == session.auto_badge_num(c.ATTENDEE_BADGE)
 
 
+class TestNextUnusedBadgeNum:
+    def test_unused_start(self, session):
+        assert 3001 == session.next_unused_badge_num(3001)
+
+    def test_skips_to_end_of_run(self, session):
+        assert 6 == session.next_unused_badge_num(1)
+        assert 6 == session.next_unused_badge_num(3)
+
+    def test_finds_first_gap_before_high_badge(self, session):
+        session.supporter_five.badge_type, session.supporter_five.badge_num = c.STAFF_BADGE, 12
+        session.supporter_four.badge_type, session.supporter_four.badge_num = c.STAFF_BADGE, 6
+        session.commit()
+        assert 7 == session.next_unused_badge_num(6)
+        assert 13 == session.next_unused_badge_num(12)
+
+
+class TestConcurrentBadgeAssignment:
+    def _assign_badge(self, i):
+        with Session() as session:
+            attendee = Attendee(first_name='Concurrent', last_name=str(i), paid=c.HAS_PAID,
+                                badge_type=c.ATTENDEE_BADGE)
+            attendee.badge_num = session.get_next_badge_num(c.ATTENDEE_BADGE)
+            session.add(attendee)
+            session.commit()
+            return attendee.badge_num
+
+    def test_parallel_assignments_never_collide(self, session):
+        count = 2000
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            assigned = list(executor.map(self._assign_badge, range(count)))
+
+        assert len(set(assigned)) == count
+        with Session() as new_session:
+            saved = [num for (num,) in new_session.query(Attendee.badge_num).filter(
+                Attendee.last_name.in_([str(i) for i in range(count)]))]
+            assert sorted(saved) == sorted(assigned)
+            assert len(set(saved)) == count
+
+    def test_lock_released_on_rollback(self, session):
+        session.get_next_badge_num(c.ATTENDEE_BADGE)
+        session.rollback()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(self._assign_badge, 0).result(timeout=30)
+
+
 class TestShiftBadges:
     @pytest.fixture(autouse=True)
     def before_print_badges_deadline(self, before_printed_badge_deadline):
@@ -312,6 +358,20 @@ class TestShiftBadges:
         session.shift_badges(c.STAFF_BADGE, 5, up=True)
         assert [1, 2, 3, 4, 6] == self.staff_badges(session)
 
+    def test_shift_tracked_once(self, session):
+        session.shift_badges(c.STAFF_BADGE, 2, up=True, attendee=session.staff_one)
+        session.commit()
+        entries = session.query(Tracking).filter_by(action=c.AUTO_BADGE_SHIFT).all()
+        assert len(entries) == 1
+        assert entries[0].fk_id == session.staff_one.id
+        assert "badge_num='2 - {}'".format(c.BADGE_RANGES[c.STAFF_BADGE][1]) in entries[0].data
+
+    def test_untouched_badges_stay_loaded(self, session):
+        session.shift_badges(c.STAFF_BADGE, 3, up=True)
+        assert 'badge_num' in session.staff_one.__dict__
+        assert 'badge_num' not in session.staff_four.__dict__
+        assert session.staff_four.badge_num == 5
+
 
 class TestBadgeTypeChange:
     def test_end_to_next(self, session):
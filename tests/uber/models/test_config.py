@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
+from uuid import uuid4
 
 import pytest
 from pytz import UTC
 
 import uber
 from uber.config import c
-from uber.models import Attendee, Group, Session
+from uber.models import AccessGroup, Attendee, Department, Group, Session
 from uber.utils import localized_now, request_cached_context
 
 
@@ -116,6 +117,103 @@ class TestPriceLimits:
     # todo: Test badges that are paid by group
 
 
+class FakeRedisStore:
+    def __init__(self):
+        self.hashes = {}
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = str(value)
+
+    def ttl(self, key):
+        return -1
+
+    def expire(self, key, seconds):
+        pass
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    def hincrby(self, key, field, amount=1):
+        hash = self.hashes.setdefault(key, {})
+        hash[field] = str(int(hash.get(field, 0)) + amount)
+
+    def pipeline(self):
+        return FakeRedisPipeline(self)
+
+
+class FakeRedisPipeline:
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def execute(self):
+        pass
+
+
+class TestBadgeCountCache:
+    @pytest.fixture(autouse=True)
+    def redis_store(request, monkeypatch):
+        monkeypatch.setattr(c, 'REDIS_STORE', FakeRedisStore())
+        monkeypatch.setattr(c, 'BADGE_COUNT_CACHE_SECONDS', 30)
+        return c.REDIS_STORE
+
+    def test_count_is_cached(self, redis_store):
+        with request_cached_context():
+            assert c.BADGES_SOLD == 0
+        redis_store.hset(c.BADGE_COUNTS_KEY, 'badges_sold', 7)
+        with request_cached_context():
+            assert c.BADGES_SOLD == 7
+
+    def test_commit_invalidates_counts(self):
+        with request_cached_context():
+            assert c.BADGES_SOLD == 0
+            assert c.get_badge_count_by_type(c.ATTENDEE_BADGE) == 0
+
+        with Session() as session:
+            session.add(Attendee(paid=c.HAS_PAID, badge_status=c.COMPLETED_STATUS))
+
+        with request_cached_context():
+            assert c.BADGES_SOLD == 1
+            assert c.get_badge_count_by_type(c.ATTENDEE_BADGE) == 1
+
+    def test_unrelated_change_keeps_counts(self, redis_store):
+        with Session() as session:
+            attendee = Attendee(paid=c.HAS_PAID, badge_status=c.COMPLETED_STATUS)
+            session.add(attendee)
+            session.commit()
+
+            with request_cached_context():
+                assert c.BADGES_SOLD == 1
+
+            attendee.first_name = 'Renamed'
+            session.commit()
+            assert redis_store.hget(c.BADGE_COUNTS_KEY, 'badges_sold') == '1'
+
+    def test_rollback_keeps_counts(self, redis_store):
+        with request_cached_context():
+            assert c.BADGES_SOLD == 0
+
+        session = Session().session
+        session.add(Attendee(paid=c.HAS_PAID, badge_status=c.COMPLETED_STATUS))
+        session.flush()
+        session.rollback()
+        assert redis_store.hget(c.BADGE_COUNTS_KEY, 'badges_sold') == '0'
+
+
 class TestBadgePriceEstimate:
     @pytest.fixture(autouse=True)
     def add_price_limits(request, monkeypatch):
@@ -294,3 +392,41 @@ class TestMiscConfig:
         monkeypatch.setattr(c, 'REFUND_CUTOFF', cutoff)
         monkeypatch.setattr(c, 'REFUND_START', start)
         assert c.SELF_SERVICE_REFUNDS_OPEN == expected
+
+
+class TestOptionCache:
+    @pytest.fixture(autouse=True)
+    def redis_store(request, monkeypatch):
+        monkeypatch.setattr(c, 'REDIS_STORE', FakeRedisStore())
+        return c.REDIS_STORE
+
+    def test_options_cached_until_table_changes(self):
+        with Session() as session:
+            session.add(Department(name='Before', description='Before'))
+
+        with request_cached_context():
+            assert [name for id, name in c.DEPARTMENT_OPTS] == ['Before']
+
+        # A Core insert skips the ORM listeners, so the cached options are still served
+        with Session() as session:
+            session.execute(Department.__table__.insert().values(id=str(uuid4()), name='Unseen', description=''))
+        with request_cached_context():
+            assert [name for id, name in c.DEPARTMENT_OPTS] == ['Before']
+
+        with Session() as session:
+            session.add(Department(name='After', description='After'))
+        with request_cached_context():
+            assert [name for id, name in c.DEPARTMENT_OPTS] == ['After', 'Before', 'Unseen']
+
+    def test_other_tables_keep_options(self, redis_store):
+        with request_cached_context():
+            assert c.ACCESS_GROUP_OPTS == []
+
+        with Session() as session:
+            session.add(Department(name='Unrelated', description='Unrelated'))
+        assert redis_store.hmget(c.OPTION_VERSIONS_KEY, ['access_group']) == [None]
+
+        with Session() as session:
+            session.add(AccessGroup(name='Admins'))
+        with request_cached_context():
+            assert [name for id, name in c.ACCESS_GROUP_OPTS] == ['Admins']
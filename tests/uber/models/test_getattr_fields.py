@@ -32,3 +32,22 @@ def test_multi_checks():
     assert not AdminAccount().PEOPLE
     assert AdminAccount(access='{},{}'.format(c.PEOPLE, c.STUFF)).PEOPLE
     assert not AdminAccount(access='{},{}'.format(c.PEOPLE, c.STUFF)).ACCOUNTS
+
+
+def test_is_model():
+    assert Attendee().is_attendee
+    assert not Attendee().is_group
+
+
+def test_dispatch_uses_current_values():
+    attendee = Attendee(paid=c.HAS_PAID)
+    assert 'yes' == attendee.paid_label
+    attendee.paid = None
+    assert '' == attendee.paid_label
+    assert 'yes' == Attendee(paid=c.HAS_PAID).paid_label
+
+
+def test_unresolved_names_keep_raising():
+    for _ in range(2):
+        pytest.raises(AttributeError, lambda: Attendee().not_a_real_attribute)
+        pytest.raises(AttributeError, lambda: Attendee().default_not_a_real_cost)
@@ -1,9 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from uuid import uuid4
 
 import pytest
 
 from uber.config import c
-from uber.models import Attendee, DeptMembership, Job, Session
+from uber.models import Attendee, Department, DeptMembership, Job, JobSignupFeed, Session, Shift
+from uber.utils import localized_now, ShiftIntervals
 
 
 def test_hours():
@@ -42,6 +45,118 @@ def session(request):
     return session
 
 
+def _job(start_hour, hours, department=None, extra15=False):
+    department = department or Department(id=str(uuid4()), name='Dept', max_consecutive_minutes=0)
+    return Job(start_time=c.EPOCH + timedelta(hours=start_hour), duration=hours * 60, extra15=extra15,
+               department=department, department_id=department.id)
+
+
+class TestJobAvailability:
+    def test_matches_available_volunteers(self, session):
+        availability = session.job_availability(session.dept_arcade)
+        for job in [session.job_one, session.job_two, session.job_three]:
+            assert availability[job.id] == job.available_volunteers
+
+    def test_required_roles(self, session):
+        assert session.job_availability(session.dept_console)[session.job_six.id] == [session.staff_four]
+
+    def test_excludes_overlapping_shifts(self, session):
+        assert not session.assign(session.staff_one.id, session.job_one.id)
+        availability = session.job_availability(session.dept_arcade)
+        assert session.staff_one not in availability[session.job_one.id]
+        assert session.staff_one in availability[session.job_three.id]
+
+    def test_only_requested_jobs(self, session):
+        assert list(session.job_availability(session.dept_arcade, jobs=[session.job_two])) == [session.job_two.id]
+
+
+class TestJobSignupFeed:
+    @pytest.fixture(autouse=True)
+    def empty_feed(self, monkeypatch):
+        monkeypatch.setattr(JobSignupFeed, '_events', {})
+
+    def test_events_are_cached(self, session):
+        event = JobSignupFeed.cached_event(session.job_one)
+        assert event['extendedProps']['department_name'] == 'Arcade'
+        assert JobSignupFeed.cached_event(session.job_one) is event
+
+    def test_descriptions_are_linkified(self, session):
+        session.job_one.description = 'See example.com for details'
+        session.commit()
+        desc = JobSignupFeed.cached_event(session.job_one)['extendedProps']['desc']
+        assert '<a href="https://example.com" target="_blank">example.com</a>' in desc
+
+    def test_job_writes_invalidate(self, session):
+        JobSignupFeed.cached_event(session.job_one)
+        session.job_one.name = 'Renamed'
+        session.commit()
+        assert JobSignupFeed.cached_event(session.job_one)['title'] == 'Renamed'
+
+    def test_department_writes_invalidate(self, session):
+        JobSignupFeed.cached_event(session.job_one)
+        session.dept_arcade.name = 'Arcade Games'
+        session.commit()
+        assert JobSignupFeed.cached_event(session.job_one)['extendedProps']['department_name'] == 'Arcade Games'
+
+    def test_writes_from_elsewhere_invalidate(self, session):
+        JobSignupFeed.cached_event(session.job_one)
+        session.query(Job).filter_by(id=session.job_one.id).update(
+            {'name': 'Renamed', 'last_updated': localized_now() + timedelta(minutes=1)}, synchronize_session=False)
+        session.commit()
+        assert JobSignupFeed.cached_event(session.job_one)['title'] == 'Renamed'
+
+
+class TestShiftIntervals:
+    def test_overlaps(self):
+        intervals = ShiftIntervals([_job(2, 2), _job(6, 1)])
+        assert intervals.overlaps(c.EPOCH + timedelta(hours=3), c.EPOCH + timedelta(hours=5))
+        assert intervals.overlaps(c.EPOCH + timedelta(hours=5), c.EPOCH + timedelta(hours=7))
+        assert not intervals.overlaps(c.EPOCH, c.EPOCH + timedelta(hours=2))
+        assert not intervals.overlaps(c.EPOCH + timedelta(hours=4), c.EPOCH + timedelta(hours=6))
+        assert not ShiftIntervals([]).overlaps(c.EPOCH, c.EPOCH + timedelta(hours=1))
+
+    def test_adjacent_jobs(self):
+        first, second = _job(2, 2), _job(6, 1)
+        intervals = ShiftIntervals([second, first])
+        assert intervals.jobs_ending_at(c.EPOCH + timedelta(hours=4)) == [first]
+        assert intervals.jobs_starting_at(c.EPOCH + timedelta(hours=6)) == [second]
+        assert intervals.jobs_ending_at(c.EPOCH + timedelta(hours=6)) == []
+
+    def test_consecutive_minutes(self):
+        jobs = [_job(0, 1), _job(1, 2), _job(5, 1)]
+        intervals = ShiftIntervals(jobs)
+        assert intervals.worked_before(c.EPOCH + timedelta(hours=3)) == (180, jobs[:2])
+        assert intervals.worked_after(c.EPOCH + timedelta(hours=5)) == (60, jobs[2:])
+        assert intervals.worked_before(c.EPOCH + timedelta(hours=5)) == (0, [])
+
+
+class TestOverlapAndWorkingLimit:
+    @pytest.fixture
+    def attendee_jobs(self, monkeypatch):
+        jobs = []
+        monkeypatch.setattr(Attendee, 'shift_intervals', property(lambda self: ShiftIntervals(jobs)))
+        return jobs
+
+    def test_no_overlap(self, attendee_jobs):
+        attendee_jobs.append(_job(2, 2))
+        assert not _job(3, 1).no_overlap(Attendee())
+        assert _job(4, 1).no_overlap(Attendee())
+
+    def test_extra15_needs_break_between_departments(self, attendee_jobs):
+        attendee_jobs.append(_job(2, 2, extra15=True))
+        assert not _job(4, 1).no_overlap(Attendee())
+        assert _job(4, 1, department=attendee_jobs[0].department).no_overlap(Attendee())
+        assert not _job(1, 1, extra15=True).no_overlap(Attendee())
+        assert _job(1, 1).no_overlap(Attendee())
+
+    def test_working_limit(self, attendee_jobs):
+        limited = Department(id=str(uuid4()), name='Limited', max_consecutive_minutes=180)
+        attendee_jobs.extend([_job(0, 1, department=limited), _job(1, 1)])
+        assert _job(2, 1).working_limit_ok(Attendee())
+        assert not _job(2, 2).working_limit_ok(Attendee())
+        assert _job(4, 2).working_limit_ok(Attendee())
+
+
 class TestAssign:
     @pytest.fixture(autouse=True)
     def default_assignment(self, session):
@@ -93,6 +208,32 @@ class TestAssign:
         assert not session.assign(session.staff_one.id, session.job_three.id)
 
 
+class TestConcurrentSignup:
+    def _assign(self, attendee_id, job_id):
+        with Session() as session:
+            return session.assign(attendee_id, job_id)
+
+    def _signup_all(self, pairs):
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            return list(executor.map(lambda pair: self._assign(*pair), pairs))
+
+    def test_single_slot_has_one_winner(self, session):
+        volunteers = [Attendee(first_name='Eager', last_name=str(i), paid=c.HAS_PAID, staffing=True)
+                      for i in range(200)]
+        session.add_all(volunteers)
+        session.commit()
+
+        results = self._signup_all([(volunteer.id, session.job_one.id) for volunteer in volunteers])
+        assert results.count(None) == 1
+        assert all(result == 'All slots for this job have already been filled' for result in results if result)
+        assert session.query(Shift).filter_by(job_id=session.job_one.id).count() == 1
+
+    def test_volunteer_is_not_double_booked(self, session):
+        results = self._signup_all([(session.staff_four.id, session.job_four.id)] * 50)
+        assert results.count(None) == 1
+        assert session.query(Shift).filter_by(job_id=session.job_four.id).count() == 1
+
+
 class TestAvailableStaffers:
     @pytest.fixture(autouse=True)
     def extra_setup(self, session, monkeypatch):
@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+from pytz import UTC
+
+from uber.config import c
+from uber.models import Attendee, Group, ModelReceipt, ReceiptItem, ReceiptTransaction, Session
+from uber.site_sections import reg_reports
+from uber.tasks.registration import recalculate_default_costs
+
+
+def _add_receipt(session, attendee, items=(), txns=(), closed=None):
+    receipt = ModelReceipt(owner_id=attendee.id, owner_model='Attendee', closed=closed)
+    session.add(receipt)
+    for amount, fk_id in items:
+        session.add(ReceiptItem(receipt_id=receipt.id, amount=amount, fk_id=fk_id, desc='Item'))
+    for amount in txns:
+        session.add(ReceiptTransaction(receipt_id=receipt.id, amount=amount, charge_id='ch_test', desc='Txn'))
+    return receipt
+
+
+@pytest.fixture
+def receipt_attendees():
+    with Session() as session:
+        attendees = {name: Attendee(first_name=name, last_name='Receipt', paid=c.HAS_PAID)
+                     for name in ['Settled', 'Discrepancy', 'NoItems', 'NoTxns', 'Closed']}
+        session.add_all(attendees.values())
+        session.commit()
+
+        cost = attendees['Settled'].default_cost_cents
+        _add_receipt(session, attendees['Settled'], items=[(cost, None), (500, attendees['Settled'].id)],
+                     txns=[cost + 1000, -500])
+        _add_receipt(session, attendees['Discrepancy'], items=[(cost - 100, None)], txns=[cost - 100])
+        _add_receipt(session, attendees['NoItems'], txns=[cost])
+        _add_receipt(session, attendees['NoTxns'], items=[(cost, None)])
+        _add_receipt(session, attendees['Closed'], items=[(cost, None)], txns=[cost],
+                     closed=datetime.now(UTC))
+        _add_receipt(session, attendees['NoTxns'], items=[(9999, None)], txns=[9999], closed=datetime.now(UTC))
+        return {name: (attendee.id, cost) for name, attendee in attendees.items()}
+
+
+class TestTotalsSubquery:
+    def _totals(self, session):
+        totals = ModelReceipt.totals_subquery(session, 'Attendee')
+        return {row.owner_id: row[1:] for row in session.query(totals)}
+
+    def test_open_receipts_only(self, receipt_attendees):
+        with Session() as session:
+            totals = self._totals(session)
+            assert receipt_attendees['Closed'][0] not in totals
+            assert len(totals) == 4
+
+    def test_totals(self, receipt_attendees):
+        with Session() as session:
+            totals = self._totals(session)
+            attendee_id, cost = receipt_attendees['Settled']
+            assert totals[attendee_id] == (cost + 500, cost, cost + 1000, 500)
+
+    def test_missing_items_and_txns_are_zero(self, receipt_attendees):
+        with Session() as session:
+            totals = self._totals(session)
+            attendee_id, cost = receipt_attendees['NoItems']
+            assert totals[attendee_id] == (0, 0, cost, 0)
+
+            attendee_id, cost = receipt_attendees['NoTxns']
+            assert totals[attendee_id] == (cost, cost, 0, 0)
+
+
+def test_attendee_receipt_discrepancies(GET, admin_attendee, receipt_attendees):
+    response = reg_reports.Root().attendee_receipt_discrepancies()
+    if isinstance(response, bytes):
+        response = response.decode('utf-8')
+
+    for name, (attendee_id, _) in receipt_attendees.items():
+        assert ('id="{}"'.format(attendee_id) in response) == (name in ['Discrepancy', 'NoItems'])
+
+
+class TestRecalculateDefaultCosts:
+    @pytest.fixture
+    def stale_costs(self):
+        with Session() as session:
+            stale = Attendee(first_name='Stale', paid=c.HAS_PAID)
+            correct = Attendee(first_name='Correct', paid=c.HAS_PAID)
+            stale_group = Group(name='Stale Group')
+            custom_group = Group(name='Custom Group', auto_recalc=False, cost=1234)
+            session.add_all([stale, correct, stale_group, custom_group])
+            session.commit()
+            costs = {stale.id: stale.default_cost, correct.id: correct.default_cost,
+                     stale_group.id: stale_group.cost, custom_group.id: 1234}
+
+            # Write the stale costs directly, since saving the models would recalculate them
+            session.query(Attendee).filter_by(id=stale.id).update({'default_cost': 1}, synchronize_session=False)
+            session.query(Group).filter_by(id=stale_group.id).update({'cost': 1}, synchronize_session=False)
+            return costs
+
+    def test_recalculates_stale_costs(self, stale_costs):
+        assert recalculate_default_costs() == "Recalculated 2 stale default costs."
+
+        with Session() as session:
+            for model, column in [(Attendee, 'default_cost'), (Group, 'cost')]:
+                for instance in session.query(model).filter(model.id.in_(stale_costs)):
+                    assert getattr(instance, column) == stale_costs[instance.id]
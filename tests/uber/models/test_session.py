@@ -3,7 +3,7 @@ from datetime import date, datetime, timedelta
 import pytest
 import pytz
 
-from uber.models import Attendee, Department, Group, Session
+from uber.models import Attendee, AttendeeAccount, Department, Group, Session
 from uber.config import c
 from uber.utils import localized_now
 
@@ -91,3 +91,68 @@ def test_match_to_group(match_to_group_preconditions):
         assert [6, 7, 8, 9] == sorted([a.badge_num for a in group.attendees])
         session.match_to_group(late_comer, group)
         assert [6, 7, 8, 99] == sorted([a.badge_num for a in group.attendees])
+
+
+class TestTextSearch:
+    @pytest.fixture
+    def searchable_attendees(self):
+        with Session() as session:
+            group = Group(name='Moonlit Marauders')
+            session.add(group)
+            session.add(Attendee(first_name='Zelda', last_name='Hyrule', email='zelda@example.com',
+                                 paid=c.HAS_PAID, group=group))
+            session.add(Attendee(first_name='Link', last_name='Kokiri', email='link@example.com',
+                                 paid=c.HAS_PAID, admin_notes='Lost his SWORD'))
+
+    def _search_names(self, session, text):
+        return sorted(a.first_name for a in session.query(Attendee).filter(session.text_search_condition(text)))
+
+    def test_search_text_kept_up_to_date(self, searchable_attendees):
+        with Session() as session:
+            attendee = session.query(Attendee).filter_by(first_name='Link').one()
+            assert 'kokiri' in attendee.search_text.split('\n')
+            assert 'lost his sword' in attendee.search_text.split('\n')
+
+            attendee.last_name = 'Hero'
+            session.commit()
+            assert 'kokiri' not in session.query(Attendee).filter_by(first_name='Link').one().search_text
+
+    def test_matches_attendee_fields(self, searchable_attendees):
+        with Session() as session:
+            assert self._search_names(session, 'KOKI') == ['Link']
+            assert self._search_names(session, 'sword') == ['Link']
+            assert self._search_names(session, 'example.com') == ['Link', 'Zelda']
+
+    def test_matches_group_name(self, searchable_attendees):
+        with Session() as session:
+            assert self._search_names(session, 'marauder') == ['Zelda']
+
+    def test_search_results_page_by_id(self, searchable_attendees):
+        with Session() as session:
+            results, message = session.search('example.com', order='first_name', limit=1)
+            assert not message
+            assert results.count == 2
+            assert len(results.ids) == 1
+            assert [a.first_name for a in results.page(1, per_page=1)] == ['Link']
+
+    def test_two_term_name_search(self, searchable_attendees):
+        with Session() as session:
+            results, message = session.search('Zelda Hyrule')
+            assert results.count == 1
+            assert [a.last_name for a in results.attendees()] == ['Hyrule']
+
+    def test_search_through_joined_tables(self, monkeypatch, searchable_attendees):
+        # search() outer-joins the tables text_search_condition looks things up in, so its subqueries
+        # must not be correlated to the outer query; force the non-sqlite path to check that
+        monkeypatch.setattr(c, 'SQLALCHEMY_URL', 'postgresql://localhost/uber')
+        monkeypatch.setattr(c, 'ATTENDEE_ACCOUNTS_ENABLED', True)
+        with Session() as session:
+            link = session.query(Attendee).filter_by(first_name='Link').one()
+            link.managers.append(AttendeeAccount(email='hero@kokiri.test'))
+
+        with Session() as session:
+            for text, first_names in [('marauder', ['Zelda']), ('kokiri.test', ['Link']),
+                                      ('sword', ['Link']), ('example.com', ['Link', 'Zelda'])]:
+                results, message = session.search(text, order='first_name')
+                assert not message
+                assert [a.first_name for a in results.attendees()] == first_names
@@ -0,0 +1,81 @@
+import pytest
+
+from uber.config import c
+from uber.models import Attendee, Session, Tracking
+
+
+@pytest.fixture
+def session(request):
+    session = Session().session
+    request.addfinalizer(session.close)
+    return session
+
+
+def tracked(session, attendee, action=None):
+    query = session.query(Tracking).filter_by(fk_id=attendee.id)
+    if action is not None:
+        query = query.filter_by(action=action)
+    return query.order_by(Tracking.when).all()
+
+
+def test_rows_inserted_after_commit(session):
+    attendee = Attendee(first_name='Tracked', last_name='Attendee')
+    session.add(attendee)
+    session.flush()
+    assert not tracked(session, attendee)
+
+    session.commit()
+    [created] = tracked(session, attendee, c.CREATED)
+    assert "first_name='Tracked'" in created.data
+    assert created.snapshot
+
+
+def test_snapshot_interval(session, monkeypatch):
+    monkeypatch.setattr(c, 'TRACKING_SNAPSHOT_INTERVAL', 2)
+    attendee = Attendee(first_name='Tracked', last_name='Attendee')
+    session.add(attendee)
+    session.commit()
+
+    for name in ['Renamed', 'Renamed Again']:
+        attendee.first_name = name
+        session.commit()
+
+    rows = tracked(session, attendee)
+    assert "'Tracked' -> 'Renamed'" in rows[-2].data
+    assert [bool(row.snapshot) for row in rows] == [i % 2 == 0 for i in range(len(rows))]
+
+
+def test_requested_snapshot(session, monkeypatch):
+    monkeypatch.setattr(c, 'TRACKING_SNAPSHOT_INTERVAL', 0)
+    attendee = Attendee(first_name='Tracked', last_name='Attendee')
+    session.add(attendee)
+    session.commit()
+
+    Tracking.request_snapshot(attendee)
+    attendee.first_name = 'Renamed'
+    session.commit()
+
+    rows = tracked(session, attendee)
+    assert not rows[0].snapshot
+    assert "'Renamed'" in rows[-1].snapshot
+
+
+def test_delete_always_snapshotted(session, monkeypatch):
+    monkeypatch.setattr(c, 'TRACKING_SNAPSHOT_INTERVAL', 0)
+    attendee = Attendee(first_name='Tracked', last_name='Attendee')
+    session.add(attendee)
+    session.commit()
+
+    session.delete(attendee)
+    session.commit()
+    [deleted] = tracked(session, attendee, c.DELETED)
+    assert "'Tracked'" in deleted.snapshot
+
+
+def test_rollback_discards_rows(session):
+    attendee = Attendee(first_name='Tracked', last_name='Attendee')
+    session.add(attendee)
+    session.flush()
+    session.rollback()
+    session.commit()
+    assert not tracked(session, attendee)
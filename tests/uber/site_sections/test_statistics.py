@@ -3,8 +3,9 @@ from datetime import date
 import pytest
 
 from uber.config import c
-from uber.models import Attendee, Department, FoodRestrictions, Session
+from uber.models import Attendee, DailyRegistrationCount, Department, FoodRestrictions, Group, Session
 from uber.site_sections import statistics
+from uber.utils import localized_now
 
 
 def _make_department(session, name):
@@ -147,3 +148,88 @@ def test_department_headcounts_excludes_invalid_badges():
     assert rows['Broadcast']['total'] == 2
     assert result['totals'][date(2026, 6, 1)] == 1
     assert result['totals'][date(2026, 6, 2)] == 1
+
+
+def test_attendee_counts():
+    with Session() as session:
+        before = statistics._attendee_counts(session)
+
+        group = Group(name='Counted Group')
+        session.add(group)
+        session.add_all([
+            Attendee(first_name='Checked', last_name='In', paid=c.HAS_PAID, badge_type=c.ATTENDEE_BADGE,
+                     checked_in=localized_now(), ribbon=[c.VOLUNTEER_RIBBON], amount_extra=max(c.DONATION_TIERS)),
+            Attendee(first_name='No', last_name='Show', paid=c.HAS_PAID, badge_type=c.ATTENDEE_BADGE),
+            Attendee(first_name='Group', last_name='Member', paid=c.PAID_BY_GROUP, badge_type=c.ATTENDEE_BADGE,
+                     group=group),
+            Attendee(first_name='In', last_name='Valid', paid=c.HAS_PAID, badge_type=c.ATTENDEE_BADGE,
+                     badge_status=c.INVALID_STATUS),
+        ])
+        session.commit()
+
+        after = statistics._attendee_counts(session)
+
+    def delta(key, label):
+        return after[key][label] - before[key][label]
+
+    badge_label = c.BADGES[c.ATTENDEE_BADGE]
+    assert delta('statuses', c.BADGE_STATUS[c.INVALID_STATUS]) == 1
+    assert delta('badges', badge_label) == 3
+    assert delta('paid', c.PAYMENTS[c.HAS_PAID]) == 2
+    assert delta('paid', c.PAYMENTS[c.PAID_BY_GROUP]) == 1
+    assert delta('checked_in', 'yes') == 1
+    assert delta('checked_in', 'no') == 2
+    assert delta('checked_in_by_type', badge_label) == 1
+    assert delta('ribbons', c.RIBBONS[c.VOLUNTEER_RIBBON]) == 1
+    assert delta('groups', 'free') == 1
+    assert delta('noshows', 'paid') == 1
+    assert delta('noshows', 'free') == 1
+    if max(c.DONATION_TIERS) > 0:
+        assert delta('donation_tiers', max(c.DONATION_TIERS)) == 1
+
+
+def test_daily_headcounts():
+    first_day = date(2026, 6, 1)
+    stays = [
+        (date(2026, 6, 1), date(2026, 6, 3), 2),
+        (date(2026, 6, 2), date(2026, 6, 5), 1),
+        (date(2026, 6, 4), date(2026, 6, 4), 5),
+    ]
+    assert statistics._daily_headcounts(first_day, 5, stays) == [2, 3, 1, 1, 0]
+
+
+def test_registration_rollup_refresh():
+    with Session() as session:
+        session.add_all([
+            Attendee(first_name='Early', last_name='Bird', paid=c.HAS_PAID, registered=date(2026, 1, 1)),
+            Attendee(first_name='Not', last_name='Paid', paid=c.NOT_PAID, registered=date(2026, 1, 1)),
+        ])
+        session.commit()
+        DailyRegistrationCount.refresh(session, full=True)
+        assert DailyRegistrationCount.by_day(session)[date(2026, 1, 1)] == 1
+
+        session.add(Attendee(first_name='Late', last_name='Comer', paid=c.HAS_PAID, registered=date(2026, 2, 1)))
+        session.commit()
+        assert DailyRegistrationCount.refresh(session) == 1
+        assert DailyRegistrationCount.refresh(session) == 0
+
+        by_day = DailyRegistrationCount.by_day(session)
+        assert by_day[date(2026, 2, 1)] == 1
+        assert by_day == DailyRegistrationCount.live_counts(session)
+
+
+class TestRoot:
+    def _response(self, page):
+        response = getattr(statistics.Root(), page)()
+        if isinstance(response, bytes):
+            response = response.decode('utf-8')
+        return response.strip()
+
+    def test_pages_mounted(self):
+        root = statistics.Root()
+        for page in ['index', 'badges_sold']:
+            assert callable(getattr(root, page))
+
+    @pytest.mark.parametrize('page', ['index', 'badges_sold'])
+    def test_GET(self, GET, admin_attendee, page):
+        assert self._response(page).startswith('<!DOCTYPE HTML>')
@@ -0,0 +1,36 @@
+from uber.models import Attendee, Group, ModelReceipt
+from uber.payments import ReceiptManager, ReceiptPreview
+
+
+class TestReceiptPreview:
+    def test_preview_model_copies_columns(self):
+        attendee = Attendee(first_name='Preview', last_name='Attendee', extra_donation=10)
+        preview = ReceiptManager.preview_model(attendee)
+        assert preview is not attendee
+        assert (preview.id, preview.first_name, preview.extra_donation) == (attendee.id, 'Preview', 10)
+
+        preview.extra_donation = 20
+        assert attendee.extra_donation == 10
+
+    def test_changes_calculated_once_per_state(self):
+        preview = ReceiptPreview(Attendee(extra_donation=10))
+        preview.set('extra_donation', 25)
+        assert preview.changes('extra_donation') == [('Increase Extra Donation', 1500, 1)]
+        assert preview.changes('extra_donation') == []
+
+        preview.set('extra_donation', 5)
+        assert preview.changes('extra_donation') == [('Decrease Extra Donation', -500, 1)]
+
+    def test_shared_cost_function_not_duplicated(self):
+        preview = ReceiptPreview(Group(cost=100, auto_recalc=False))
+        preview.set('cost', 150)
+        assert preview.changes('cost') == [('Update Custom Fee', 5000, 1)]
+        assert preview.changes('auto_recalc') == []
+
+    def test_auto_update_receipt(self):
+        group = Group(cost=100, auto_recalc=False)
+        receipt = ModelReceipt(owner_id=group.id, owner_model='Group')
+        [item] = ReceiptManager.auto_update_receipt(group, receipt, {'cost': '150', 'auto_recalc': ''},
+                                                    who='non-admin')
+        assert (item.receipt_id, item.desc, item.amount) == (receipt.id, 'Update Custom Fee', 5000)
+        assert group.cost == 100
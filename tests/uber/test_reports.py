@@ -0,0 +1,71 @@
+import csv
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+
+from uber.config import c
+from uber.models import Attendee, Department, Job, Session, Shift
+from uber.reports import OverworkedAttendeesReport, ShiftRunReport
+
+
+@pytest.fixture
+def shift_runs():
+    with Session() as session:
+        strict = Department(name='Strict', max_consecutive_minutes=180)
+        relaxed = Department(name='Relaxed', max_consecutive_minutes=0)
+        busy = Attendee(first_name='Busy', last_name='Bee', display_name='Busy Bee',
+                        staffing=True, paid=c.NEED_NOT_PAY)
+        rested = Attendee(first_name='Well', last_name='Rested', display_name='Well Rested',
+                          staffing=True, paid=c.NEED_NOT_PAY)
+        session.add_all([strict, relaxed, busy, rested])
+
+        def work(attendee, department, start_hour, hours):
+            job = Job(name='Job', department=strict if department == 'strict' else relaxed, slots=2,
+                      start_time=c.EPOCH + timedelta(hours=start_hour), duration=hours * 60)
+            session.add(Shift(job=job, attendee=attendee))
+
+        # Busy works 08:00-12:00 back to back across both departments, then an overlapping pair.
+        work(busy, 'strict', 0, 2)
+        work(busy, 'relaxed', 2, 2)
+        work(busy, 'strict', 5, 1)
+        work(busy, 'relaxed', 5, 1)
+        work(rested, 'strict', 0, 2)
+        work(rested, 'strict', 3, 2)
+
+
+def test_runs_merge_touching_and_overlapping_shifts(shift_runs):
+    with Session() as session:
+        runs = ShiftRunReport().runs(session)
+        lengths = sorted((first_name, minutes) for first_name, minutes in session.query(
+            Attendee.first_name, runs.c.minutes).join(runs, runs.c.attendee_id == Attendee.id))
+        assert lengths == [('Busy', 60), ('Busy', 240), ('Well', 120), ('Well', 120)]
+
+
+def test_overworked_only_lists_exceeded_departments(shift_runs):
+    with Session() as session:
+        rows = list(ShiftRunReport(Attendee.staffing == True).overworked(session))  # noqa: E712
+        assert len(rows) == 1
+        _, display_name, start_time, minutes, departments = rows[0]
+        assert display_name == 'Busy Bee'
+        assert start_time == c.EPOCH
+        assert minutes == 240
+        assert departments == ['Strict']
+
+
+def test_overworked_csv(shift_runs):
+    out = StringIO()
+    with Session() as session:
+        OverworkedAttendeesReport().run(csv.writer(out), session)
+    header, row = list(csv.reader(StringIO(out.getvalue())))
+    assert header[0] == 'Attendee name'
+    assert row[0] == 'Busy Bee' and row[2] == '240' and row[3:] == ['Strict']
+
+
+def test_attendees_over_threshold(shift_runs):
+    with Session() as session:
+        report = ShiftRunReport()
+        busy_id = session.query(Attendee.id).filter_by(first_name='Busy').scalar()
+        assert report.attendees_over_threshold(session, [c.EPOCH], 6 * 60, 5 * 60 - 1) == {busy_id}
+        assert report.attendees_over_threshold(session, [c.EPOCH], 6 * 60, 5 * 60) == set()
+        assert report.attendees_over_threshold(session, [], 6 * 60, 60) == set()
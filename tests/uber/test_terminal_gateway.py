@@ -0,0 +1,201 @@
+import asyncio
+import json
+import time
+
+import aiohttp
+import cherrypy
+import pytest
+from aiohttp.test_utils import TestServer
+from mock import MagicMock, Mock
+
+import uber.spin_rest_utils as spin_rest_utils
+import uber.terminal_gateway as terminal_gateway
+from uber.config import c
+from uber.fake_spin_proxy import FakeSpinProxy
+from uber.models import Session
+from uber.payments import SpinTerminalRequest
+from uber.site_sections import registration
+from uber.terminal_gateway import TerminalGateway
+
+
+STRINGS = {
+    'terminal_id': 'Tpn', 'auth_key': 'Authkey', 'dollar_amount': 'Amount', 'payment_type': 'PaymentType',
+    'ref_id': 'ReferenceId', 'capture_signature': 'CaptureSignature', 'gen_resp': 'GeneralResponse',
+    'det_msg': 'DetailedMessage', 'msg': 'Message', 'res': 'ResultCode', 'res_success': '0', 'sts_code': 'StatusCode',
+    'dollar_amounts': 'Amounts', 'total_amount': 'TotalAmount', 'cdata': 'CardData', 'etype': 'EntryType',
+    'sig': 'Signature', 'auth_code': 'AuthCode', 'edata': 'EMVData', 'app_name': 'ApplicationName',
+    'ext_data': 'ExtendedDataByApplication', 'txn_id': 'TransactionId', 'rcpt': 'Receipts', 'cust': 'Customer',
+    'error_busy': 'Terminal busy', 'error_cancel': 'Canceled',
+    'sale': 'Sale', 'status': 'Status', 'void': 'Void', 'return': 'Return', 'settle': 'Settle',
+}
+
+
+@pytest.fixture
+def spin_secrets(monkeypatch):
+    monkeypatch.setattr(spin_rest_utils, 'strings', STRINGS)
+    monkeypatch.setattr(spin_rest_utils, 'secrets', {
+        'lists': {'call_url_types': ['sale', 'status', 'void', 'return', 'settle']}})
+
+
+def sale_data(ref_id, amount='10.00', terminal_id='T1'):
+    return {'Tpn': terminal_id, 'Authkey': 'key', 'Amount': amount, 'PaymentType': 'Credit', 'ReferenceId': ref_id}
+
+
+def run_against_proxy(proxy, func):
+    async def run():
+        async with TestServer(proxy.app) as server:
+            gateway = TerminalGateway(api_url=str(server.make_url('/')))
+            async with aiohttp.ClientSession() as gateway.http:
+                return await func(gateway)
+    return asyncio.run(run())
+
+
+def test_sale(spin_secrets):
+    response = run_against_proxy(FakeSpinProxy(delay=0), lambda gateway: gateway.post(Mock(), 'sale', sale_data('R1')))
+    assert spin_rest_utils.api_response_successful(response)
+    assert spin_rest_utils.approved_amount(response) == 10
+    assert spin_rest_utils.txn_info_from_response(response)['txn_id']
+
+
+def test_declined_sale(spin_secrets):
+    proxy = FakeSpinProxy(delay=0, decline_amount=10)
+    response = run_against_proxy(proxy, lambda gateway: gateway.post(Mock(), 'sale', sale_data('R1')))
+    assert not spin_rest_utils.api_response_successful(response)
+    assert spin_rest_utils.error_message_from_response(response) == 'Canceled'
+
+
+def test_terminals_run_concurrently(spin_secrets):
+    async def sales(gateway):
+        return await asyncio.gather(
+            gateway.post(Mock(), 'sale', sale_data('R1', terminal_id='T1')),
+            gateway.post(Mock(), 'sale', sale_data('R2', terminal_id='T1')),
+            gateway.post(Mock(), 'sale', sale_data('R3', terminal_id='T2')))
+
+    first, busy, other_terminal = run_against_proxy(FakeSpinProxy(delay=0.2), sales)
+    assert spin_rest_utils.api_response_successful(first)
+    assert spin_rest_utils.error_message_from_response(busy) == 'Terminal busy'
+    assert spin_rest_utils.api_response_successful(other_terminal)
+
+
+def test_status(spin_secrets):
+    async def statuses(gateway):
+        await gateway.post(Mock(), 'sale', sale_data('R1'))
+        return await asyncio.gather(gateway.post(Mock(), 'status', sale_data('R1')),
+                                    gateway.post(Mock(), 'status', sale_data('R2')))
+
+    found, not_found = run_against_proxy(FakeSpinProxy(delay=0), statuses)
+    assert spin_rest_utils.api_response_successful(found)
+    assert spin_rest_utils.error_message_from_response(not_found) == 'Not found'
+
+
+def test_connection_error(spin_secrets):
+    async def sale():
+        gateway = TerminalGateway(api_url='http://127.0.0.1:1/')
+        async with aiohttp.ClientSession() as gateway.http:
+            return await gateway.post(payment_request, 'sale', sale_data('R1'))
+
+    payment_request = Mock(error_message='')
+    assert asyncio.run(sale()) is None
+    assert payment_request.error_message == 'Could not connect to SPIn Proxy'
+
+
+def test_set_terminal_status_publishes(monkeypatch):
+    store = MagicMock()
+    monkeypatch.setattr(c, 'REDIS_STORE', store)
+    SpinTerminalRequest.set_terminal_status('T1', last_error='Oops')
+
+    pipe = store.pipeline.return_value.__enter__.return_value
+    pipe.hset.assert_called_once_with(SpinTerminalRequest.terminal_status_key('T1'), mapping={'last_error': 'Oops'})
+    pipe.publish.assert_called_once_with(SpinTerminalRequest.terminal_status_channel('T1'), 'last_error')
+
+
+def test_sales_for_one_terminal_run_in_order(monkeypatch):
+    events = []
+
+    async def post(payment_request, call_type, data):
+        events.append(('start', payment_request.ref_id))
+        await asyncio.sleep(0.1)
+        events.append(('end', payment_request.ref_id))
+        return {}
+
+    async def sales(gateway):
+        gateway.post = post
+        await asyncio.gather(*[gateway.start_sale({'workstation_num': 1, 'terminal_id': terminal_id, 'ref_id': ref_id})
+                               for ref_id, terminal_id in [('R1', 'T1'), ('R2', 'T1'), ('R3', 'T2')]])
+
+    monkeypatch.setattr(terminal_gateway, 'Session', MagicMock())
+    monkeypatch.setattr(terminal_gateway, 'prepare_terminal_sale',
+                        lambda session, workstation_num, terminal_id, ref_id: Mock(ref_id=ref_id))
+    monkeypatch.setattr(terminal_gateway, 'finish_terminal_sale',
+                        lambda session, payment_request, response: events.append(('finish', payment_request.ref_id)))
+    gateway = TerminalGateway(api_url='http://localhost/')
+    asyncio.run(sales(gateway))
+
+    assert [event for event in events if event[1] != 'R3'] == [
+        ('start', 'R1'), ('end', 'R1'), ('finish', 'R1'), ('start', 'R2'), ('end', 'R2'), ('finish', 'R2')]
+    assert events.index(('start', 'R3')) < events.index(('end', 'R1'))
+    assert not gateway.running
+
+
+class FakeStatusUpdates:
+    def __init__(self):
+        self.message = None
+        self.timeouts = []
+        self.channel = None
+        self.closed = False
+
+    def subscribe(self, channel):
+        self.channel = channel
+
+    def get_message(self, timeout):
+        self.timeouts.append(timeout)
+        if self.message:
+            return self.message
+        time.sleep(timeout)
+
+    def close(self):
+        self.closed = True
+
+
+class StationSession(dict):
+    locked = True
+    loaded = True
+
+    def release_lock(self):
+        self.locked = False
+
+
+class TestWaitForTerminalPayment:
+    @pytest.fixture
+    def status_updates(self, monkeypatch, POST, csrf_token, admin_attendee):
+        updates = FakeStatusUpdates()
+        store = MagicMock()
+        store.pubsub.return_value = updates
+        monkeypatch.setattr(c, 'REDIS_STORE', store)
+        monkeypatch.setattr(cherrypy, 'session', StationSession(cherrypy.session))
+        monkeypatch.setattr(Session.SessionMixin, 'get_assigned_terminal_id', lambda session: ('', 'T1'))
+        return updates
+
+    def _wait(self, csrf_token):
+        return json.loads(registration.Root().wait_for_terminal_payment(csrf_token=csrf_token))
+
+    def test_pending_after_timeout(self, monkeypatch, csrf_token, status_updates):
+        monkeypatch.setattr(c, 'SPIN_TERMINAL_STATUS_WAIT', 0.1)
+        monkeypatch.setattr(registration, 'terminal_payment_result', lambda session, terminal_id: None)
+
+        assert self._wait(csrf_token) == {'pending': True}
+        assert status_updates.timeouts and all(0 < timeout <= 0.1 for timeout in status_updates.timeouts)
+        assert status_updates.channel == SpinTerminalRequest.terminal_status_channel('T1')
+        assert status_updates.closed
+        assert not cherrypy.session.locked and not cherrypy.session.loaded
+
+    def test_returns_published_status(self, monkeypatch, csrf_token, status_updates):
+        results = [None, {'success': True}]
+        monkeypatch.setattr(c, 'SPIN_TERMINAL_STATUS_WAIT', 30)
+        monkeypatch.setattr(registration, 'terminal_payment_result', lambda session, terminal_id: results.pop(0))
+        status_updates.message = {'type': 'message', 'data': 'last_response'}
+
+        start = time.monotonic()
+        assert self._wait(csrf_token) == {'success': True}
+        assert time.monotonic() - start < 5
+        assert len(status_updates.timeouts) == 1
@@ -18,6 +18,8 @@ elif [ "$1" = 'celery-beat' ]; then
     ./env/bin/celery -A uber.tasks beat --loglevel=DEBUG --pidfile=
 elif [ "$1" = 'celery-worker' ]; then
     ./env/bin/celery -A uber.tasks worker --loglevel=DEBUG
+elif [ "$1" = 'terminal-gateway' ]; then
+    ./env/bin/python /app/sep.py terminal_gateway
 elif [ "$1" = 'sep' ]; then
     shift
     ./env/bin/python /app/sep.py "$@"
@@ -6,9 +6,12 @@ import logging
 import base64
 import boto3
 import os
+import redis
+import time
 
 from botocore.exceptions import ClientError
 from datetime import datetime
+from pockets import cached_property
 from pockets.autolog import log
 from xml.etree.ElementTree import XML
 
@@ -22,6 +25,21 @@ class AmazonSES:
 
         self._client = boto3.client('ses', region_name=region)
 
+    @cached_property
+    def max_send_rate(self):
+        """
+        The maximum number of emails per second our SES account allows, unless
+        SES_MAX_SEND_RATE is configured. If we can't ask SES, we fall back to
+        10 emails per second.
+        """
+        if c.SES_MAX_SEND_RATE:
+            return c.SES_MAX_SEND_RATE
+        try:
+            return float(self._client.get_send_quota()['MaxSendRate'])
+        except Exception as e:
+            log.error('Unable to get SES send quota, defaulting to 10 emails per second: {}', e)
+            return 10.0
+
     def sendEmail(self, source, toAddresses, message, replyToAddresses=None, returnPath=None, ccAddresses=None, bccAddresses=None):
         params = { 'Source': source }
         destinations = {}
@@ -59,4 +77,88 @@ class AmazonSES:
         except Exception as e:
             return e
 
+
+class FakeAmazonSES:
+    """
+    Stands in for AmazonSES when developing or testing offline. Messages are
+    kept in the `sent` list instead of being sent anywhere, and `error` is
+    returned from every send if it's set.
+    """
+    def __init__(self, max_send_rate=10.0, error=None):
+        self.max_send_rate = max_send_rate
+        self.error = error
+        self.sent = []
+
+    def sendEmail(self, source, toAddresses, message, replyToAddresses=None, returnPath=None, ccAddresses=None, bccAddresses=None):
+        if self.error:
+            return self.error
+        self.sent.append({
+            'source': source,
+            'toAddresses': toAddresses,
+            'ccAddresses': ccAddresses,
+            'bccAddresses': bccAddresses,
+            'replyToAddresses': replyToAddresses,
+            'message': message,
+        })
+
+
+class TokenBucket:
+    """
+    A rate limiter shared between every process which uses the same Redis key,
+    so all of our workers together stay under a single rate.
+
+    The bucket holds up to one second's worth of tokens and refills at `rate`
+    tokens per second. Refilling and taking a token happen in one Lua script,
+    using the Redis server's clock, so concurrent callers can't double-spend.
+    """
+    _acquire_script = """
+        local now = redis.call('TIME')
+        now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+        local rate = tonumber(ARGV[1])
+        local capacity = tonumber(ARGV[2])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], 60)
+        return tostring(wait)
+    """
+
+    def __init__(self, key, rate_func):
+        self.key = c.REDIS_PREFIX + key
+        self.rate_func = rate_func
+
+    @cached_property
+    def rate(self):
+        return float(self.rate_func())
+
+    @cached_property
+    def _script(self):
+        return c.REDIS_STORE.register_script(self._acquire_script)
+
+    def acquire(self):
+        """
+        Blocks until a token is available, then takes it. If Redis can't be
+        reached, we just wait long enough to stay under our rate on our own.
+        """
+        while True:
+            try:
+                wait = float(self._script(keys=[self.key], args=[self.rate, max(1.0, self.rate)]))
+            except redis.RedisError as e:
+                log.error('Unable to reach Redis for rate limiting, sleeping instead: {}', e)
+                time.sleep(1 / self.rate)
+                return
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
 email_sender = AmazonSES(c.AWS_REGION_EMAIL)
+ses_rate_limiter = TokenBucket('ses_send_rate', lambda: email_sender.max_send_rate)
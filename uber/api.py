@@ -479,11 +479,12 @@ class AttendeeLookup:
         restrictions.
         """
         with Session() as session:
-            attendee_query, error = session.search(query)
+            search_results, error = session.search(query, Attendee.is_valid == True, limit=100)  # noqa: E712
             if error:
                 raise HTTPError(400, error)
-            fields, attendee_query = _attendee_fields_and_query(full, attendee_query)
-            return [a.to_dict(fields) for a in attendee_query.limit(100)]
+            fields, attendee_query = _attendee_fields_and_query(
+                full, session.query(Attendee).filter(Attendee.id.in_(search_results.ids)), only_valid=False)
+            return [a.to_dict(fields) for a in attendee_query]
 
     def login(self, first_name, last_name, email, zip_code):
         """
@@ -255,7 +255,7 @@ AutomatedEmailFixture(
 # creates a "placeholder" registration.
 
 class StopsEmailFixture(AutomatedEmailFixture):
-    def __init__(self, subject, template, filter, ident, **kwargs):
+    def __init__(self, subject, template, filter, ident, query=(), **kwargs):
         AutomatedEmailFixture.__init__(
             self,
             Attendee,
@@ -263,7 +263,8 @@ class StopsEmailFixture(AutomatedEmailFixture):
             template,
             lambda a: a.staffing and filter(a),
             ident,
-            # query=[Attendee.staffing == True] + listify(query),
+            # The staffing check stays in the filter so STOPS emails share the model's single pass
+            query=query,
             sender=c.STAFF_EMAIL,
             **kwargs)
 
@@ -338,6 +339,7 @@ AutomatedEmailFixture(
     '{EVENT_NAME} Badge Confirmation Reminder',
     'placeholders/reminder.txt',
     lambda a: days_after(7, a.registered)() and a.placeholder,
+    query=Attendee.placeholder == True,  # noqa: E712
     ident='badge_confirmation_reminder')
 
 AutomatedEmailFixture(
@@ -345,6 +347,7 @@ AutomatedEmailFixture(
     'Last Chance to Accept Your {EVENT_NAME} ({EVENT_DATE}) Badge',
     'placeholders/reminder.txt',
     lambda a: a.placeholder,
+    query=Attendee.placeholder == True,  # noqa: E712
     when=days_before(7, c.PLACEHOLDER_DEADLINE if c.PLACEHOLDER_DEADLINE else c.UBER_TAKEDOWN),
     ident='badge_confirmation_reminder_last_chance')
 
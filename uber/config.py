@@ -130,6 +130,10 @@ def request_cached_property(func):
         return val
     return with_caching
 
+# Maps each option list name to the table versions it was built at and the options, see Config.get_cached_options
+_option_cache = {}
+
+
 def create_namespace_uuid(s):
     return uuid.UUID(hashlib.sha1(s.encode('utf-8')).hexdigest()[:32])
 
@@ -307,6 +311,77 @@ class Config(_Overridable):
     def get_table_price(self, table_count):
         return sum(c.TABLE_PRICES[i] for i in range(1, 1 + int(float(table_count))))
 
+    @property
+    def BADGE_COUNTS_KEY(self):
+        return self.REDIS_PREFIX + 'badge_counts'
+
+    def get_cached_count(self, name, func):
+        """
+        Returns the count stored under the given name in Redis, calling func and storing its result if it isn't
+        there. Every count is shared across processes and dropped together, either when the Redis hash expires
+        after BADGE_COUNT_CACHE_SECONDS or when invalidate_badge_counts() is called. If Redis is unavailable,
+        we fall back to calling func every time.
+        """
+        if not self.BADGE_COUNT_CACHE_SECONDS:
+            return func()
+
+        try:
+            count = self.REDIS_STORE.hget(self.BADGE_COUNTS_KEY, name)
+        except redis.RedisError as e:
+            log.error("Could not read cached badge count {}: {}".format(name, e))
+            return func()
+
+        if count is not None:
+            return int(count)
+
+        count = func()
+        try:
+            self.REDIS_STORE.hset(self.BADGE_COUNTS_KEY, name, count)
+            # Only the first count stored sets the expiry, so no count can outlive it
+            if self.REDIS_STORE.ttl(self.BADGE_COUNTS_KEY) < 0:
+                self.REDIS_STORE.expire(self.BADGE_COUNTS_KEY, self.BADGE_COUNT_CACHE_SECONDS)
+        except redis.RedisError as e:
+            log.error("Could not cache badge count {}: {}".format(name, e))
+        return count
+
+    def invalidate_badge_counts(self):
+        try:
+            self.REDIS_STORE.delete(self.BADGE_COUNTS_KEY)
+        except redis.RedisError as e:
+            log.error("Could not invalidate cached badge counts: {}".format(e))
+
+    @property
+    def OPTION_VERSIONS_KEY(self):
+        return self.REDIS_PREFIX + 'option_versions'
+
+    def get_cached_options(self, name, tables, func):
+        """
+        Returns the option list stored under the given name in this process, calling func and storing its result
+        if it's missing or any of the given tables has changed since it was stored. Each table's version is kept in
+        Redis and bumped by invalidate_options() whenever a change to it is committed, so every process notices.
+        If Redis is unavailable, we fall back to calling func every time.
+        """
+        try:
+            versions = tuple(self.REDIS_STORE.hmget(self.OPTION_VERSIONS_KEY, tables))
+        except redis.RedisError as e:
+            log.error("Could not read option list versions for {}: {}".format(name, e))
+            return func()
+
+        # The versions are read first, so a change committed while func runs is picked up by the next call
+        cached = _option_cache.get(name)
+        if cached is None or cached[0] != versions:
+            cached = _option_cache[name] = (versions, func())
+        return list(cached[1])
+
+    def invalidate_options(self, *tables):
+        try:
+            with self.REDIS_STORE.pipeline() as pipe:
+                for table in tables:
+                    pipe.hincrby(self.OPTION_VERSIONS_KEY, table)
+                pipe.execute()
+        except redis.RedisError as e:
+            log.error("Could not invalidate option lists for {}: {}".format(', '.join(tables), e))
+
     def get_badge_count_by_type(self, badge_type):
         """
         Returns the count of all badges of the given type that we've promised to
@@ -314,13 +389,15 @@ class Config(_Overridable):
         badges, since those have by definition not been promised to anyone.
         """
         from uber.models import Session, Attendee
-        count = 0
-        with Session() as session:
-            count = session.query(Attendee).filter(
-                Attendee.paid != c.NOT_PAID,
-                Attendee.badge_type == badge_type,
-                Attendee.has_badge == True).count()  # noqa: E712
-        return count
+
+        def count_badges():
+            with Session() as session:
+                return session.query(Attendee).filter(
+                    Attendee.paid != c.NOT_PAID,
+                    Attendee.badge_type == badge_type,
+                    Attendee.has_badge == True).count()  # noqa: E712
+
+        return self.get_cached_count('badge_type:{}'.format(badge_type), count_badges)
 
     def has_section_or_page_access(self, include_read_only=False, page_path=''):
         access = uber.models.AdminAccount.get_access_set(include_read_only=include_read_only)
@@ -393,10 +470,13 @@ class Config(_Overridable):
         """
         from uber.models import Session, PromoCode, PromoCodeGroup
         base_count = self.get_badge_count_by_type(c.ATTENDEE_BADGE)
-        with Session() as session:
-            pc_code_count = session.query(PromoCode).join(PromoCodeGroup).filter(PromoCode.cost > 0,
-                                                                                 PromoCode.uses_remaining > 0).count()
-        return base_count + pc_code_count
+
+        def count_promo_codes():
+            with Session() as session:
+                return session.query(PromoCode).join(PromoCodeGroup).filter(PromoCode.cost > 0,
+                                                                            PromoCode.uses_remaining > 0).count()
+
+        return base_count + self.get_cached_count('unused_paid_promo_codes', count_promo_codes)
 
     @request_cached_property
     @dynamic
@@ -414,7 +494,8 @@ class Config(_Overridable):
                 # This will be efficient because we've indexed attendee(badge_type, badge_status)
                 staff_count = self.get_badge_count_by_type(c.STAFF_BADGE)
                 return max(0, attendee_count - staff_count)
-        else:
+
+        def count_badges_sold():
             with Session() as session:
                 attendees = session.query(Attendee)
                 individuals = attendees.filter(Attendee.has_badge == True, or_(  # noqa: E712
@@ -431,6 +512,8 @@ class Config(_Overridable):
 
                 return individuals + group_badges + promo_code_badges
 
+        return self.get_cached_count('badges_sold', count_badges_sold)
+
     @request_cached_property
     @dynamic
     def BADGES_LEFT_AT_CURRENT_PRICE(self):
@@ -924,28 +1007,33 @@ class Config(_Overridable):
     @request_cached_property
     @dynamic
     def DEPARTMENT_OPTS(self):
-        from uber.models import Session, Department
-        with Session() as session:
-            query = session.query(Department).order_by(Department.name)
-            return [(d.id, d.name) for d in query]
+        return [(id, name) for id, name, desc in self.DEPARTMENT_OPTS_WITH_DESC]
 
     @request_cached_property
     @dynamic
     def DEPARTMENT_OPTS_WITH_DESC(self):
         from uber.models import Session, Department
-        with Session() as session:
-            query = session.query(Department).order_by(Department.name)
-            return [(d.id, d.name, d.description) for d in query]
+
+        def department_opts():
+            with Session() as session:
+                query = session.query(Department.id, Department.name, Department.description).order_by(Department.name)
+                return [tuple(row) for row in query]
+
+        return self.get_cached_options('department_opts', ['department'], department_opts)
 
     @request_cached_property
     @dynamic
     def PUBLIC_DEPARTMENT_OPTS_WITH_DESC(self):
         from uber.models import Session, Department
-        with Session() as session:
-            query = session.query(Department).filter_by(
-                solicits_volunteers=True).order_by(Department.name)
-            return [('All', 'Anywhere', 'I want to help anywhere I can!')] \
-                + [(d.id, d.name, d.description) for d in query]
+
+        def public_department_opts():
+            with Session() as session:
+                query = session.query(Department.id, Department.name, Department.description).filter_by(
+                    solicits_volunteers=True).order_by(Department.name)
+                return [tuple(row) for row in query]
+
+        return [('All', 'Anywhere', 'I want to help anywhere I can!')] \
+            + self.get_cached_options('public_department_opts', ['department'], public_department_opts)
 
     @request_cached_property
     @dynamic
@@ -955,17 +1043,18 @@ class Config(_Overridable):
     @request_cached_property
     @dynamic
     def ADMIN_DEPARTMENT_OPTS(self):
-        from uber.models import Session, Department
+        from uber.models import Session
+
+        department_opts = self.DEPARTMENT_OPTS
+        if not department_opts:
+            return [(-1, -1)]
 
         with Session() as session:
-            query = session.query(Department).order_by(Department.name)
-            if not query.first():
-                return [(-1, -1)]
             current_admin = session.current_admin_account()
             if current_admin.full_shifts_admin:
-                return [(d.id, d.name) for d in query]
+                return department_opts
             else:
-                return [(d.id, d.name) for d in query if d.id in
+                return [(id, name) for id, name in department_opts if id in
                         [str(d.id) for d in current_admin.attendee.dept_memberships_with_inherent_role]]
 
     @request_cached_property
@@ -979,13 +1068,20 @@ class Config(_Overridable):
 
     def get_kickin_count(self, kickin_level):
         from uber.models import Session, Attendee
-        with Session() as session:
-            count = session.query(Attendee).filter_by(amount_extra=kickin_level).filter(
-                    ~Attendee.badge_status.in_([c.INVALID_GROUP_STATUS, c.INVALID_STATUS,
-                                                c.IMPORTED_STATUS, c.REFUNDED_STATUS])).count()
-        return count
+
+        def count_kickins():
+            with Session() as session:
+                return session.query(Attendee).filter_by(amount_extra=kickin_level).filter(
+                        ~Attendee.badge_status.in_([c.INVALID_GROUP_STATUS, c.INVALID_STATUS,
+                                                    c.IMPORTED_STATUS, c.REFUNDED_STATUS])).count()
+
+        return self.get_cached_count('kickin:{}'.format(kickin_level), count_kickins)
 
     def get_shirt_count(self, shirt_enum_key):
+        return self.get_cached_count('shirt:{}'.format(shirt_enum_key),
+                                     lambda: self.count_shirts(shirt_enum_key))
+
+    def count_shirts(self, shirt_enum_key):
         from uber.models import Session, Attendee
         with Session() as session:
             shirt_count = 0
@@ -1042,9 +1138,13 @@ class Config(_Overridable):
     @dynamic
     def ACCESS_GROUP_OPTS(self):
         from uber.models import Session, AccessGroup
-        with Session() as session:
-            query = session.query(AccessGroup).order_by(AccessGroup.name)
-            return [(a.id, a.name) for a in query]
+
+        def access_group_opts():
+            with Session() as session:
+                query = session.query(AccessGroup.id, AccessGroup.name).order_by(AccessGroup.name)
+                return [tuple(row) for row in query]
+
+        return self.get_cached_options('access_group_opts', ['access_group'], access_group_opts)
 
     @request_cached_property
     @dynamic
@@ -0,0 +1,105 @@
+"""
+A stand-in for the SPIn proxy, so terminal payments can be tried out without a payment terminal. Set
+spin_terminal_url to its address (e.g., http://localhost:8081/) and start it with "sep fake_spin_proxy".
+
+Responses use the same field names as spin_rest_utils, so SPIN_REST_SECRETS must be set the same way as for
+the real proxy. Each sale takes --delay seconds while the "customer" pays, and any other request for the same
+terminal in that time gets a busy error. Sales for exactly --decline-amount dollars are cancelled on the
+terminal instead of approved.
+"""
+import argparse
+import asyncio
+from decimal import Decimal
+from uuid import uuid4
+
+from aiohttp import web
+
+import uber.spin_rest_utils as spin_rest_utils
+
+
+class FakeSpinProxy:
+    def __init__(self, delay=5, decline_amount=None):
+        self.delay = delay
+        self.decline_amount = decline_amount
+        self.busy_terminals = set()
+        self.transactions = {}
+
+    @property
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/{path:.*}', self.handle)
+        return app
+
+    def call_type(self, path):
+        strings = spin_rest_utils.strings
+        call_types = [call_type for call_type in spin_rest_utils.secrets.get('lists', {}).get('call_url_types', [])
+                      if strings.get(call_type) and path.endswith(strings[call_type])]
+        return max(call_types, key=lambda call_type: len(strings[call_type]), default=None)
+
+    def response(self, ref_id='', amount=0, error=''):
+        strings = spin_rest_utils.strings
+        response = {
+            strings.get('gen_resp'): {
+                strings.get('res'): 'fake-error' if error else strings.get('res_success'),
+                strings.get('msg'): error or 'Approved',
+                strings.get('det_msg'): error or 'Approved',
+                strings.get('sts_code'): '9999' if error else '0000',
+            },
+            strings.get('ref_id'): ref_id,
+        }
+        if not error:
+            response.update({
+                strings.get('dollar_amounts'): {strings.get('total_amount'): amount},
+                strings.get('auth_code'): uuid4().hex[:6].upper(),
+                strings.get('cdata'): {strings.get('etype'): 'Fake'},
+                strings.get('edata'): {strings.get('app_name'): 'FAKE'},
+                strings.get('ext_data'): {'FAKE': {strings.get('txn_id'): uuid4().hex}},
+                strings.get('sig'): 'fake-signature',
+                strings.get('rcpt'): {strings.get('cust'): f'<p>Fake SPIn receipt for ${amount}</p>'},
+            })
+        return response
+
+    async def handle(self, request):
+        strings = spin_rest_utils.strings
+        call_type = self.call_type(request.path)
+        if not call_type:
+            raise web.HTTPNotFound()
+
+        data = await request.post()
+        terminal_id = data.get(strings.get('terminal_id'), '')
+        ref_id = data.get(strings.get('ref_id'), '')
+        amount = Decimal(data.get(strings.get('dollar_amount')) or 0)
+
+        if terminal_id in self.busy_terminals:
+            return web.json_response(self.response(ref_id, error=strings.get('error_busy')))
+
+        if call_type == 'status':
+            return web.json_response(self.transactions.get(ref_id, self.response(ref_id, error='Not found')))
+        elif call_type == 'sale':
+            self.busy_terminals.add(terminal_id)
+            try:
+                await asyncio.sleep(self.delay)
+            finally:
+                self.busy_terminals.discard(terminal_id)
+
+            if self.decline_amount is not None and amount == self.decline_amount:
+                response = self.response(ref_id, error=strings.get('error_cancel'))
+            else:
+                response = self.response(ref_id, float(amount))
+            self.transactions[ref_id] = response
+            return web.json_response(response)
+        elif call_type in ['void', 'return']:
+            return web.json_response(self.response(ref_id, float(amount)))
+        return web.json_response(self.response(ref_id))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--delay', type=float, default=5, help='seconds each sale waits for the "customer"')
+    parser.add_argument('--decline-amount', type=Decimal, help='dollar amount for which sales are cancelled')
+    args = parser.parse_args()
+
+    proxy = FakeSpinProxy(delay=args.delay, decline_amount=args.decline_amount)
+    web.run_app(proxy.app, host=args.host, port=args.port)
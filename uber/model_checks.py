@@ -29,7 +29,7 @@ from uber.decorators import prereg_validation, validation
 from uber.models import (AccessGroup, AdminAccount, ApiToken, Attendee, Department, DeptRole,
                          Job,
                          PromoCode, PromoCodeGroup, Sale, Session, WatchList)
-from uber.utils import localized_now, valid_email, get_age_from_birthday
+from uber.utils import localized_now, valid_email, get_age_from_birthday, ShiftIntervals
 from uber.payments import PreregCart
 
 
@@ -180,10 +180,9 @@ def slots(job):
 @validation.Job
 def time_conflicts(job):
     if not job.is_new:
-        original_minutes = Job(start_time=job.orig_value_of('start_time'),
-                               duration=job.orig_value_of('duration')).minutes
         for shift in job.shifts:
-            if job.minutes.intersection(shift.attendee.shift_minutes - original_minutes):
+            other_jobs = ShiftIntervals([s.job for s in shift.attendee.shifts if s.job_id != job.id])
+            if other_jobs.overlaps(job.start_time, job.end_time):
                 return 'You cannot change this job to this time, because {} is already working a shift then'.format(
                     shift.attendee.display_name)
 
@@ -9,6 +9,7 @@ from collections import defaultdict
 from datetime import date, datetime, timedelta
 from functools import wraps
 from itertools import chain
+from threading import RLock
 from uuid import uuid4
 
 import bcrypt
@@ -20,12 +21,12 @@ from pockets import cached_classproperty, classproperty, listify
 from pockets.autolog import log
 from pytz import UTC
 from residue import check_constraint_naming_convention, declarative_base, JSON, SessionManager, UTCDateTime, UUID
-from sqlalchemy import and_, func, or_
+from sqlalchemy import and_, exists, func, or_, select, union
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.event import listen
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.ext.mutable import MutableDict
-from sqlalchemy.orm import Query, joinedload, subqueryload
+from sqlalchemy.orm import Query, aliased, joinedload, subqueryload
 from sqlalchemy.orm.attributes import get_history, instance_state
 from sqlalchemy.schema import MetaData
 from sqlalchemy.types import Boolean, Integer, Float, Date, Numeric
@@ -37,10 +38,23 @@ from uber.errors import HTTPRedirect
 from uber.decorators import cost_property, department_id_adapter, presave_adjustment, suffix_property
 from uber.models.types import Choice, DefaultColumn as Column, MultiChoice, utcnow
 from uber.utils import check_csrf, normalize_email_legacy, create_new_hash, DeptChecklistConf, \
-    RegistrationCode, valid_email, valid_password
+    RegistrationCode, ShiftIntervals, valid_email, valid_password
 from uber.payments import ReceiptManager
 
 
+# Advisory lock keys for badge number ranges are (namespace, badge type) pairs;
+# the namespace keeps them from colliding with any other advisory locks.
+_BADGE_RANGE_LOCK_NAMESPACE = 8086
+
+# SQLite has no advisory locks, so on SQLite every badge range shares one
+# process-wide lock instead, held until the reserving transaction ends.
+_sqlite_badge_range_lock = RLock()
+
+# Likewise, shift signups on SQLite are serialized by one process-wide lock
+# rather than by row locks on the attendee and job.
+_sqlite_shift_signup_lock = RLock()
+
+
 def _make_getter(model):
     def getter(
             self, params=None, *, bools=(), checkgroups=(), allowed=(), restricted=False, ignore_csrf=False, **query):
@@ -85,6 +99,11 @@ if not c.SQLALCHEMY_URL.startswith('sqlite'):
 metadata = MetaData(naming_convention=immutabledict(naming_convention))
 
 
+# Maps each model class to the functions MagModel.__getattr__ uses to look up each dynamic attribute name
+_getattr_dispatch = defaultdict(dict)
+_unresolved = object()
+
+
 @declarative_base(metadata=metadata)
 class MagModel:
     id = Column(UUID, primary_key=True, default=lambda: str(uuid4()))
@@ -424,41 +443,79 @@ class MagModel:
         else:
             return sorted(labels[i] for i in ints)
 
-    def __getattr__(self, name):
-        suffixed = suffix_property.check(self, name)
-        if suffixed is not None:
-            return suffixed
+    @classmethod
+    def _getattr_resolvers(cls, name):
+        """
+        Returns the functions __getattr__ tries, in order, to look up the
+        dynamic attribute `name`. Which kinds of dynamic attribute a name can
+        be (a suffix property, a choice in our only MultiChoice column, an
+        is_<model> check, or a receipt cost calculation) depends only on the
+        class and the name, so this is worked out on the first lookup of each
+        name and kept in the class's dispatch table.
+        """
+        dispatch = _getattr_dispatch[cls]
+        resolvers = dispatch.get(name)
+        if resolvers is None:
+            resolvers = dispatch[name] = tuple(cls._build_getattr_resolvers(name))
+        return resolvers
 
-        choice = getattr(c, name, None)
-        if choice is not None:
-            if len(self.multichoice_columns) == 1:
-                multi = self.multichoice_columns[0]
-                if choice in multi.type.choices_dict:
-                    return choice in getattr(self, multi.name + '_ints')
+    @classmethod
+    def _build_getattr_resolvers(cls, name):
+        if not name.startswith('_'):
+            suffix = '_' + name.rsplit('_', 1)[-1]
+            if getattr(getattr(cls, suffix, None), '_is_suffix_property', False):
+                field_name = name[:-len(suffix)]
+
+                def suffixed(self):
+                    value = getattr(self, suffix)(field_name, getattr(self, field_name))
+                    return _unresolved if value is None else value
+                yield suffixed
+
+        if len(cls.multichoice_columns) == 1:
+            multi = cls.multichoice_columns[0]
+            choice = getattr(c, name, None)
+            if choice is not None and choice in multi.type.choices_dict:
+                yield lambda self: choice in getattr(self, multi.name + '_ints')
 
         if name.startswith('is_'):
-            return self.__class__.__name__.lower() == name[3:]
+            is_model = cls.__name__.lower() == name[3:]
+            yield lambda self: is_model
+            return
 
         if name.startswith('default_') and name.endswith('_cost'):
-            if self.active_receipt:
-                log.debug('Cost property {} was called for object {}, \
-                          which has an active receipt. This may cause problems.'.format(name, self))
+            def warn_active_receipt(self):
+                if self.active_receipt:
+                    log.debug('Cost property {} was called for object {}, \
+                              which has an active receipt. This may cause problems.'.format(name, self))
+                return _unresolved
+            yield warn_active_receipt
+
+        # Plugins can register receipt calculations after this is built, so look them up every time
+        def cost_calculation(self):
+            calc = uber.receipt_items.receipt_calculation.items[cls.__name__].get(name[8:])
+            if not calc:
+                return _unresolved
+            try:
+                cost_calc = calc(self)
+                if not cost_calc:
+                    return 0
 
-        receipt_items = uber.receipt_items.receipt_calculation.items
-        try:
-            cost_calc = receipt_items[self.__class__.__name__][name[8:]](self)
-            if not cost_calc:
-                return 0
+                try:
+                    return sum(item[0] * item[1] for item in cost_calc[1].items()) / 100
+                except AttributeError:
+                    if len(cost_calc) > 3:
+                        return cost_calc[1] * cost_calc[3] / 100
+                    else:
+                        return cost_calc[1] / 100
+            except Exception:
+                return _unresolved
+        yield cost_calculation
 
-            try:
-                return sum(item[0] * item[1] for item in cost_calc[1].items()) / 100
-            except AttributeError:
-                if len(cost_calc) > 3:
-                    return cost_calc[1] * cost_calc[3] / 100
-                else:
-                    return cost_calc[1] / 100
-        except Exception:
-            pass
+    def __getattr__(self, name):
+        for resolver in self._getattr_resolvers(name):
+            value = resolver(self)
+            if value is not _unresolved:
+                return value
 
         raise AttributeError(self.__class__.__name__ + '.' + name)
 
@@ -614,13 +671,14 @@ from uber.models.tracking import *  # noqa: F401,E402,F403
 from uber.models.types import *  # noqa: F401,E402,F403
 from uber.models.api import *  # noqa: F401,E402,F403
 from uber.models.hotel import *  # noqa: F401,E402,F403
+from uber.models.statistics import *  # noqa: F401,E402,F403
 
 # Explicitly import models used by the Session class to quiet flake8
 from uber.models.admin import AccessGroup, AdminAccount, WatchList, WorkstationAssignment  # noqa: E402
-from uber.models.attendee import Attendee, AttendeeAccount  # noqa: E402
+from uber.models.attendee import Attendee, AttendeeAccount, attendee_attendee_account  # noqa: E402
 from uber.models.badge_printing import PrintJob  # noqa: E402
 from uber.models.commerce import ModelReceipt  # noqa: E402
-from uber.models.department import Job, Shift, Department, DeptRole  # noqa: E402
+from uber.models.department import Job, JobSignupFeed, Shift, Department, DeptRole  # noqa: E402
 from uber.models.email import Email  # noqa: E402
 from uber.models.group import Group  # noqa: E402
 from uber.models.hotel import LotteryApplication
@@ -628,6 +686,72 @@ from uber.models.promo_code import PromoCode, PromoCodeGroup  # noqa: E402
 from uber.models.tracking import Tracking  # noqa: E402
 
 
+class SearchResults:
+    """
+    The attendees matched by Session.search. The search runs exactly once,
+    the first time the matching ids or count are needed, as a single query
+    which returns the matching attendee ids in order along with the total
+    number of matches from a window function. Callers page through the
+    results by id rather than re-running the search.
+
+    Args:
+        query: A query of matching Attendees, possibly with outer joins.
+        order: Attendee attributes to sort by, as accepted by Query.order.
+        limit: If set, only this many ids are fetched; count is still the
+            total number of matches.
+    """
+    def __init__(self, query, order=None, limit=None):
+        self.session = query.session
+        self.order = order
+        self.limit = limit
+        # The outer joins used for matching can produce several rows per attendee, so
+        # matches are selected by id and the attendees themselves are ordered separately
+        self.query = self.session.query(Attendee).filter(
+            Attendee.id.in_(query.with_entities(Attendee.id)))
+        if order:
+            self.query = self.query.order(order)
+
+    def _fetch(self):
+        query = self.query.with_entities(Attendee.id, func.count().over())
+        if self.limit:
+            query = query.limit(self.limit)
+        rows = query.all()
+        self._ids = [id for id, count in rows]
+        self._count = rows[0][1] if rows else 0
+
+    @property
+    def ids(self):
+        if not hasattr(self, '_ids'):
+            self._fetch()
+        return self._ids
+
+    @property
+    def count(self):
+        if not hasattr(self, '_count'):
+            self._fetch()
+        return self._count
+
+    def __bool__(self):
+        return bool(self.count)
+
+    def __len__(self):
+        return self.count
+
+    def attendees(self, start=0, stop=None):
+        """
+        Loads the matching attendees from `start` to `stop` in search order.
+        """
+        ids = self.ids[start:stop]
+        if not ids:
+            return []
+        by_id = {attendee.id: attendee for attendee in
+                 self.session.query(Attendee).filter(Attendee.id.in_(ids))}
+        return [by_id[id] for id in ids if id in by_id]
+
+    def page(self, page, per_page=100):
+        return self.attendees(per_page * (page - 1), per_page * page)
+
+
 class Session(SessionManager):
     # This looks strange, but `sqlalchemy.create_engine` will throw an error
     # if it's passed arguments that aren't supported by the given DB engine.
@@ -1351,6 +1475,7 @@ class Session(SessionManager):
 
             """
             badge_type = uber.badge_funcs.get_real_badge_type(badge_type)
+            self.reserve_badge_range(badge_type)
 
             new_badge_num = self.auto_badge_num(badge_type)
             lower_bound = c.BADGE_RANGES[badge_type][0]
@@ -1358,15 +1483,11 @@ class Session(SessionManager):
 
             # Adjusts the badge number based on badges in the session
             all_models = chain(self.new, self.dirty)
-            for attendee in [m for m in all_models if isinstance(m, Attendee)]:
-                if attendee.badge_num is not None and lower_bound <= attendee.badge_num <= upper_bound:
-                    new_badge_num = max(new_badge_num, 1 + attendee.badge_num)
-                    # Make sure we didn't just run into the end of a badge number gap
-                    while new_badge_num <= upper_bound:
-                        if self.badge_num_in_use(new_badge_num):
-                            new_badge_num += 1
-                        else:
-                            break
+            session_badge_nums = [m.badge_num for m in all_models if isinstance(m, Attendee)
+                                  and m.badge_num is not None and lower_bound <= m.badge_num <= upper_bound]
+            if session_badge_nums and max(session_badge_nums) >= new_badge_num:
+                # Make sure we didn't just run into the end of a badge number gap
+                new_badge_num = self.next_unused_badge_num(max(session_badge_nums) + 1)
 
             assert new_badge_num < upper_bound, 'There are no more badge numbers available in this range!'
 
@@ -1388,6 +1509,8 @@ class Session(SessionManager):
             """
             from uber.badge_funcs import needs_badge_num
 
+            self.reserve_badge_range(attendee.badge_type, old_badge_type)
+
             if c.SHIFT_CUSTOM_BADGES and c.BEFORE_PRINTED_BADGE_DEADLINE and not c.AT_THE_CON:
                 badge_collision = False
                 if attendee.badge_num:
@@ -1400,18 +1523,19 @@ class Session(SessionManager):
                     if attendee.badge_num and badge_collision:
                         if old_badge_type == attendee.badge_type:
                             if old_badge_num < attendee.badge_num:
-                                self.shift_badges(
-                                    old_badge_type, old_badge_num + 1, until=attendee.badge_num, down=True)
+                                self.shift_badges(old_badge_type, old_badge_num + 1, until=attendee.badge_num,
+                                                  down=True, attendee=attendee)
                             else:
-                                self.shift_badges(old_badge_type, attendee.badge_num, until=old_badge_num - 1, up=True)
+                                self.shift_badges(old_badge_type, attendee.badge_num, until=old_badge_num - 1,
+                                                  up=True, attendee=attendee)
                         else:
-                            self.shift_badges(old_badge_type, old_badge_num + 1, down=True)
-                            self.shift_badges(attendee.badge_type, attendee.badge_num, up=True)
+                            self.shift_badges(old_badge_type, old_badge_num + 1, down=True, attendee=attendee)
+                            self.shift_badges(attendee.badge_type, attendee.badge_num, up=True, attendee=attendee)
                     else:
-                        self.shift_badges(old_badge_type, old_badge_num + 1, down=True)
+                        self.shift_badges(old_badge_type, old_badge_num + 1, down=True, attendee=attendee)
 
                 elif attendee.badge_num and badge_collision:
-                    self.shift_badges(attendee.badge_type, attendee.badge_num, up=True)
+                    self.shift_badges(attendee.badge_type, attendee.badge_num, up=True, attendee=attendee)
 
                 attendee.badge_num = desired_badge_num
 
@@ -1439,6 +1563,32 @@ class Session(SessionManager):
                 if needs_badge_num(attendee):
                     attendee.badge_num = self.get_next_badge_num(attendee.badge_type)
         
+        def reserve_badge_range(self, *badge_types):
+            """
+            Locks the number ranges of the given badge types until this
+            session's transaction commits or rolls back, so that no other
+            session can pick a badge number in those ranges until the numbers
+            we pick have been saved. Call this before looking for a free badge
+            number; get_next_badge_num and update_badge already do.
+
+            On Postgres this takes a transaction-level advisory lock per badge
+            type, in a consistent order to avoid deadlocks. On SQLite it takes
+            a single process-wide lock instead.
+            """
+            badge_types = sorted({uber.badge_funcs.get_real_badge_type(badge_type)
+                                  for badge_type in badge_types if badge_type})
+            if not badge_types:
+                return
+
+            connection = self.connection()
+            if connection.dialect.name == 'postgresql':
+                for badge_type in badge_types:
+                    self.execute(select([func.pg_advisory_xact_lock(
+                        _BADGE_RANGE_LOCK_NAMESPACE, badge_type % 2**31)]))
+            elif not self.info.get('badge_range_locked'):
+                _sqlite_badge_range_lock.acquire()
+                self.info['badge_range_locked'] = True
+
         def badge_num_in_use(self, badge_num):
             """
             This is a last resort for assigning a non-duplicate badge number. It should only be needed
@@ -1461,30 +1611,39 @@ class Session(SessionManager):
                     type exist, and to select badges within a specific range.
 
             """
-            in_range = self.query(Attendee.badge_num).filter(
-                Attendee.badge_num != None,  # noqa: E711
-                Attendee.badge_num >= c.BADGE_RANGES[badge_type][0],
-                Attendee.badge_num <= c.BADGE_RANGES[badge_type][1])
-
-            in_range_list = [int(row[0]) for row in in_range.order_by(Attendee.badge_num)]
-
-            if len(in_range_list):
-                # Searches badge range for a gap in badge numbers; if none
-                # found, returns the latest badge number + 1.
-                # Doing this lets admins manually set high badge numbers
-                # without filling up the badge type's range.
-                start, end = c.BADGE_RANGES[badge_type][0], in_range_list[-1]
-                gap_nums = sorted(set(range(start, end + 1)).difference(in_range_list))
+            return self.next_unused_badge_num(c.BADGE_RANGES[badge_type][0])
 
-                if not gap_nums:
-                    return end + 1
-                else:
-                    return gap_nums[0]
-            else:
-                return c.BADGE_RANGES[badge_type][0]
+        def next_unused_badge_num(self, start):
+            """
+            Returns the lowest badge number at or above `start` that isn't in
+            use, which is either `start` itself or one past the first badge
+            number at or above `start` whose successor is free. The database
+            finds that number with an anti-join walking the badge_num index
+            in order, so it stops at the first gap instead of loading every
+            badge number in the range.
+
+            Doing it this way still lets admins manually set high badge
+            numbers without filling up the badge type's range, since any
+            gap below them is found first.
+            """
+            if not self.badge_num_in_use(start):
+                return start
 
-        def shift_badges(self, badge_type, badge_num, *, until=None, up=False, down=False):
+            next_attendee = aliased(Attendee)
+            return self.query(Attendee.badge_num + 1).filter(
+                Attendee.badge_num >= start,
+                ~exists().where(next_attendee.badge_num == Attendee.badge_num + 1)
+            ).order_by(Attendee.badge_num).limit(1).scalar()
 
+        def shift_badges(self, badge_type, badge_num, *, until=None, up=False, down=False, attendee=None):
+            """
+            Moves every badge number from `badge_num` through `until` (or the
+            end of the badge type's range) up or down by one, in a single
+            UPDATE statement. Attendees already loaded in this session only
+            have their badge_num expired, so they're reloaded if they're used
+            again, and the shift is tracked as one AUTO_BADGE_SHIFT entry
+            against `attendee`, whose badge change caused it.
+            """
             if not c.SHIFT_CUSTOM_BADGES or c.AFTER_PRINTED_BADGE_DEADLINE or c.AT_THE_CON:
                 return False
 
@@ -1499,7 +1658,16 @@ class Session(SessionManager):
                 Attendee.badge_num >= badge_num,
                 Attendee.badge_num <= until)
 
-            query.update({Attendee.badge_num: Attendee.badge_num + shift}, synchronize_session='evaluate')
+            query.update({Attendee.badge_num: Attendee.badge_num + shift}, synchronize_session=False)
+
+            for instance in list(self.identity_map.values()):
+                if isinstance(instance, Attendee) and 'badge_num' in instance.__dict__ \
+                        and not get_history(instance, 'badge_num').has_changes() \
+                        and instance.badge_num is not None and badge_num <= instance.badge_num <= until:
+                    self.expire(instance, ['badge_num'])
+
+            if attendee is not None:
+                Tracking.track_badge_shift(self, attendee, badge_type, badge_num, until, shift)
 
             return True
 
@@ -1562,6 +1730,41 @@ class Session(SessionManager):
                     subqueryload(Job.shifts).subqueryload(Shift.attendee).subqueryload(Attendee.group)) \
                 .order_by(Job.start_time, Job.name)
 
+        @department_id_adapter
+        def job_availability(self, department_id, jobs=None):
+            """
+            Returns a dict mapping the id of each job in a department to the
+            staffers who could be assigned to it right now, sorted by last
+            name.
+
+            Asking every job for its available_volunteers runs a query per job
+            and rebuilds each candidate's schedule every time. Instead, this
+            loads the department's jobs, its staffing members with their roles,
+            and all of those members' shifts up front, then checks every job
+            against every member in memory.
+
+            Args:
+                jobs: Only check these jobs, which must all belong to the
+                    department, instead of every job in it.
+            """
+            if jobs is None:
+                jobs = self.query(Job).filter(Job.department_id == department_id).options(
+                    joinedload(Job.department), subqueryload(Job.required_roles)).all()
+
+            attendees = self.query(Attendee).filter(
+                Attendee.staffing == True,  # noqa: E712
+                Attendee.has_badge == True,  # noqa: E712
+                Attendee.dept_memberships.any(department_id=department_id)
+            ).options(
+                subqueryload(Attendee.dept_roles),
+                subqueryload(Attendee.shifts).joinedload(Shift.job).joinedload(Job.department)
+            ).order_by(Attendee.last_first).all()
+
+            return {job.id: [attendee for attendee in attendees
+                             if attendee.has_required_roles(job)
+                             and job.no_overlap(attendee)
+                             and job.working_limit_ok(attendee)] for job in jobs}
+
         def staffers_for_dropdown(self):
             query = self.query(Attendee.id, Attendee.display_name)
             return [
@@ -1643,7 +1846,16 @@ class Session(SessionManager):
                 attendees = attendees.outerjoin(AttendeeAccount, Attendee.managers)
             return attendees
 
-        def search(self, text, *filters):
+        def search(self, text, *filters, order=None, limit=None):
+            """
+            Searches attendees for the freeform text typed into the attendee
+            search box.
+
+            Returns:
+                A (SearchResults, message) tuple, with the results ordered by
+                `order` and limited to `limit` ids if given; the results are
+                None if the search text had an error.
+            """
             attendees = self.query(Attendee).outerjoin(Group,
                                                        Attendee.group_id == Group.id
                                                        ).outerjoin(BadgePickupGroup
@@ -1674,36 +1886,43 @@ class Session(SessionManager):
                 legal_name_cond = attendees.icontains_condition(legal_name="{}%{}".format(first, last))
                 first_name_cond = attendees.icontains_condition(first_name=terms)
                 last_name_cond = attendees.icontains_condition(last_name=terms)
-                if attendees.filter(or_(name_cond, legal_name_cond, first_name_cond, last_name_cond)).first():
-                    return attendees.filter(or_(name_cond, legal_name_cond, first_name_cond, last_name_cond)), ''
+                results = SearchResults(attendees.filter(or_(name_cond, legal_name_cond, first_name_cond,
+                                                             last_name_cond)), order, limit)
+                if results.count:
+                    return results, ''
 
             elif len(terms) == 1 and terms[0].endswith(','):
                 last = terms[0].rstrip(',')
                 name_cond = attendees.icontains_condition(last_name=last)
                 # Known issue: search includes first name if legal name is set
                 legal_cond = attendees.icontains_condition(legal_name=last)
-                return attendees.filter(or_(name_cond, legal_cond)), ''
+                return SearchResults(attendees.filter(or_(name_cond, legal_cond)), order, limit), ''
 
             elif len(terms) == 1 and terms[0].isdigit():
                 if len(terms[0]) == 10:
-                    return attendees.filter(or_(Attendee.ec_phone == terms[0], Attendee.cellphone == terms[0])), ''
+                    return SearchResults(attendees.filter(
+                        or_(Attendee.ec_phone == terms[0], Attendee.cellphone == terms[0])), order, limit), ''
                 elif int(terms[0]) <= sorted(
                         c.BADGE_RANGES.items(),
                         key=lambda badge_range: badge_range[1][0])[-1][1][1]:
-                    return attendees.filter(Attendee.badge_num == terms[0]), ''
+                    return SearchResults(attendees.filter(Attendee.badge_num == terms[0]), order, limit), ''
 
             elif len(terms) == 1 \
                     and re.match('^[a-z0-9]{8}-[a-z0-9]{4}-[a-z0-9]{4}-[a-z0-9]{4}-[a-z0-9]{12}$', terms[0]):
-                return attendees.filter(or_(*map(lambda x: x == terms[0], id_list))), ''
+                return SearchResults(attendees.filter(or_(*map(lambda x: x == terms[0], id_list))), order, limit), ''
             elif len(terms) == 1 and terms[0].startswith(c.EVENT_QR_ID):
                 search_uuid = terms[0][len(c.EVENT_QR_ID):]
                 if re.match('^[a-z0-9]{8}-[a-z0-9]{4}-[a-z0-9]{4}-[a-z0-9]{4}-[a-z0-9]{12}$', search_uuid):
-                    return attendees.filter(or_(*map(lambda x: x == search_uuid, id_list))), ''
+                    return SearchResults(
+                        attendees.filter(or_(*map(lambda x: x == search_uuid, id_list))), order, limit), ''
 
             or_checks = []
             and_checks = []
 
             def check_text_fields(search_text):
+                if not c.SQLALCHEMY_URL.startswith('sqlite'):
+                    return [self.text_search_condition(search_text)]
+
                 check_list = [
                     Group.name.ilike('%' + search_text + '%'),
                     PromoCodeGroup.name.ilike('%' + search_text + '%'),
@@ -1788,13 +2007,37 @@ class Session(SessionManager):
                 or_checks.extend(check_text_fields(text))
 
             if or_checks and and_checks:
-                return attendees.filter(or_(*or_checks), and_(*and_checks)), ''
+                attendees = attendees.filter(or_(*or_checks), and_(*and_checks))
             elif or_checks:
-                return attendees.filter(or_(*or_checks)), ''
+                attendees = attendees.filter(or_(*or_checks))
             elif and_checks:
-                return attendees.filter(and_(*and_checks)), ''
-            else:
-                return attendees, ''
+                attendees = attendees.filter(and_(*and_checks))
+            return SearchResults(attendees, order, limit), ''
+
+        def text_search_condition(self, search_text):
+            """
+            Returns a condition matching attendees with `search_text` in any
+            of their searchable fields, their group's name, their promo code
+            group's name, or one of their accounts' emails.
+
+            Each of those is looked up in its own subquery, so the attendee
+            lookup can use the pg_trgm index on Attendee.search_text instead
+            of checking every column of every joined row. The subqueries are
+            never correlated, since search() outer-joins these same tables.
+            """
+            pattern = '%' + search_text.lower() + '%'
+            matches = [
+                select([Attendee.id]).where(Attendee.search_text.ilike(pattern)),
+                select([Attendee.id]).where(Attendee.group_id == Group.id, Group.name.ilike(pattern)),
+                select([Attendee.id]).where(Attendee.promo_code_id == PromoCode.id,
+                                            PromoCode.group_id == PromoCodeGroup.id,
+                                            PromoCodeGroup.name.ilike(pattern)),
+            ]
+            if c.ATTENDEE_ACCOUNTS_ENABLED:
+                matches.append(select([attendee_attendee_account.c.attendee_id]).where(
+                    attendee_attendee_account.c.attendee_account_id == AttendeeAccount.id,
+                    AttendeeAccount.email.ilike(pattern)))
+            return Attendee.id.in_(union(*[match.correlate(None) for match in matches]))
 
         def property_search(self, text):
             """
@@ -1868,9 +2111,32 @@ class Session(SessionManager):
                     for attendee in sorted_unassigned[:abs(diff)]:
                         self.delete_from_group(attendee, group)
 
+        def lock_shift_signup(self, attendee_id, job_id):
+            """
+            Locks an attendee's schedule and a job's slots until this
+            session's transaction commits or rolls back, so that the slot
+            count and the attendee's other shifts can be checked and a new
+            shift added without another signup slipping in between.
+
+            On Postgres this takes row locks on the attendee and then the job;
+            taking them in that order means two signups can never each hold
+            the lock the other is waiting for. On SQLite it takes a single
+            process-wide lock instead.
+            """
+            if self.connection().dialect.name == 'postgresql':
+                self.query(Attendee.id).filter(Attendee.id == attendee_id).with_for_update().one()
+                self.query(Job.id).filter(Job.id == job_id).with_for_update().one()
+            elif not self.info.get('shift_signup_locked'):
+                _sqlite_shift_signup_lock.acquire()
+                self.info['shift_signup_locked'] = True
+
         def assign(self, attendee_id, job_id):
             """
             assign an Attendee to a Job by creating a Shift
+
+            The slot count and the attendee's other shifts are re-read from the
+            database after locking them, so simultaneous signups can't overbook
+            a job or double-book a volunteer.
             :return: 'None' on success, error message on failure
             """
             job = self.job(job_id)
@@ -1883,13 +2149,19 @@ class Session(SessionManager):
                 return 'You cannot assign an attendee to this shift who does not have the required roles: {}'.format(
                     job.required_roles_labels)
 
-            if job.slots <= len(job.shifts):
+            self.lock_shift_signup(attendee.id, job.id)
+
+            if job.slots <= self.query(Shift).filter(Shift.job_id == job.id).count():
                 return 'All slots for this job have already been filled'
 
-            if not job.no_overlap(attendee):
+            shift_intervals = ShiftIntervals(
+                self.query(Job).join(Shift, Shift.job_id == Job.id).filter(Shift.attendee_id == attendee.id)
+                .options(joinedload(Job.department)).all())
+
+            if not job.no_overlap(attendee, shift_intervals):
                 return 'This volunteer is already signed up for a shift during that time'
 
-            if not job.working_limit_ok(attendee):
+            if not job.working_limit_ok(attendee, shift_intervals):
                 return 'This shift would put this volunteer over one of their department\'s max consecutive hours'
 
             self.add(Shift(attendee=attendee, job=job))
@@ -2006,6 +2278,7 @@ class Session(SessionManager):
                     target.__table__.append_column(attr, replace_existing=True)
                 else:
                     setattr(target, name, attr)
+        _getattr_dispatch.clear()
         return target
 
 
@@ -2071,12 +2344,87 @@ def _track_changes(session, context, instances='deprecated'):
                 Tracking.track(action, instance)
 
 
+def _record_tracking(session):
+    rows = session.info.pop('pending_tracking', None)
+    if rows:
+        Tracking.record(rows)
+
+
+def _discard_tracking(session):
+    session.info.pop('pending_tracking', None)
+    session.info.pop('tracking_snapshots', None)
+
+
+_badge_count_columns = {
+    Attendee: ['paid', 'badge_status', 'badge_type', 'group_id', 'promo_code_id',
+               'amount_extra', 'shirt', 'num_event_shirts', 'ribbon'],
+    Group: ['amount_paid'],
+    PromoCode: ['cost', 'uses_allowed', 'group_id'],
+}
+
+
+def _flag_badge_count_changes(session, context):
+    for instance in chain(session.new, session.deleted):
+        if isinstance(instance, (Attendee, PromoCode, PromoCodeGroup)):
+            session.info['badge_counts_changed'] = True
+            return
+
+    for instance in session.dirty:
+        columns = _badge_count_columns.get(type(instance), [])
+        if any(get_history(instance, column).has_changes() for column in columns):
+            session.info['badge_counts_changed'] = True
+            return
+
+
+def _invalidate_badge_counts(session):
+    # Wait until the changes are committed, or another process could re-cache the old counts
+    if session.info.pop('badge_counts_changed', False):
+        c.invalidate_badge_counts()
+
+
+def _discard_badge_count_changes(session):
+    session.info.pop('badge_counts_changed', None)
+
+
+def _flag_option_changes(session, context):
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, (Department, AccessGroup)):
+            session.info.setdefault('changed_option_tables', set()).add(instance.__tablename__)
+
+
+def _invalidate_options(session):
+    tables = session.info.pop('changed_option_tables', None)
+    if tables:
+        c.invalidate_options(*tables)
+
+
+def _discard_option_changes(session):
+    session.info.pop('changed_option_tables', None)
+
+
+def _release_sqlite_locks(session, transaction):
+    if transaction.parent is None:
+        if session.info.pop('badge_range_locked', False):
+            _sqlite_badge_range_lock.release()
+        if session.info.pop('shift_signup_locked', False):
+            _sqlite_shift_signup_lock.release()
+
+
 def register_session_listeners():
     """
     The order in which we register these listeners matters.
     """
     listen(Session.session_factory, 'before_flush', _presave_adjustments)
     listen(Session.session_factory, 'after_flush', _track_changes)
+    listen(Session.session_factory, 'after_commit', _record_tracking)
+    listen(Session.session_factory, 'after_rollback', _discard_tracking)
+    listen(Session.session_factory, 'after_flush', _flag_badge_count_changes)
+    listen(Session.session_factory, 'after_commit', _invalidate_badge_counts)
+    listen(Session.session_factory, 'after_rollback', _discard_badge_count_changes)
+    listen(Session.session_factory, 'after_flush', _flag_option_changes)
+    listen(Session.session_factory, 'after_commit', _invalidate_options)
+    listen(Session.session_factory, 'after_rollback', _discard_option_changes)
+    listen(Session.session_factory, 'after_transaction_end', _release_sqlite_locks)
 
 
 def _track_collection_append(target, value, initiator):
@@ -10,10 +10,11 @@ from pockets.autolog import log
 from pytz import UTC
 from residue import CoerceUTF8 as UnicodeText, UTCDateTime, UUID
 from sqlalchemy import and_, case, exists, func, or_, select
+from sqlalchemy.event import listen
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref, subqueryload
-from sqlalchemy.schema import Column as SQLAlchemyColumn, ForeignKey, Index, Table, UniqueConstraint
+from sqlalchemy.schema import Column as SQLAlchemyColumn, DDL, ForeignKey, Index, Table, UniqueConstraint
 from sqlalchemy.types import Boolean, Date, Integer
 
 import uber
@@ -26,7 +27,8 @@ from uber.models.group import Group
 from uber.models.types import default_relationship as relationship, utcnow, Choice, DefaultColumn as Column, \
     MultiChoice, TakesPaymentMixin
 from uber.utils import add_opt, get_age_from_birthday, get_age_conf_from_birthday, hour_day_format, \
-    localized_now, mask_string, normalize_email, normalize_email_legacy, remove_opt, RegistrationCode, filename_extension
+    localized_now, mask_string, normalize_email, normalize_email_legacy, remove_opt, RegistrationCode, ShiftIntervals, \
+    filename_extension
 
 
 __all__ = ['Attendee', 'AttendeeAccount', 'BadgePickupGroup', 'FoodRestrictions']
@@ -239,6 +241,10 @@ class Attendee(MagModel, TakesPaymentMixin):
     for_review = Column(UnicodeText, admin_only=True)
     admin_notes = Column(UnicodeText, admin_only=True)
 
+    # Lowercased copy of every searchable field, kept up to date on save and
+    # indexed with pg_trgm on Postgres so text searches don't scan every column
+    search_text = Column(UnicodeText, admin_only=True)
+
     public_id = Column(UUID, default=lambda: str(uuid4()))
     badge_num = Column(Integer, default=None, nullable=True, admin_only=True)
     badge_type = Column(Choice(c.BADGE_OPTS), default=c.ATTENDEE_BADGE)
@@ -434,6 +440,8 @@ class Attendee(MagModel, TakesPaymentMixin):
     ]
     if not c.SQLALCHEMY_URL.startswith('sqlite'):
         _attendee_table_args.append(UniqueConstraint('badge_num', deferrable=True, initially='DEFERRED'))
+        _attendee_table_args.append(Index('ix_attendee_search_text_trgm', search_text, postgresql_using='gin',
+                                          postgresql_ops={'search_text': 'gin_trgm_ops'}))
 
     __table_args__ = tuple(_attendee_table_args)
     _repr_attr_names = ['display_name']
@@ -448,7 +456,7 @@ class Attendee(MagModel, TakesPaymentMixin):
     def _shift_badges(self):
         is_skipped = getattr(self, '_skip_badge_shift_on_delete', False)
         if self.badge_num and not is_skipped:
-            self.session.shift_badges(self.badge_type, self.badge_num + 1, down=True)
+            self.session.shift_badges(self.badge_type, self.badge_num + 1, down=True, attendee=self)
 
     @presave_adjustment
     def _misc_adjustments(self):
@@ -683,6 +691,11 @@ class Attendee(MagModel, TakesPaymentMixin):
                 self.session.set_badge_num_in_range(self)
                 self.ribbon = remove_opt(self.ribbon_ints, c.UNDER_13)
 
+    @presave_adjustment
+    def _update_search_text(self):
+        self.search_text = '\n'.join(
+            str(getattr(self, attr)).lower() for attr in self.searchable_fields if getattr(self, attr))
+
     @property
     def full_address(self):
         if self.country and self.city and (
@@ -1608,6 +1621,10 @@ class Attendee(MagModel, TakesPaymentMixin):
             all_minutes.update(shift.job.minutes)
         return all_minutes
 
+    @cached_property
+    def shift_intervals(self):
+        return ShiftIntervals([shift.job for shift in self.shifts])
+
     @cached_property
     def shift_minute_map(self):
         all_minutes = {}
@@ -1705,8 +1722,9 @@ class Attendee(MagModel, TakesPaymentMixin):
     @classproperty
     def searchable_fields(cls):
         fields = [col.name for col in cls.__table__.columns if isinstance(col.type, UnicodeText)]
-        if "other_accessibility_requests" in fields:
-            fields.remove('other_accessibility_requests')
+        for field in ['other_accessibility_requests', 'search_text']:
+            if field in fields:
+                fields.remove(field)
         return fields
 
     @classproperty
@@ -2186,6 +2204,10 @@ class Attendee(MagModel, TakesPaymentMixin):
         return self.last_name
 
 
+listen(Attendee.__table__, 'before_create',
+       DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
+
 # Many to many association table to tie Attendees to Attendee Accounts
 attendee_attendee_account = Table(
     'attendee_attendee_account',
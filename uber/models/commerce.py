@@ -204,6 +204,31 @@ class ModelReceipt(MagModel):
         return coalesce(func.sum(ReceiptItem.amount * ReceiptItem.count).filter(
             ReceiptItem.fk_id == None
         ), 0)
+
+    @classmethod
+    def totals_subquery(cls, session, owner_model):
+        """
+        Returns a subquery of the owner_id of every open receipt for the given model, along with its item_total,
+        fkless_item_total, payment_total, and refund_total in cents. Items and transactions are each summed by
+        receipt_id on their own, so reports can compare totals for every receipt without loading any of them.
+        """
+        items = session.query(
+            ReceiptItem.receipt_id,
+            cls.item_total_sql.label('item_total'),
+            cls.fkless_item_total_sql.label('fkless_item_total')).group_by(ReceiptItem.receipt_id).subquery()
+        txns = session.query(
+            ReceiptTransaction.receipt_id,
+            cls.payment_total_sql.label('payment_total'),
+            cls.refund_total_sql.label('refund_total')).group_by(ReceiptTransaction.receipt_id).subquery()
+
+        return session.query(
+            cls.owner_id,
+            coalesce(items.c.item_total, 0).label('item_total'),
+            coalesce(items.c.fkless_item_total, 0).label('fkless_item_total'),
+            coalesce(txns.c.payment_total, 0).label('payment_total'),
+            coalesce(txns.c.refund_total, 0).label('refund_total')
+        ).outerjoin(items, items.c.receipt_id == cls.id).outerjoin(txns, txns.c.receipt_id == cls.id).filter(
+            cls.owner_model == owner_model, cls.closed == None).subquery()  # noqa: E711
     
     @property
     def txn_total(self):
@@ -289,7 +314,7 @@ class ReceiptTransaction(MagModel):
         plus it allows admins to refund Stripe payments per item.
     """
 
-    receipt_id = Column(UUID, ForeignKey('model_receipt.id', ondelete='SET NULL'), nullable=True)
+    receipt_id = Column(UUID, ForeignKey('model_receipt.id', ondelete='SET NULL'), nullable=True, index=True)
     receipt = relationship('ModelReceipt', foreign_keys=receipt_id,
                            cascade='save-update, merge',
                            backref=backref('receipt_txns', cascade='save-update, merge'))
@@ -495,7 +520,7 @@ class ReceiptTransaction(MagModel):
 
 
 class ReceiptItem(MagModel):
-    receipt_id = Column(UUID, ForeignKey('model_receipt.id', ondelete='SET NULL'), nullable=True)
+    receipt_id = Column(UUID, ForeignKey('model_receipt.id', ondelete='SET NULL'), nullable=True, index=True)
     receipt = relationship('ModelReceipt', foreign_keys=receipt_id,
                            cascade='save-update, merge',
                            backref=backref('receipt_items', cascade='save-update, merge'))
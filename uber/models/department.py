@@ -14,12 +14,13 @@ from uber.decorators import presave_adjustment
 from uber.models import MagModel
 from uber.models.attendee import Attendee
 from uber.models.types import default_relationship as relationship, Choice, DefaultColumn as Column
+from uber.utils import linkify_urls
 
 
 __all__ = [
     'dept_membership_dept_role', 'job_required_role', 'Department',
     'DeptChecklistItem', 'DeptMembership', 'DeptMembershipRequest',
-    'DeptRole', 'Job', 'Shift']
+    'DeptRole', 'Job', 'JobSignupFeed', 'Shift']
 
 
 # Many to many association table to represent the DeptRoles fulfilled
@@ -430,7 +431,7 @@ class Job(MagModel):
     def end_time(self):
         return self.start_time + timedelta(minutes=self.duration)
 
-    def working_limit_ok(self, attendee):
+    def working_limit_ok(self, attendee, shift_intervals=None):
         """
         Prevent signing up for too many shifts in a row. `minutes_worked` is the
         number of minutes that the attendee is working immediately before plus
@@ -440,45 +441,37 @@ class Job(MagModel):
         and dept B has a limit of 2 minutes, (for one-hour shifts), if we try to
         sign up for the shift order of [A, A, B], B's limits will kick in and
         block the signup.
+
+        Pass shift_intervals to check against a freshly loaded schedule
+        rather than the attendee's cached one.
         """
 
-        attendee_minute_map = attendee.shift_minute_map
+        if shift_intervals is None:
+            shift_intervals = attendee.shift_intervals
         minutes_worked = self.duration
         working_minutes_limit = self.max_consecutive_minutes
         if working_minutes_limit == 0:
             working_minutes_limit = 60000  # just default to something large
 
-        # count the number of filled minutes before this shift
-        current_shift_minute = self.start_time - timedelta(minutes=1)
-        while current_shift_minute in attendee_minute_map:
-            minutes_worked += 1
-            this_job_minute_limit = attendee_minute_map[current_shift_minute].max_consecutive_minutes
-            if this_job_minute_limit > 0:
-                working_minutes_limit = min(working_minutes_limit, this_job_minute_limit)
-            current_shift_minute = current_shift_minute - timedelta(minutes=1)
-
-        # count the number of filled minutes after this shift
-        current_shift_minute = self.start_time + timedelta(minutes=self.duration)
-        while current_shift_minute in attendee_minute_map:
-            minutes_worked += 1
-            this_job_minute_limit = attendee_minute_map[current_shift_minute].max_consecutive_minutes
-            if this_job_minute_limit > 0:
-                working_minutes_limit = min(working_minutes_limit, this_job_minute_limit)
-            current_shift_minute = current_shift_minute + timedelta(minutes=1)
+        # count the number of filled minutes before and after this shift
+        for minutes, jobs in [shift_intervals.worked_before(self.start_time),
+                              shift_intervals.worked_after(self.end_time)]:
+            minutes_worked += minutes
+            for job in jobs:
+                if job.max_consecutive_minutes > 0:
+                    working_minutes_limit = min(working_minutes_limit, job.max_consecutive_minutes)
 
         return minutes_worked <= working_minutes_limit
 
-    def no_overlap(self, attendee):
-        before = self.start_time - timedelta(minutes=1)
-        after = self.start_time + timedelta(minutes=self.duration)
-        return not self.minutes.intersection(attendee.shift_minutes) and (
-            before not in attendee.shift_minute_map
-            or not attendee.shift_minute_map[before].extra15
-            or self.department_id == attendee.shift_minute_map[before].department_id
-        ) and (
-            after not in attendee.shift_minute_map
-            or not self.extra15
-            or self.department_id == attendee.shift_minute_map[after].department_id
+    def no_overlap(self, attendee, shift_intervals=None):
+        if shift_intervals is None:
+            shift_intervals = attendee.shift_intervals
+        return not shift_intervals.overlaps(self.start_time, self.end_time) and all(
+            not job.extra15 or self.department_id == job.department_id
+            for job in shift_intervals.jobs_ending_at(self.start_time)
+        ) and all(
+            not self.extra15 or self.department_id == job.department_id
+            for job in shift_intervals.jobs_starting_at(self.end_time)
         )
 
     @hybrid_property
@@ -599,3 +592,50 @@ class Shift(MagModel):
     @property
     def name(self):
         return "{}'s {!r} shift".format(self.Attendee.display_name, self.job.name)
+
+
+class JobSignupFeed:
+    """
+    Process-wide cache of the parts of the volunteer shift calendar that
+    are the same for everyone: each job's times, title, department and
+    linkified description.
+
+    Each event is kept alongside the last_updated times of its job and
+    department, so callers that have already loaded those can check that
+    it is current without another query. Slot counts change with every
+    signup, so they are never cached.
+    """
+    _events = {}
+
+    @staticmethod
+    def event(job):
+        return {
+            'id': job.id,
+            'allDay': False,
+            'start': job.start_time_local.isoformat(),
+            'end': job.end_time_local.isoformat(),
+            'title': f"{job.name}",
+            'extendedProps': {
+                'department_name': job.department.name,
+                'desc': linkify_urls(job.description),
+                'desc_text': job.description,
+                'weight': job.weight,
+                'is_public': job.is_public,
+            }
+        }
+
+    @classmethod
+    def cached_event(cls, job):
+        """
+        Returns the static event dict for `job`, rebuilding it only if the
+        job or its department has been updated since it was cached. The
+        dict is shared, so copy before changing.
+        """
+        stamp = (job.last_updated, job.department.last_updated)
+        cached = cls._events.get(job.id)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        event = cls.event(job)
+        cls._events[job.id] = (stamp, event)
+        return event
@@ -1,18 +1,19 @@
 import re
 from collections import OrderedDict
 from datetime import datetime, date
+from functools import lru_cache
 from dateutil import parser as dateparser
 
 from pockets import cached_property, classproperty, groupify
 from pockets.autolog import log
 from pytz import UTC
 from residue import CoerceUTF8 as UnicodeText, UTCDateTime, UUID
-from sqlalchemy import func, or_, select, update
+from sqlalchemy import and_, exists, func, not_, or_, select, update
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import relationship
-from sqlalchemy.schema import ForeignKey
+from sqlalchemy.schema import ForeignKey, Index
 from sqlalchemy.types import Boolean, Integer
 
 from uber import utils
@@ -27,6 +28,15 @@ from uber.utils import normalize_newlines, request_cached_context
 __all__ = ['AutomatedEmail', 'Email']
 
 
+@lru_cache(maxsize=512)
+def compile_template(text):
+    """
+    Compiles email template text into a Jinja template just once, rather than
+    once for every recipient.
+    """
+    return JinjaEnv.env().from_string(text)
+
+
 class BaseEmailMixin(object):
     model = Column(UnicodeText)
 
@@ -267,6 +277,19 @@ class AutomatedEmail(MagModel, BaseEmailMixin):
     def query_options(self):
         return self.fixture.query_options if self.fixture else tuple()
 
+    def unsent_query(self, query):
+        """
+        Narrows a query for this email's model down to the instances which
+        match this email's SQL `query` conditions and haven't already been
+        sent this email, so only those candidates are loaded from the DB.
+        """
+        model_class = self.model_class
+        return query.filter(
+            not_(exists().where(and_(
+                Email.fk_id == model_class.id,
+                Email.automated_email_id == self.id))),
+            *self.query).options(*self.query_options)
+
     @property
     def is_html(self):
         return self.format == 'html'
@@ -290,12 +313,19 @@ class AutomatedEmail(MagModel, BaseEmailMixin):
         self.currently_sending = False
         return self
 
+    @cached_property
+    def static_renderable_data(self):
+        """
+        The parts of this email's template context which are the same for
+        every recipient, built once rather than once per render.
+        """
+        return renderable_data(dict(self.fixture.extra_data) if self.fixture else {})
+
     def renderable_data(self, model_instance):
         model_name = getattr(model_instance, 'email_model_name', model_instance.__class__.__name__.lower())
         data = {model_name: model_instance}
-        if self.fixture:
-            data.update(self.fixture.extra_data)
-        return renderable_data(data)
+        data.update(self.static_renderable_data)
+        return data
 
     def render_body(self, model_instance):
         return self.render_template(self.body, self.renderable_data(model_instance))
@@ -305,24 +335,35 @@ class AutomatedEmail(MagModel, BaseEmailMixin):
 
     def render_template(self, text, data):
         with request_cached_context(clear_cache_on_start=True):
-            return JinjaEnv.env().from_string(text).render(data)
+            return compile_template(text).render(data)
+
+    def render_email(self, model_instance):
+        """
+        Renders this email for the given model instance, returning the keyword
+        arguments to pass to send_email.
+        """
+        data = self.renderable_data(model_instance)
+        with request_cached_context(clear_cache_on_start=True):
+            subject = compile_template(self.subject).render(data)
+            body = compile_template(self.body).render(data)
+        return {
+            'sender': self.sender,
+            'to': model_instance.email_to_address,
+            'subject': subject,
+            'body': body,
+            'format': self.format,
+            'model': model_instance.to_dict('id'),
+            'cc': self.cc or model_instance.cc_emails_for_ident(self.ident),
+            'bcc': self.bcc or model_instance.bcc_emails_for_ident(self.ident),
+            'ident': self.ident,
+            'automated_email': self.to_dict('id'),
+        }
 
     def send_to(self, model_instance, delay=True, raise_errors=False):
         try:
             from uber.tasks.email import send_email
-            data = self.renderable_data(model_instance)
             send_func = send_email.delay if delay else send_email
-            send_func(
-                self.sender,
-                model_instance.email_to_address,
-                self.render_template(self.subject, data),
-                self.render_template(self.body, data),
-                self.format,
-                model=model_instance.to_dict('id'),
-                cc=self.cc or model_instance.cc_emails_for_ident(self.ident),
-                bcc=self.bcc or model_instance.bcc_emails_for_ident(self.ident),
-                ident=self.ident,
-                automated_email=self.to_dict('id'))
+            send_func(**self.render_email(model_instance))
             return True
         except Exception:
             log.error('Error sending {!r} email to {}', self.subject, model_instance.email_to_address, exc_info=True)
@@ -343,6 +384,10 @@ class Email(MagModel, BaseEmailMixin):
     to = Column(UnicodeText)
     when = Column(UTCDateTime, default=lambda: datetime.now(UTC))
 
+    __table_args__ = (
+        Index('ix_email_automated_email_id_fk_id', automated_email_id, fk_id),
+    )
+
     @cached_property
     def fk(self):
         return self.session.query(self.model_class).filter_by(id=self.fk_id).first() \
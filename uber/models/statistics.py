@@ -0,0 +1,132 @@
+from datetime import date, datetime
+
+from pytz import UTC
+from residue import UTCDateTime
+from sqlalchemy import func
+from sqlalchemy.types import Date, Integer
+
+from uber.config import c
+from uber.models import MagModel
+from uber.models.attendee import Attendee
+from uber.models.group import Group
+from uber.models.promo_code import PromoCode
+from uber.models.types import DefaultColumn as Column
+
+
+__all__ = ['DailyRegistrationCount']
+
+
+def _as_date(value):
+    # SQLite's date() returns a string rather than a date
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+class DailyRegistrationCount(MagModel):
+    """
+    A persisted per-day rollup of paid registrations, so registration graphs
+    can read one small table instead of re-aggregating every attendee and
+    promo code group on each page view. Rows are kept up to date by
+    scheduled tasks calling refresh().
+    """
+    day = Column(Date, unique=True)
+    registrations = Column(Integer, default=0)
+    computed = Column(UTCDateTime, nullable=True, default=None)
+
+    @staticmethod
+    def live_counts(session, days=None):
+        """
+        Returns a dict mapping each day to the number of paid registrations
+        taken that day, counting attendees who paid for themselves, paid
+        group members (excluding dealers), and paid promo code groups.
+        If days is given, only those days are counted.
+        """
+        attendee_day = func.date(Attendee.registered)
+        attendee_counts = session.query(attendee_day, func.count(Attendee.id)) \
+            .outerjoin(Attendee.group) \
+            .filter(
+                (
+                    (Attendee.group_id != None) &  # noqa: E711
+                    (Attendee.paid == c.PAID_BY_GROUP) &  # if they're paid by group
+                    (Group.tables == 0) &                 # make sure they aren't dealers
+                    (Group.amount_paid > 0)               # make sure they've paid something
+                ) | (                                     # OR
+                    (Attendee.paid == c.HAS_PAID)         # if they're an attendee, make sure they're fully paid
+                )
+            )
+
+        group_day = func.date(PromoCode.group_registered)
+        group_counts = session.query(group_day, func.count(PromoCode.id)).filter(PromoCode.cost > 0)
+
+        if days is not None:
+            day_strings = [day.isoformat() for day in days]
+            attendee_counts = attendee_counts.filter(attendee_day.in_(day_strings))
+            group_counts = group_counts.filter(group_day.in_(day_strings))
+
+        counts = {}
+        for query, day in [(attendee_counts, attendee_day), (group_counts, group_day)]:
+            for registered, count in query.group_by(day):
+                if registered:
+                    registered = _as_date(registered)
+                    counts[registered] = counts.get(registered, 0) + count
+        return counts
+
+    @classmethod
+    def by_day(cls, session):
+        """
+        Returns a dict mapping each day to its paid registration count,
+        falling back to counting live if the rollup hasn't been built yet.
+        """
+        rows = session.query(cls.day, cls.registrations).all()
+        if not rows:
+            return cls.live_counts(session)
+        return {day: registrations for day, registrations in rows if registrations}
+
+    @classmethod
+    def touched_days(cls, session, since):
+        """
+        Returns the registration days of every attendee and promo code
+        updated after the given time.
+        """
+        attendee_days = session.query(func.date(Attendee.registered)).filter(Attendee.last_updated > since)
+        group_days = session.query(func.date(PromoCode.group_registered)).filter(PromoCode.last_updated > since)
+        return {_as_date(day) for day, in attendee_days.union(group_days) if day}
+
+    @classmethod
+    def refresh(cls, session, full=False):
+        """
+        Recomputes the days touched since the last refresh, or every day if
+        full is set or nothing has been computed yet, and returns how many
+        days were written.
+
+        Deleted registrations and attendees whose registration date changes
+        leave no trace on the day they used to count towards, so a periodic
+        full refresh is still needed to correct those days.
+        """
+        run_started = datetime.now(UTC)
+        watermark = None if full else session.query(func.max(cls.computed)).scalar()
+
+        if watermark is None:
+            days = None
+        else:
+            days = cls.touched_days(session, watermark)
+            if not days:
+                return 0
+
+        counts = cls.live_counts(session, days)
+        existing = session.query(cls)
+        if days is not None:
+            existing = existing.filter(cls.day.in_(days))
+        rows = {row.day: row for row in existing}
+        if days is None:
+            days = set(counts) | set(rows)
+
+        for day in days:
+            row = rows.get(day)
+            if not row:
+                row = cls(day=day)
+                session.add(row)
+            row.registrations = counts.get(day, 0)
+            row.computed = run_started
+
+        session.commit()
+        return len(days)
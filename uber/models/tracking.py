@@ -11,7 +11,7 @@ from sqlalchemy.ext import associationproxy
 
 from pockets.autolog import log
 from residue import CoerceUTF8 as UnicodeText, UTCDateTime, UUID
-from sqlalchemy import Sequence
+from sqlalchemy import Sequence, func
 from sqlalchemy.types import Boolean, Integer
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.ext.mutable import MutableDict
@@ -22,8 +22,11 @@ from uber.config import c
 from uber.decorators import presave_adjustment
 from uber.models import MagModel
 from uber.models.admin import AdminAccount
+from uber.models.badge_printing import PrintJob
 from uber.models.email import Email
+from uber.models.statistics import DailyRegistrationCount
 from uber.models.types import Choice, DefaultColumn as Column, MultiChoice, utcnow
+from uber.payments import SpinTerminalRequest
 
 __all__ = ['PageViewTracking', 'ReportTracking', 'Tracking', 'TxnRequestTracking']
 
@@ -152,7 +155,7 @@ class Tracking(MagModel):
     def differences(cls, instance):
         diff = {}
         for attr, column in instance.__table__.columns.items():
-            if attr in ['last_updated', 'last_synced', 'inventory_updated', 'unapproved_count']:
+            if attr in ['last_updated', 'last_synced', 'inventory_updated', 'unapproved_count', 'search_text']:
                 continue
 
             if attr in ['currently_sending', 'last_send_time']:
@@ -198,13 +201,16 @@ class Tracking(MagModel):
                 diff[attr] = "'{} -> {}'".format(old_val_repr, new_val_repr)
         return diff
 
+    @classmethod
+    def current_who(cls):
+        if sys.argv == ['']:
+            return 'server admin'
+        return AdminAccount.admin_or_volunteer_name() or (current_thread().name if current_thread().daemon else 'non-admin')
+
     @classmethod
     def track_collection_change(cls, action, target, instance):
         from uber.models import Session
-        if sys.argv == ['']:
-            who = 'server admin'
-        else:
-            who = AdminAccount.admin_or_volunteer_name() or (current_thread().name if current_thread().daemon else 'non-admin')
+        who = cls.current_who()
 
         with Session() as session:
             session.add(Tracking(
@@ -219,13 +225,35 @@ class Tracking(MagModel):
             ))
 
     @classmethod
-    def track(cls, action, instance):
-        from uber.models import AutomatedEmail
+    def serialize_snapshot(cls, instance):
+        try:
+            return json.dumps(instance.to_dict(), cls=serializer)
+        except TypeError as e:
+            return "(Could not save JSON dump due to error: {}".format(e)
 
+    @classmethod
+    def request_snapshot(cls, instance):
+        """
+        Saves a full snapshot of `instance` with the next change tracked for
+        it, regardless of TRACKING_SNAPSHOT_INTERVAL.
+        """
+        if instance.session:
+            instance.session.info.setdefault('tracking_snapshots', set()).add(instance.id)
+
+    @classmethod
+    def track(cls, action, instance):
+        """
+        Records a change to `instance`. Only the changed values are computed
+        here; unless the instance is being deleted or a snapshot was
+        requested, the row is queued on the instance's session and inserted
+        along with the rest of the session's tracking after it commits, see
+        record() and insert_batch().
+        """
         if action in [c.CREATED, c.UNPAID_PREREG, c.EDITED_PREREG]:
             vals = {
                 attr: cls.repr(column, getattr(instance, attr))
-                for attr, column in instance.__table__.columns.items()}
+                for attr, column in instance.__table__.columns.items()
+                if getattr(instance, attr) not in [None, '']}
             data = cls.format(vals)
         elif action == c.UPDATED:
             diff = cls.differences(instance)
@@ -243,35 +271,98 @@ class Tracking(MagModel):
             and 'creator' not in str(column)
             and getattr(instance, name))
 
-        if sys.argv == ['']:
-            who = 'server admin'
+        row = {
+            'model': instance.__class__.__name__,
+            'fk_id': instance.id,
+            'which': repr(instance),
+            'who': cls.current_who(),
+            'supervisor': AdminAccount.supervisor_name() or '',
+            'page': c.PAGE_PATH,
+            'links': links,
+            'action': action,
+            'data': data,
+            'when': datetime.now(UTC),
+        }
+
+        session = instance.session
+        requested = session.info.get('tracking_snapshots', set()) if session else set()
+        # Deleted rows can't be snapshotted later, and undo_delete needs their snapshot
+        if action == c.DELETED or instance.id in requested:
+            requested.discard(instance.id)
+            row['snapshot'] = cls.serialize_snapshot(instance)
+
+        if not session:
+            from uber.models import Session
+            with Session() as session:
+                session.add(Tracking(**row))
+        elif instance.__class__ in cls.IMMEDIATE:
+            session.add(Tracking(**row))
         else:
-            who = AdminAccount.admin_or_volunteer_name() or (current_thread().name if current_thread().daemon else 'non-admin')
+            session.info.setdefault('pending_tracking', []).append(row)
 
+    @classmethod
+    def record(cls, rows):
+        """
+        Hands rows queued by track() to a background task for insert_batch(),
+        or inserts them right away if the task can't be queued.
+        """
+        from uber.tasks.tracking import record_tracking
+
+        rows = [dict(row, when=row['when'].isoformat()) for row in rows]
         try:
-            snapshot = json.dumps(instance.to_dict(), cls=serializer)
-        except TypeError as e:
-            snapshot = "(Could not save JSON dump due to error: {}".format(e)
+            record_tracking.delay(rows)
+        except Exception:
+            log.error('Unable to queue {} tracking rows, inserting them now', len(rows), exc_info=True)
+            record_tracking(rows)
 
-        def _insert(session):
-            session.add(Tracking(
-                model=instance.__class__.__name__,
-                fk_id=instance.id,
-                which=repr(instance),
-                who=who,
-                supervisor=AdminAccount.supervisor_name() or '',
-                page=c.PAGE_PATH,
-                links=links,
-                action=action,
-                data=data,
-                snapshot=snapshot,
-            ))
-        if instance.session:
-            _insert(instance.session)
-        else:
-            from uber.models import Session
-            with Session() as session:
-                _insert(session)
+    @classmethod
+    def insert_batch(cls, session, rows):
+        """
+        Bulk inserts tracking rows queued by track(). Rows without a snapshot
+        get one if they're the first, or every TRACKING_SNAPSHOT_INTERVAL'th,
+        change tracked for their instance. These snapshots are taken now, so
+        they show the instance as it is when the batch is inserted.
+        """
+        from uber.models import Session
+
+        interval = c.TRACKING_SNAPSHOT_INTERVAL
+        tracked_counts = {}
+        unsnapshotted_ids = {row['fk_id'] for row in rows if 'snapshot' not in row}
+        if interval and unsnapshotted_ids:
+            tracked_counts = dict(session.query(cls.fk_id, func.count(cls.id)).filter(
+                cls.fk_id.in_(unsnapshotted_ids)).group_by(cls.fk_id))
+
+        trackings = []
+        for row in rows:
+            row = dict(row, when=datetime.fromisoformat(row['when']))
+            if interval and 'snapshot' not in row:
+                count = tracked_counts.get(row['fk_id'], 0)
+                tracked_counts[row['fk_id']] = count + 1
+                if count % interval == 0:
+                    instance = session.query(Session.resolve_model(row['model'])).get(row['fk_id'])
+                    if instance:
+                        row['snapshot'] = cls.serialize_snapshot(instance)
+            trackings.append(cls(**row))
+        return session.bulk_insert(trackings)
+
+    @classmethod
+    def track_badge_shift(cls, session, attendee, badge_type, start, until, shift):
+        """
+        Records a single entry for a whole range of badge numbers being
+        shifted because of a change to `attendee`'s badge, instead of one
+        entry with a full snapshot for every shifted attendee.
+        """
+        session.add(Tracking(
+            model=attendee.__class__.__name__,
+            fk_id=attendee.id,
+            which=repr(attendee),
+            who=cls.current_who(),
+            supervisor=AdminAccount.supervisor_name() or '',
+            page=c.PAGE_PATH,
+            action=c.AUTO_BADGE_SHIFT,
+            data="badge_type={}, badge_num='{} - {}', shift={:+d}".format(
+                c.BADGES.get(badge_type, badge_type), start, until, shift),
+        ))
 
 
 class TxnRequestTracking(MagModel):
@@ -290,9 +381,11 @@ class TxnRequestTracking(MagModel):
     @presave_adjustment
     def log_internal_error(self):
         if self.internal_error and not self.orig_value_of('internal_error'):
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id,
-                               'last_error',
-                               self.internal_error)
+            SpinTerminalRequest.set_terminal_status(self.terminal_id, last_error=self.internal_error)
+
 
+Tracking.UNTRACKED = [Tracking, Email, PageViewTracking, ReportTracking, TxnRequestTracking,
+                      DailyRegistrationCount]
 
-Tracking.UNTRACKED = [Tracking, Email, PageViewTracking, ReportTracking, TxnRequestTracking]
+# Print jobs are ordered by their Tracking rows, so these are inserted in the same transaction as the change
+Tracking.IMMEDIATE = [PrintJob]
@@ -1,8 +1,10 @@
 import checkdigit.verhoeff as verhoeff
+import json
 import pytz
 from discord_webhook import DiscordWebhook
 from typing import Iterable
 from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from dateutil.parser import parse
 from uuid import uuid4
@@ -14,6 +16,7 @@ import stripe
 from authorizenet import apicontractsv1, apicontrollers
 from pockets import cached_property, classproperty, is_listy, listify
 from pockets.autolog import log
+from sqlalchemy.orm.attributes import set_committed_value
 
 import uber
 from uber.config import c
@@ -832,6 +835,50 @@ class SpinTerminalRequest(TransactionRequest):
     def get_or_create_customer(self, customer_id=''):
         self.customer_id = ''
 
+    @staticmethod
+    def terminal_status_key(terminal_id):
+        return c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id
+
+    @staticmethod
+    def terminal_status_channel(terminal_id):
+        return c.REDIS_PREFIX + 'spin_terminal_status:' + terminal_id
+
+    @staticmethod
+    def sale_queue_key():
+        return c.REDIS_PREFIX + 'spin_terminal_sales'
+
+    @classmethod
+    def queue_sale(cls, **kwargs):
+        """
+        Queues a sale for the terminal gateway (see uber/terminal_gateway.py), which takes the same arguments as
+        the process_terminal_sale task.
+        """
+        c.REDIS_STORE.rpush(cls.sale_queue_key(), json.dumps(kwargs))
+
+    @classmethod
+    def set_terminal_status(cls, terminal_id, **fields):
+        """
+        Saves fields to a terminal's status and publishes the names of the fields that changed, so reg stations
+        waiting on the terminal can check its status right away instead of polling for it.
+        """
+        with c.REDIS_STORE.pipeline() as pipe:
+            pipe.hset(cls.terminal_status_key(terminal_id), mapping=fields)
+            pipe.publish(cls.terminal_status_channel(terminal_id), ','.join(fields))
+            pipe.execute()
+
+    @classmethod
+    @contextmanager
+    def terminal_status_updates(cls, terminal_id):
+        """
+        Subscribes to a terminal's status updates for the duration of a with block.
+        """
+        pubsub = c.REDIS_STORE.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(cls.terminal_status_channel(terminal_id))
+            yield pubsub
+        finally:
+            pubsub.close()
+
     @property
     def base_request(self):
         return spin_rest_utils.base_request(self.terminal_id, self.auth_key)
@@ -881,17 +928,12 @@ class SpinTerminalRequest(TransactionRequest):
         return spin_rest_utils.api_response_successful(response_json)
 
     def log_api_response(self, response_json):
-        import json
-
         if self.api_response_successful(response_json):
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id,
-                               'last_response', json.dumps(response_json))
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id,
-                               'last_error', '')
+            self.set_terminal_status(self.terminal_id, last_response=json.dumps(response_json), last_error='')
         else:
             error_message = self.error_message_from_response(response_json)
             log.error(f"Error while processing terminal sale for transaction {self.tracking_id}: {error_message}")
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id, 'last_error', error_message)
+            self.set_terminal_status(self.terminal_id, last_error=error_message)
 
     def process_sale_response(self, session, response):
         from uber.models import ReceiptTransaction
@@ -917,7 +959,7 @@ class SpinTerminalRequest(TransactionRequest):
         if self.capture_signature and not spin_rest_utils.signature_from_response(response_json) \
                 and spin_rest_utils.insecure_entry_type(response_json):
             error_message = "Signature was skipped so transaction was voided. Please retry payment"
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id, 'last_error', error_message)
+            self.set_terminal_status(self.terminal_id, last_error=error_message)
             self.tracker.internal_error = error_message
 
             void_response = self.send_void_txn()
@@ -948,14 +990,13 @@ class SpinTerminalRequest(TransactionRequest):
 
         approval_amount = Decimal(str(spin_rest_utils.approved_amount(response_json))) * 100  # don't @ me
         if approval_amount != self.amount and abs(approval_amount - self.amount) > 5:
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id,
-                               'last_error', "Partial approval")
+            self.set_terminal_status(self.terminal_id, last_error="Partial approval")
 
         matching_txns = session.query(ReceiptTransaction).filter_by(intent_id=intent_id).all()
         if not matching_txns:
             error_message = "Payment was successful, but did not have any matching transactions"
             log.error(f"Error while processing terminal sale for transaction {self.tracking_id}: {error_message}")
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id, 'last_error', error_message)
+            self.set_terminal_status(self.terminal_id, last_error=error_message)
             return
 
         running_total = approval_amount
@@ -1148,7 +1189,7 @@ class SpinTerminalRequest(TransactionRequest):
                     if error:
                         payment_error = error
                     else:
-                        c.REDIS_STORE.delete(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id)
+                        c.REDIS_STORE.delete(self.terminal_status_key(terminal_id))
 
                         process_terminal_sale(reg_station_id,
                                               terminal_id,
@@ -1156,8 +1197,7 @@ class SpinTerminalRequest(TransactionRequest):
                                               description=f"Payment for partial refund of transaction {txn.charge_id}",
                                               amount=txn.txn_total - refund_amount)
 
-                        payment_error = c.REDIS_STORE.hget(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id,
-                                                           'last_error')
+                        payment_error = c.REDIS_STORE.hget(self.terminal_status_key(terminal_id), 'last_error')
                     if payment_error:
                         refund_error = f"Void successful, but partial re-payment failed: {payment_error}"
             else:
@@ -1215,6 +1255,60 @@ class SpinTerminalRequest(TransactionRequest):
         return f"R{server_digit}{year_digits}{txn_tracker.incr_id}{verhoeff.calculate(str(txn_tracker.incr_id))}"
 
 
+class ReceiptPreview:
+    """
+    Calculates the receipt items for a set of changes to a model. Changes are applied to a preview copy of the
+    model, and each cost change function from the model's receipt_changes is run at most once for each state of
+    that preview. Columns that share a function, like a group's cost and auto_recalc, therefore don't add the
+    same item twice, and asking for a column's changes again without changing the preview costs nothing.
+    """
+    def __init__(self, model, receipt=None, who=''):
+        self.model = model
+        self.receipt = receipt
+        self.who = who
+        self.new_model = ReceiptManager.preview_model(model)
+        self.version = 0
+        self._calculated = {}
+
+    def set(self, name, value):
+        setattr(self.new_model, name, value)
+        self.version += 1
+
+    def promo_code_changes(self, code):
+        """
+        Applies a promo code to the preview and returns its receipt items. The code is looked up in the model's
+        own session, or a new one for models that aren't in a session, and attached without firing its backref
+        so the preview never shows up in PromoCode.used_by.
+        """
+        from uber.models import Session
+
+        if self.model.session is not None:
+            return self._promo_code_changes(self.model.session, code)
+        with Session() as session:
+            return self._promo_code_changes(session, code)
+
+    def _promo_code_changes(self, session, code):
+        code = code.strip() if code else ''
+        promo_code = session.lookup_promo_code(code) if code else None
+        set_committed_value(self.new_model, 'promo_code', promo_code)
+        self.set('promo_code_id', promo_code.id if promo_code else None)
+        return self.changes('promo_code_code')
+
+    def changes(self, col_name):
+        """
+        Returns the receipt items for col_name's cost change function, or an empty list if that function has
+        already been run against the preview's current state.
+        """
+        cost_change_func, category = self.model.receipt_changes.get(col_name, (None, None))
+        key = (cost_change_func, self.version)
+        if key in self._calculated:
+            return []
+
+        self._calculated[key] = ReceiptManager.process_receipt_change(
+            self.model, col_name, self.new_model, self.receipt, who=self.who) or []
+        return self._calculated[key]
+
+
 class ReceiptManager:
     def __init__(self, receipt=None, **params):
         self.receipt = receipt
@@ -1446,14 +1540,27 @@ class ReceiptManager:
         else:
             return [(cost_desc, cost_change, count)]
 
+    @staticmethod
+    def preview_model(model):
+        """
+        Returns a transient copy of a model's column values, to apply changes to when calculating receipt items.
+        This is much cheaper than a round-trip through to_dict(), which also collects every plain class attribute.
+        Like a to_dict() copy, the preview has no relationships loaded.
+        """
+        preview = model.__class__()
+        for column in model.__table__.columns:
+            setattr(preview, column.key, getattr(model, column.key))
+        return preview
+
     @classmethod
     def auto_update_receipt(self, model, receipt, params, who=''):
-        from uber.models import Attendee, Group, Session
+        from uber.models import Attendee, Group
         if not receipt:
             return []
 
         receipt_items = []
-        new_model = model.__class__(**model.to_dict())
+        preview = ReceiptPreview(model, receipt, who=who)
+        new_model = preview.new_model
 
         model_overridden_price = getattr(model, 'overridden_price', None)
         overridden_unset = model_overridden_price and (params.get('no_override'))
@@ -1462,8 +1569,9 @@ class ReceiptManager:
 
         if overridden_unset or auto_recalc_set:
             # We process this a little differently since the full default cost
-            # relies on non-dict-able properties, like groups' # of badges
-            old_model = model.__class__(**model.to_dict())
+            # relies on non-dict-able properties, like groups' # of badges.
+            # Nothing has been applied to the preview yet, so it doubles as a copy of the old model.
+            old_model = new_model
 
             if overridden_unset:
                 revert_change = {'overridden_price': model.overridden_price}
@@ -1488,26 +1596,23 @@ class ReceiptManager:
                             receipt_items += [receipt_item]
 
         if not params.get('no_override') and params.get('overridden_price', None) not in [None, '']:
-            new_model.overridden_price = int(params.get('overridden_price') or 0)
-            items = self.process_receipt_change(model, 'overridden_price', new_model, receipt, who=who)
-            return items if items else []
+            preview.set('overridden_price', int(params.get('overridden_price') or 0))
+            return preview.changes('overridden_price')
         elif params.get('no_override'):
             params.pop('overridden_price')
 
         if not params.get('auto_recalc') and isinstance(model, Group):
-            new_model.cost = int(params.get('cost') or 0)
-            new_model.auto_recalc = False
-            items = self.process_receipt_change(model, 'cost', new_model, receipt, who=who)
-            return items if items else []
+            preview.set('cost', int(params.get('cost') or 0))
+            preview.set('auto_recalc', False)
+            return preview.changes('cost')
         else:
             params.pop('cost', None)
 
         if params.get('power_fee', None) is not None and c.POWER_PRICES.get(int(params.get('power'), 0),
                                                                             None) is None:
-            new_model.power_fee = int(params.get('power_fee') or 0)
-            new_model.power = int(params.get('power') or 0)
-            items = self.process_receipt_change(model, 'power_fee', new_model, receipt, who=who)
-            receipt_items += items if items else []
+            preview.set('power_fee', int(params.get('power_fee') or 0))
+            preview.set('power', int(params.get('power') or 0))
+            receipt_items += preview.changes('power_fee')
             params.pop('power')
             params.pop('power_fee')
 
@@ -1520,34 +1625,23 @@ class ReceiptManager:
                 coerced_val = model.coerce_column_data(column, val)
                 if coerced_val != getattr(model, key, None):
                     changed_params.append(key)
-                    setattr(new_model, key, coerced_val)
+                    preview.set(key, coerced_val)
             if key in ['promo_code_code']:
                 if val != getattr(model, key, None):
-                    setattr(new_model, 'promo_code', None)
-                    with Session() as session:
-                        session.add_promo_code_to_attendee(new_model, val)
-                        items = self.process_receipt_change(model, key, new_model, receipt, who=who)
-                        if items:
-                            for receipt_item in items:
-                                if receipt_item.amount != 0:
-                                    receipt_items += [receipt_item]
+                    receipt_items += [item for item in preview.promo_code_changes(val) if item.amount != 0]
 
         if isinstance(model, Group):
             # "badges" is a property and not a column, so we have to include it explicitly
             maybe_badges_update = params.get('badges', None)
             if maybe_badges_update is not None and maybe_badges_update != model.badges:
-                setattr(new_model, 'badges_update', int(maybe_badges_update))
+                preview.set('badges_update', int(maybe_badges_update))
                 changed_params.append('badges')
 
         if isinstance(model, Attendee) and (model.qualifies_for_discounts != new_model.qualifies_for_discounts):
             changed_params.append('birthdate')
 
         for param in changed_params:
-            items = self.process_receipt_change(model, param, new_model, receipt, who=who)
-            if items:
-                for receipt_item in items:
-                    if receipt_item.amount != 0:
-                        receipt_items += [receipt_item]
+            receipt_items += [item for item in preview.changes(param) if item.amount != 0]
 
         return receipt_items
 
@@ -1,9 +1,15 @@
+from itertools import groupby
+
+from sqlalchemy import and_, case, cast, func, Integer, literal, or_, select, union_all
+
 from uber.barcode import generate_barcode_from_badge_num
 from uber.config import c
 from uber.models.attendee import Attendee
+from uber.models.department import Department, Job, Shift
 
 
-__all__ = ['PersonalizedBadgeReport', 'PrintedBadgeReport', 'ReportBase']
+__all__ = ['OverworkedAttendeesReport', 'PersonalizedBadgeReport', 'PrintedBadgeReport', 'ReportBase',
+           'ShiftRunReport']
 
 
 class ReportBase:
@@ -62,3 +68,139 @@ class PrintedBadgeReport(ReportBase):
 
         for badge_num in range(min_badge_num, max_badge_num):
             self.write_row(['', badge_num, self._badge_type_name, empty_customized_name, ''], out)
+
+
+def _epoch_minute(column):
+    """Whole minutes since the Unix epoch for a timestamp column."""
+    if c.SQLALCHEMY_URL.startswith('sqlite'):
+        seconds = cast(func.strftime('%s', column), Integer)
+    else:
+        seconds = cast(func.extract('epoch', column), Integer)
+    return seconds / 60
+
+
+class ShiftRunReport(ReportBase):
+    """
+    Merges each attendee's shifts into runs of back-to-back or overlapping
+    work entirely in SQL, so reports about consecutive hours never have to
+    load attendees or expand their shifts minute by minute.
+
+    This is the usual "gaps and islands" query: a shift starts a new run
+    when it begins after every earlier shift of that attendee has ended,
+    and a running sum of those run starts numbers the runs.
+    """
+    _include_badge_nums = False
+
+    def __init__(self, *filters):
+        self._filters = filters
+
+    def shifts(self, session):
+        start_minute = _epoch_minute(Job.start_time)
+        return session.query(
+            Shift.id.label('shift_id'),
+            Shift.attendee_id.label('attendee_id'),
+            Job.start_time.label('start_time'),
+            start_minute.label('start_minute'),
+            (start_minute + Job.duration).label('end_minute'),
+            Department.name.label('department_name'),
+            Department.max_consecutive_minutes.label('max_consecutive_minutes'),
+        ).join(Job, Shift.job_id == Job.id) \
+         .join(Department, Job.department_id == Department.id) \
+         .join(Attendee, Shift.attendee_id == Attendee.id) \
+         .filter(*self._filters).subquery('shifts')
+
+    def numbered_shifts(self, session):
+        """
+        Every shift, tagged with the run it belongs to.  Two shifts are in the
+        same run if one starts no later than the other ends.
+        """
+        shifts = self.shifts(session)
+        ordering = dict(partition_by=shifts.c.attendee_id,
+                        order_by=(shifts.c.start_minute, shifts.c.end_minute, shifts.c.shift_id))
+        latest_prior_end = func.max(shifts.c.end_minute).over(rows=(None, -1), **ordering)
+        starts_run = case([(or_(latest_prior_end == None, shifts.c.start_minute > latest_prior_end), 1)],  # noqa: E711
+                          else_=0)
+        flagged = select([shifts, starts_run.label('starts_run')]).subquery('flagged_shifts')
+
+        ordering = dict(partition_by=flagged.c.attendee_id,
+                        order_by=(flagged.c.start_minute, flagged.c.end_minute, flagged.c.shift_id))
+        run = func.sum(flagged.c.starts_run).over(rows=(None, 0), **ordering)
+        return select([flagged, run.label('run')]).subquery('numbered_shifts')
+
+    def runs(self, session, numbered=None):
+        """
+        One row per run of consecutive work, with its start, its length in
+        minutes, and the strictest positive department limit it falls under.
+        """
+        numbered = self.numbered_shifts(session) if numbered is None else numbered
+        return select([
+            numbered.c.attendee_id,
+            numbered.c.run,
+            func.min(numbered.c.start_time).label('start_time'),
+            func.min(numbered.c.start_minute).label('start_minute'),
+            func.max(numbered.c.end_minute).label('end_minute'),
+            (func.max(numbered.c.end_minute) - func.min(numbered.c.start_minute)).label('minutes'),
+            func.min(func.nullif(numbered.c.max_consecutive_minutes, 0)).label('max_consecutive_minutes'),
+        ]).group_by(numbered.c.attendee_id, numbered.c.run).subquery('shift_runs')
+
+    def overworked(self, session, default_limit=1000):
+        """
+        Yields (attendee_id, display_name, start_time, minutes, departments)
+        for every run longer than the strictest limit of the departments it
+        covers, or longer than default_limit if none of them set one.  The
+        departments listed are the ones whose own limit was exceeded.
+        """
+        numbered = self.numbered_shifts(session)
+        runs = self.runs(session, numbered)
+        limit = case([(runs.c.max_consecutive_minutes < default_limit, runs.c.max_consecutive_minutes)],
+                     else_=default_limit)
+
+        rows = session.query(
+            runs.c.attendee_id, Attendee.display_name, runs.c.run, runs.c.start_time, runs.c.minutes,
+            numbered.c.department_name,
+            func.min(func.nullif(numbered.c.max_consecutive_minutes, 0)),
+        ).join(numbered, and_(numbered.c.attendee_id == runs.c.attendee_id, numbered.c.run == runs.c.run)) \
+         .join(Attendee, Attendee.id == runs.c.attendee_id) \
+         .filter(runs.c.minutes > limit) \
+         .group_by(runs.c.attendee_id, Attendee.display_name, runs.c.run, runs.c.start_time, runs.c.minutes,
+                   numbered.c.department_name) \
+         .order_by(Attendee.display_name, runs.c.attendee_id, runs.c.start_time, numbered.c.department_name) \
+         .yield_per(500)
+
+        for (attendee_id, display_name, _, start_time, minutes), dept_rows in groupby(
+                rows, key=lambda row: tuple(row[:5])):
+            departments = [name for (*_, name, dept_limit) in dept_rows if dept_limit and minutes > dept_limit]
+            yield attendee_id, display_name, start_time, minutes, departments
+
+    def attendees_over_threshold(self, session, window_starts, window_minutes, threshold_minutes):
+        """
+        Returns the ids of attendees who work at least threshold_minutes
+        strictly inside any of the windows beginning at window_starts and
+        lasting window_minutes.  Runs never overlap, so summing their
+        overlap with a window never counts a minute twice.
+        """
+        if not window_starts:
+            return set()
+
+        windows = union_all(*[
+            select([literal(int(start.timestamp()) // 60 + 1).label('low'),
+                    literal(int(start.timestamp()) // 60 + window_minutes).label('high')])
+            for start in window_starts]).subquery('windows')
+        runs = self.runs(session)
+
+        overlap_end = case([(runs.c.end_minute < windows.c.high, runs.c.end_minute)], else_=windows.c.high)
+        overlap_start = case([(runs.c.start_minute > windows.c.low, runs.c.start_minute)], else_=windows.c.low)
+        rows = session.query(runs.c.attendee_id) \
+            .join(windows, and_(runs.c.start_minute < windows.c.high, runs.c.end_minute > windows.c.low)) \
+            .group_by(runs.c.attendee_id, windows.c.low) \
+            .having(func.sum(overlap_end - overlap_start) >= threshold_minutes)
+        return {attendee_id for attendee_id, in rows}
+
+
+class OverworkedAttendeesReport(ShiftRunReport):
+    """Generate a CSV file of every shift sequence longer than its departments allow"""
+    def run(self, out, session):
+        out.writerow(["Attendee name", "Start of overworked shift sequence",
+                      "Length of shift sequence", "Departments overworked in"])
+        for _, display_name, start_time, minutes, departments in self.overworked(session):
+            self.write_row([display_name, start_time.astimezone(c.EVENT_TIMEZONE), minutes] + departments, out)
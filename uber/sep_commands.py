@@ -239,3 +239,16 @@ def process_api_queue():
     results = timed(process_api_queue)()
     for job_name, count in results.items():
         print('Processed {} API job(s) with ident "{}"'.format(count, job_name))
+
+
+@entry_point
+def terminal_gateway():
+    from uber.terminal_gateway import main
+    Session.initialize_db(initialize=True)
+    main()
+
+
+@entry_point
+def fake_spin_proxy():
+    from uber.fake_spin_proxy import main
+    main()
@@ -1,13 +1,12 @@
 import cherrypy
 from sqlalchemy.orm import subqueryload
-from datetime import timedelta
 
-from uber.config import c
 from uber.custom_tags import pluralize, yesno, readable_join
 from uber.decorators import all_renderable, ajax, check_dept_admin, csrf_protected, csv_file, department_id_adapter, \
     requires_dept_admin, site_mappable
 from uber.errors import HTTPRedirect
 from uber.models import AdminAccount, Attendee, Department, DeptMembership, DeptRole, Shift
+from uber.reports import OverworkedAttendeesReport
 from uber.utils import check
 
 
@@ -217,39 +216,7 @@ class Root:
 
     @csv_file
     def overworked_attendees(self, out, session):
-        def single_sequence(attendee, start_minute, minute_map):
-            all_depts_limit = 1000
-            minutes_worked = 0
-            current_minute = start_minute
-            while current_minute in minute_map:
-                dept_limit = minute_map[current_minute].max_consecutive_minutes
-                if dept_limit > 0:
-                    all_depts_limit = min(all_depts_limit, dept_limit)
-                minutes_worked += 1
-                current_minute = current_minute + timedelta(minutes=1)
-
-            if minutes_worked > all_depts_limit:
-                # reiterate over to gather department names
-                current_minute = start_minute
-                departments_overworked = set()
-                while current_minute in minute_map:
-                    dept_limit = minute_map[current_minute].max_consecutive_minutes
-                    if dept_limit > 0 and minutes_worked > dept_limit:
-                        departments_overworked.add(minute_map[current_minute].department_name)
-                    current_minute = current_minute + timedelta(minutes=1)
-                out.writerow([attendee.display_name,
-                              start_minute.astimezone(c.EVENT_TIMEZONE),
-                              minutes_worked] +
-                             list(departments_overworked))
-
-        out.writerow(["Attendee name", "Start of overworked shift sequence",
-                      "Length of shift sequence", "Departments overworked in"])
-        for attendee in session.query(Attendee).filter(Attendee.staffing == True).all():  # noqa: E712
-            minute_map = attendee.shift_minute_map
-            for start_minute in minute_map:
-                # only look at start-of-sequence minutes
-                if start_minute - timedelta(minutes=1) not in minute_map:
-                    single_sequence(attendee, start_minute, minute_map)
+        OverworkedAttendeesReport(Attendee.staffing == True).run(out, session)  # noqa: E712
 
     @department_id_adapter
     def role(self, session, department_id=None, message='', **params):
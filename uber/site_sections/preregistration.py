@@ -941,7 +941,7 @@ class Root:
                 model = session.get_model_by_receipt(receipt)
 
             if model and not txn.charge_id:
-                new_model = model.__class__(**model.to_dict())
+                new_model = ReceiptManager.preview_model(model)
                 session.add(model)
                 for item in txn.receipt_items:
                     for col_name in item.revert_change:
@@ -1954,7 +1954,7 @@ class Root:
         if not params.get('col_name'):
             return {'error': "Can't calculate cost change without the column name"}
 
-        preview_attendee = Attendee(**attendee.to_dict())
+        preview_attendee = ReceiptManager.preview_model(attendee)
         new_val = params.get('val')
 
         column = preview_attendee.__table__.columns.get(params['col_name'])
@@ -83,7 +83,7 @@ def check_custom_receipt_item_txn(params, is_txn=False):
 def revert_receipt_item(session, item):
     receipt = item.receipt
     model = session.get_model_by_receipt(receipt)
-    new_model = model.__class__(**model.to_dict())
+    new_model = ReceiptManager.preview_model(model)
     for col_name in item.revert_change:
         setattr(new_model, col_name, item.revert_change[col_name])
 
@@ -1173,14 +1173,14 @@ class Root:
 
         search_text = search_text.strip()
         if search_text:
-            attendees, error = session.search(search_text) if invalid else session.search(search_text, filter)
+            search_results, error = session.search(search_text, order=order) if invalid \
+                else session.search(search_text, filter, order=order)
 
         if error:
             raise HTTPRedirect('../registration/index?search_text={}&order={}&invalid={}&message={}'
                                ).format(search_text, order, invalid, error)
-        attendees = attendees.order(order)
 
-        rows = devtools.prepare_model_export(Attendee, filtered_models=attendees)
+        rows = devtools.prepare_model_export(Attendee, filtered_models=search_results.query)
         for row in rows:
             out.writerow(row)
 
@@ -64,10 +64,11 @@ class Root:
         else:
             filter = Attendee.is_valid == True  # noqa: E712
 
-        attendees = session.query(Attendee).filter(
-            filter).join(Attendee.active_receipt).outerjoin(ModelReceipt.receipt_items).group_by(
-                ModelReceipt.id).group_by(Attendee.id).having(
-                    Attendee.default_cost_cents != ModelReceipt.fkless_item_total_sql)
+        totals = ModelReceipt.totals_subquery(session, 'Attendee')
+        attendees = session.query(
+            Attendee, totals.c.item_total, totals.c.payment_total, totals.c.refund_total
+            ).join(totals, Attendee.id == totals.c.owner_id).filter(
+                filter, Attendee.default_cost_cents != totals.c.fkless_item_total)
 
         return {
             'attendees': attendees,
@@ -76,22 +77,19 @@ class Root:
 
     @log_pageview
     def attendees_nonzero_balance(self, session, include_no_receipts=False, include_discrepancies=False):
-        item_subquery = session.query(ModelReceipt.owner_id, ModelReceipt.item_total_sql.label('item_total')
-                                      ).join(ModelReceipt.receipt_items).group_by(ModelReceipt.owner_id).subquery()
+        totals = ModelReceipt.totals_subquery(session, 'Attendee')
 
         if include_discrepancies:
             filter = True
         else:
-            filter = Attendee.default_cost_cents == item_subquery.c.item_total
+            filter = Attendee.default_cost_cents == totals.c.item_total
 
         attendees_and_totals = session.query(
-            Attendee, ModelReceipt.payment_total_sql, ModelReceipt.refund_total_sql, item_subquery.c.item_total
-            ).filter(Attendee.is_valid == True).join(Attendee.active_receipt).outerjoin(
-                ModelReceipt.receipt_txns).join(item_subquery, Attendee.id == item_subquery.c.owner_id).group_by(
-                    ModelReceipt.id).group_by(Attendee.id).group_by(item_subquery.c.item_total).having(
-                        and_((ModelReceipt.payment_total_sql - ModelReceipt.refund_total_sql) != item_subquery.c.item_total,
-                             filter))
-        
+            Attendee, totals.c.payment_total, totals.c.refund_total, totals.c.item_total
+            ).join(totals, Attendee.id == totals.c.owner_id).filter(
+                Attendee.is_valid == True,  # noqa: E712
+                and_(totals.c.payment_total - totals.c.refund_total != totals.c.item_total, filter))
+
         if include_no_receipts:
             attendees_no_receipts = session.query(Attendee).outerjoin(
                 ModelReceipt, Attendee.active_receipt).filter(Attendee.default_cost > 0, ModelReceipt.id == None)
@@ -4,6 +4,7 @@ import os
 import pytz
 import re
 import shutil
+import time
 from datetime import datetime, timedelta
 from functools import wraps
 from io import BytesIO
@@ -42,6 +43,39 @@ def check_atd(func):
     return checking_at_the_door
 
 
+def terminal_payment_result(session, terminal_id):
+    """
+    Returns the result of the last payment sent to a terminal, or None if it hasn't finished yet.
+    """
+    import uber.spin_rest_utils as spin_rest_utils
+
+    terminal_status = c.REDIS_STORE.hgetall(SpinTerminalRequest.terminal_status_key(terminal_id))
+    error_message = terminal_status.get('last_error', '')
+    intent_id = terminal_status.get('intent_id', '')
+    response = json.loads(terminal_status.get('last_response')) if terminal_status.get('last_response') else {}
+
+    if error_message:
+        if intent_id and not response:
+            matching_txns = session.query(ReceiptTransaction).filter_by(intent_id=intent_id)
+            for txn in matching_txns:
+                txn.cancelled = datetime.now()
+                session.add(txn)
+            session.commit()
+        custom_error = spin_rest_utils.better_error_message(error_message, response, terminal_id, format_currency)
+        if custom_error:
+            custom_error['intent_id'] = intent_id
+            return custom_error
+        return {'error': error_message, 'intent_id': intent_id}
+    elif response:
+        if not intent_id:
+            return {
+                'error': "We could not find which payment this transaction was for. "
+                "You may need a manager to log it manually."
+                }
+        c.REDIS_STORE.hset(SpinTerminalRequest.terminal_status_key(terminal_id), 'recorded', "true")
+        return {'success': True, 'intent_id': intent_id}
+
+
 def load_attendee(session, params):
     id = params.get('id', None)
 
@@ -103,33 +137,35 @@ class Root:
         filter = [Attendee.badge_status.in_(status_list)] if not invalid else []
         total_count = session.query(Attendee.id).filter(*filter).count()
         count = 0
+        page = int(page)
         search_text = search_text.strip()
+        search_results = None
         if search_text:
-            search_results, message = session.search(search_text, *filter)
-            if search_results and search_results.count():
-                attendees = search_results
-                count = attendees.count()
+            page = page or 1
+            search_results, message = session.search(search_text, *filter, order=order, limit=100 * page)
+            if search_results:
+                count = search_results.count
                 if count == total_count:
                     message = 'Every{} attendee matched this search.'.format('' if invalid else ' valid')
             elif not message:
                 message = 'No matches found.{}'.format(
                     '' if invalid else ' Try showing all badges to expand your search.')
         if not count:
+            search_results = None
             attendees = session.index_attendees().filter(*filter)
             count = attendees.count()
+            attendees = attendees.order(order)
 
-        attendees = attendees.order(order)
-
-        page = int(page)
-        if search_text:
-            page = page or 1
-            if count == 1 and not c.AT_THE_CON and not c.BADGE_PICKUP_ENABLED:
-                raise HTTPRedirect(
-                    'form?id={}&message={}', attendees.one().id,
-                    'This attendee was the only{} search result'.format('' if invalid else ' valid'))
+        if search_text and count == 1 and not c.AT_THE_CON and not c.BADGE_PICKUP_ENABLED:
+            raise HTTPRedirect(
+                'form?id={}&message={}', search_results.ids[0] if search_results else attendees.one().id,
+                'This attendee was the only{} search result'.format('' if invalid else ' valid'))
 
         pages = range(1, int(math.ceil(count / 100)) + 1)
-        attendees = attendees[-100 + 100*page: 100*page] if page else []
+        if search_results:
+            attendees = search_results.page(page)
+        else:
+            attendees = attendees[-100 + 100*page: 100*page] if page else []
 
         return {
             'message':        message if isinstance(message, str) else message[-1],
@@ -308,12 +344,16 @@ class Root:
                 group = session.group(model_id)
                 description = f"At-door payment for {group.name}"
 
-        c.REDIS_STORE.delete(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id)
-        process_terminal_sale.delay(workstation_num=cherrypy.session.get('reg_station'),
-                                    terminal_id=terminal_id,
-                                    model_id=model_id,
-                                    pickup_group_id=pickup_group_id,
-                                    description=description)
+        c.REDIS_STORE.delete(SpinTerminalRequest.terminal_status_key(terminal_id))
+        sale = dict(workstation_num=cherrypy.session.get('reg_station'),
+                    terminal_id=terminal_id,
+                    model_id=model_id,
+                    pickup_group_id=pickup_group_id,
+                    description=description)
+        if c.SPIN_TERMINAL_GATEWAY:
+            SpinTerminalRequest.queue_sale(**sale)
+        else:
+            process_terminal_sale.delay(**sale)
         return {'success': True}
 
     def check_txn_status(self, session, intent_id='', **params):
@@ -343,7 +383,7 @@ class Root:
         if error:
             return {'success': False, 'message': error}
 
-        terminal_status = c.REDIS_STORE.hgetall(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id)
+        terminal_status = c.REDIS_STORE.hgetall(SpinTerminalRequest.terminal_status_key(terminal_id))
         if not terminal_status:
             return {'success': False, 'message': f"No pending terminal transactions found."}
         
@@ -389,9 +429,9 @@ class Root:
                     session.add(tracker)
                     session.commit()
                     prior_error = terminal_status.get('last_error')
-                    c.REDIS_STORE.hset(
-                        c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id,
-                        'last_error', "The last transaction was not processed by the terminal, \
+                    SpinTerminalRequest.set_terminal_status(
+                        terminal_id,
+                        last_error="The last transaction was not processed by the terminal, \
                             either because it was cancelled or due to the following error: "
                             + prior_error)
         
@@ -407,37 +447,41 @@ class Root:
 
     @ajax
     def poll_terminal_payment(self, session, **params):
-        import uber.spin_rest_utils as spin_rest_utils
         error, terminal_id = session.get_assigned_terminal_id()
 
         if error:
             return {'error': error}
 
-        terminal_status = c.REDIS_STORE.hgetall(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id)
-        error_message = terminal_status.get('last_error', '')
-        intent_id = terminal_status.get('intent_id', '')
-        response = json.loads(terminal_status.get('last_response')) if terminal_status.get('last_response') else {}
-
-        if error_message:
-            if intent_id and not response:
-                matching_txns = session.query(ReceiptTransaction).filter_by(intent_id=intent_id)
-                for txn in matching_txns:
-                    txn.cancelled = datetime.now()
-                    session.add(txn)
-                session.commit()
-            custom_error = spin_rest_utils.better_error_message(error_message, response, terminal_id, format_currency)
-            if custom_error:
-                custom_error['intent_id'] = intent_id
-                return custom_error
-            return {'error': error_message, 'intent_id': intent_id}
-        elif response:
-            if not intent_id:
-                return {
-                    'error': "We could not find which payment this transaction was for. "
-                    "You may need a manager to log it manually."
-                    }
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id, 'recorded', "true")
-            return {'success': True, 'intent_id': intent_id}
+        return terminal_payment_result(session, terminal_id)
+
+    @ajax
+    def wait_for_terminal_payment(self, session, **params):
+        """
+        Returns the same result as poll_terminal_payment, but waits up to c.SPIN_TERMINAL_STATUS_WAIT seconds
+        for the terminal's status to change if its payment isn't finished yet, so stations don't have to keep
+        polling. Returns {'pending': True} if the payment still isn't finished by then.
+        """
+        error, terminal_id = session.get_assigned_terminal_id()
+
+        if error:
+            return {'error': error}
+
+        # Don't hold on to this station's session lock while we wait, or its other requests would wait with us.
+        # Nothing here changes the session, so skip saving it too, which could clobber those requests' changes.
+        if cherrypy.session.locked:
+            cherrypy.session.release_lock()
+        cherrypy.session.loaded = False
+
+        # Hand our database connection back to the pool while we wait
+        session.commit()
+        deadline = time.monotonic() + c.SPIN_TERMINAL_STATUS_WAIT
+        with SpinTerminalRequest.terminal_status_updates(terminal_id) as updates:
+            while True:
+                result = terminal_payment_result(session, terminal_id)
+                remaining = deadline - time.monotonic()
+                if result or remaining <= 0:
+                    return result or {'pending': True}
+                updates.get_message(timeout=remaining)
 
     def promo_code_groups(self, session, message=''):
         groups = session.query(PromoCodeGroup).order_by(PromoCodeGroup.name).all()
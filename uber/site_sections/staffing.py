@@ -9,21 +9,9 @@ from uber.config import c
 from uber.custom_tags import safe_string
 from uber.decorators import ajax, ajax_gettable, all_renderable, check_shutdown, csrf_protected, render, public
 from uber.errors import HTTPRedirect
-from uber.models import Attendee, Job, Shift
-from uber.utils import check_csrf, create_valid_user_supplied_redirect_url, ensure_csrf_token_exists, localized_now, extract_urls
-
-
-def _convert_urls(desc):
-    urls = extract_urls(desc)
-    if not urls:
-        return desc
-
-    for url in urls:
-        new_url = url
-        if not url.startswith('http'):
-            new_url = 'https://' + url
-        desc = desc.replace(url, f'<a href="{new_url}" target="_blank">{url}</a>')
-    return desc
+from uber.models import Attendee, Job, JobSignupFeed, Shift
+from uber.utils import check_csrf, create_valid_user_supplied_redirect_url, ensure_csrf_token_exists, localized_now, \
+    linkify_urls
 
 
 @all_renderable()
@@ -273,31 +261,21 @@ class Root:
         event_list = []
 
         for job in joblist:
+            # Jobs for signups come with their shifts and department already loaded
+            event = JobSignupFeed.cached_event(job)
+            taken = job.slots_taken
             resource_id = job.department_id
             bg_color = "#0d6efd"
             if job.is_public and job.department_id not in assigned_dept_ids:
                 resource_id = "public"
                 bg_color = "#0dcaf0"
-            if highlight and len(job.shifts) == 0:
+            if highlight and taken == 0:
                 bg_color = "#dc3545"
-            event_list.append({
-                'id': job.id,
-                'resourceIds': [resource_id],
-                'allDay': False,
-                'start': job.start_time_local.isoformat(),
-                'end': job.end_time_local.isoformat(),
-                'title': f"{job.name}",
-                'backgroundColor': bg_color,
-                'extendedProps': {
-                    'department_name': job.department_name,
-                    'desc': _convert_urls(job.description),
-                    'desc_text': job.description,
-                    'weight': job.weight,
-                    'slots': f"{job.slots_taken}/{job.slots}",
-                    'is_public': job.is_public,
-                    'assigned': False,
-                    }
-            })
+            event_list.append(dict(
+                event,
+                resourceIds=[resource_id],
+                backgroundColor=bg_color,
+                extendedProps=dict(event['extendedProps'], slots=f"{taken}/{job.slots}", assigned=False)))
         return event_list
     
     @ajax_gettable
@@ -321,7 +299,7 @@ class Root:
                 'backgroundColor': '#198754',
                 'extendedProps': {
                     'department_name': job.department_name,
-                    'desc': _convert_urls(job.description),
+                    'desc': linkify_urls(job.description),
                     'desc_text': job.description,
                     'weight': job.weight,
                     'slots': f"{job.slots_taken}/{job.slots}",
@@ -1,13 +1,13 @@
 import os
 import re
 from collections import defaultdict, OrderedDict
-from datetime import timedelta
 
 from sqlalchemy.orm import subqueryload
 
 from uber.config import c
 from uber.decorators import all_renderable, csv_file, render
 from uber.models import Attendee, Department
+from uber.reports import ShiftRunReport
 
 
 def volunteer_checklists(session):
@@ -139,16 +139,13 @@ class Root:
         return {'flagged': flagged}
 
     def consecutive_threshold(self, session):
-        def exceeds_threshold(start_time, attendee):
-            time_slice = (start_time, start_time + timedelta(hours=18))
-            return len([h for h in attendee.shift_minutes if time_slice[0] < h < time_slice[1]]) >= 13 * 60
+        overworked_ids = ShiftRunReport(Attendee.staffing == True).attendees_over_threshold(  # noqa: E712
+            session, [start_time for start_time, desc in c.START_TIME_OPTS[::6]], 18 * 60, 13 * 60)
         flagged = []
-        for attendee in session.staffers():
-            if attendee.staffing and attendee.unweighted_hours >= 12:
-                for start_time, desc in c.START_TIME_OPTS[::6]:
-                    if exceeds_threshold(start_time, attendee):
-                        flagged.append(attendee)
-                        break
+        if overworked_ids:
+            for attendee in session.staffers().filter(Attendee.id.in_(overworked_ids)):
+                if attendee.unweighted_hours >= 12:
+                    flagged.append(attendee)
         return {'flagged': flagged}
 
     def setup_teardown_neglect(self, session):
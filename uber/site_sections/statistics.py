@@ -1,17 +1,16 @@
 from collections import Counter, defaultdict, OrderedDict
 from datetime import timedelta
+from itertools import accumulate
 
 from geopy.distance import geodesic
 from pockets.autolog import log
-import six
-from sqlalchemy import func
-from sqlalchemy.orm import joinedload
+from sqlalchemy import and_, case, func
 from sqlalchemy.sql.expression import literal
 
 from uber.config import c
 from uber.decorators import ajax, all_renderable, csv_file, not_site_mappable
 from uber.jinja import JinjaEnv
-from uber.models import Attendee, Department, Group, PromoCode
+from uber.models import Attendee, DailyRegistrationCount, Department, DeptMembership, FoodRestrictions, Group
 
 
 @JinjaEnv.jinja_filter
@@ -48,61 +47,18 @@ class RegistrationDataOneYear:
         # TODO: we're hacking the timezone info out of ESCHATON (final day of event). probably not the right thing to do
         self.end_date = c.DATES['ESCHATON'].replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
 
-        def date_trunc_day(*args, **kwargs):
-            # sqlite doesn't support date_trunc
-            if c.SQLALCHEMY_URL.startswith('sqlite'):
-                return func.date(*args, **kwargs)
-            else:
-                return func.date_trunc(literal('day'), *args, **kwargs)
-
-        # return registrations where people actually paid money
-        # exclude: dealers
-        reg_per_day = session.query(
-                date_trunc_day(Attendee.registered),
-                func.count(date_trunc_day(Attendee.registered))
-            ) \
-            .outerjoin(Attendee.group) \
-            .filter(
-                (
-                    (Attendee.group_id != None) &  # noqa: E711
-                    (Attendee.paid == c.PAID_BY_GROUP) &  # if they're paid by group
-                    (Group.tables == 0) &                 # make sure they aren't dealers
-                    (Group.amount_paid > 0)               # make sure they've paid something
-                ) | (                                     # OR
-                    (Attendee.paid == c.HAS_PAID)         # if they're an attendee, make sure they're fully paid
-                )
-            ) \
-            .group_by(date_trunc_day(Attendee.registered)) \
-            .order_by(date_trunc_day(Attendee.registered)) \
-            .all()  # noqa: E711
-
-        group_reg_per_day = session.query(
-            date_trunc_day(PromoCode.group_registered),
-            func.count(date_trunc_day(PromoCode.group_registered))
-            ).filter(PromoCode.cost > 0) \
-             .group_by(date_trunc_day(PromoCode.group_registered)) \
-             .order_by(date_trunc_day(PromoCode.group_registered)).all()
-
-        # now, convert the query's data into the format we need.
-        # SQL will skip days without registrations
+        # return registrations where people actually paid money, excluding dealers, from the daily rollup
+        reg_per_day = DailyRegistrationCount.by_day(session)
+
+        # now, convert the rollup's data into the format we need.
+        # days without registrations are skipped
         # we need all self.num_days_to_report days to have data, even if it's zero
 
         # create 365 elements in the final array
         self.registrations_per_day = self.num_days_to_report * [0]
 
-        # merge attendee and promo code group reg
-        total_reg_per_day = defaultdict(int)
-        for k, v in dict(reg_per_day).items():
-            if not k:
-                continue
-            total_reg_per_day[k] += v
-        for k, v in dict(group_reg_per_day).items():
-            if not k:
-                continue
-            total_reg_per_day[k] += v
-
-        for day, reg_count in total_reg_per_day.items():
-            day_offset = self.num_days_to_report - (self.end_date - day).days
+        for day, reg_count in reg_per_day.items():
+            day_offset = self.num_days_to_report - (self.end_date.date() - day).days
             day_index = day_offset - 1
 
             if day_index < 0 or day_index >= self.num_days_to_report:
@@ -149,51 +105,174 @@ class RegistrationDataOneYear:
         }
 
 
+def _add_count(counter, label, count):
+    if label:
+        counter[label] = counter.get(label, 0) + count
+
+
+def _choice_label(choices, val):
+    # Mirrors the _label suffix property for a value read straight from a Choice column
+    if not val:
+        return ''
+    if val == -1:
+        return 'Unknown'
+    return choices.get(val, '')
+
+
+def _multichoice_ints(choices, val):
+    return [int(i) for i in str(val or '').split(',') if i and int(i) in choices]
+
+
+def _attendee_counts(session):
+    """
+    Builds the counts shown on the statistics index page with a handful of
+    grouped aggregate queries instead of loading every attendee. MultiChoice
+    columns are grouped by their stored value and split afterwards, since
+    there are far fewer distinct combinations than attendees.
+    """
+    counts = defaultdict(OrderedDict)
+    counts['donation_tiers'] = OrderedDict([(k, 0) for k in sorted(c.DONATION_TIERS.keys()) if k > 0])
+
+    counts.update({
+        'groups': {'paid': 0, 'free': 0},
+        'noshows': {'paid': 0, 'free': 0},
+        'checked_in': {'yes': 0, 'no': 0}
+    })
+    count_labels = {
+        'badges': c.BADGE_OPTS,
+        'paid': c.PAYMENT_OPTS,
+        'ages': c.AGE_GROUP_OPTS,
+        'ribbons': c.RIBBON_OPTS,
+        'interests': c.INTEREST_OPTS,
+        'statuses': c.BADGE_STATUS_OPTS,
+        'checked_in_by_type': c.BADGE_OPTS,
+    }
+    for label, opts in count_labels.items():
+        for val, desc in opts:
+            counts[label][desc] = 0
+
+    badge_counts = dict(session.query(Attendee.badge_type, func.count(Attendee.id)).filter(
+        Attendee.paid != c.NOT_PAID,
+        Attendee.has_badge == True  # noqa: E712
+    ).group_by(Attendee.badge_type))
+    badge_stocks = c.BADGE_PRICES['stocks']
+    for var in c.BADGE_VARS:
+        badge_type = getattr(c, var)
+        counts['badge_stocks'][c.BADGES[badge_type]] = badge_stocks.get(var.lower(), 'no limit set')
+        counts['badge_counts'][c.BADGES[badge_type]] = badge_counts.get(badge_type, 0)
+
+    for status, count in session.query(Attendee.badge_status, func.count(Attendee.id)).group_by(Attendee.badge_status):
+        _add_count(counts['statuses'], _choice_label(c.BADGE_STATUS, status), count)
+
+    valid = Attendee.badge_status.notin_([c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS,
+                                          c.REFUNDED_STATUS])
+
+    shirt_counts = dict(session.query(Attendee.shirt, func.count(Attendee.id)).filter(valid)
+                        .group_by(Attendee.shirt))
+    for shirt_enum_key, name in c.SHIRT_OPTS:
+        counts['shirt_counts'][name] = shirt_counts.get(shirt_enum_key, 0)
+
+    for column, key, choices in [(Attendee.ribbon, 'ribbons', c.RIBBONS),
+                                 (Attendee.interests, 'interests', c.INTERESTS)]:
+        for val, count in session.query(column, func.count(Attendee.id)).filter(valid).group_by(column):
+            for i in _multichoice_ints(choices, val):
+                _add_count(counts[key], choices[i], count)
+
+    # None for attendees not paid by a group, otherwise whether their group has paid anything
+    group_paid = case([(and_(Attendee.paid == c.PAID_BY_GROUP, Group.id != None),  # noqa: E711
+                        case([(func.coalesce(Group.amount_paid, 0) != 0, 1)], else_=0))], else_=None)
+    tiers = list(counts['donation_tiers'].keys())
+    tier = case([(Attendee.amount_extra >= amount, amount) for amount in reversed(tiers)], else_=None) \
+        if tiers else literal(None)
+    breakdown = session.query(
+        Attendee.paid.label('paid'),
+        Attendee.badge_type.label('badge_type'),
+        Attendee.age_group.label('age_group'),
+        case([(Attendee.checked_in != None, 1)], else_=0).label('checked_in'),  # noqa: E711
+        group_paid.label('group_paid'),
+        tier.label('tier'),
+    ).outerjoin(Attendee.group).filter(valid).subquery()
+
+    columns = [breakdown.c.paid, breakdown.c.badge_type, breakdown.c.age_group, breakdown.c.checked_in,
+               breakdown.c.group_paid, breakdown.c.tier]
+    for paid, badge_type, age_group, checked_in, group_paid, tier, count in session.query(
+            *columns, func.count()).group_by(*columns):
+        badge_type_label = _choice_label(c.BADGES, badge_type)
+        _add_count(counts['paid'], _choice_label(c.PAYMENTS, paid), count)
+        _add_count(counts['ages'], _choice_label(c.AGE_GROUPS, age_group), count)
+        _add_count(counts['badges'], badge_type_label, count)
+        counts['checked_in']['yes' if checked_in else 'no'] += count
+        if checked_in:
+            _add_count(counts['checked_in_by_type'], badge_type_label, count)
+        if group_paid is not None:
+            counts['groups']['paid' if group_paid else 'free'] += count
+        if tier is not None:
+            counts['donation_tiers'][tier] += count
+        if not checked_in:
+            counts['noshows']['paid' if paid == c.HAS_PAID or group_paid else 'free'] += count
+
+    return counts
+
+
+def _stay_date_range(session, *filters):
+    min_date, max_date = session.query(func.min(Attendee.arrival_date), func.max(Attendee.departure_date)) \
+        .filter(*filters).one()
+    if min_date is None:
+        return []
+    return [min_date + timedelta(days=i) for i in range((max_date - min_date).days + 1)]
+
+
+def _daily_headcounts(first_day, num_days, stays):
+    """
+    Turns (arrival_date, departure_date, count) rows into a headcount for
+    each day from first_day, counting everyone from their arrival up to but
+    not including their departure. Each stay only marks the days it starts
+    and ends in a difference array, and a running sum fills in the rest.
+    """
+    diff = [0] * (num_days + 1)
+    for arrival, departure, count in stays:
+        start, end = (arrival - first_day).days, (departure - first_day).days
+        if start < end:
+            diff[start] += count
+            diff[end] -= count
+    return list(accumulate(diff[:num_days]))
+
+
 def _dietary_counts(session):
     valid_statuses = [c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS, c.REFUNDED_STATUS]
-    attendees = session.query(Attendee).options(joinedload(Attendee.food_restrictions)).filter(
+    filters = [
         Attendee.badge_status.notin_(valid_statuses),
-        Attendee.arrival_date != None,
-        Attendee.departure_date != None,
-    ).all()
-
-    if not attendees:
+        Attendee.arrival_date != None,  # noqa: E711
+        Attendee.departure_date != None,  # noqa: E711
+    ]
+    date_range = _stay_date_range(session, *filters)
+    if not date_range:
         return None
 
-    min_date = min(a.arrival_date for a in attendees)
-    max_date = max(a.departure_date for a in attendees)
-    date_range = []
-    current = min_date
-    while current <= max_date:
-        date_range.append(current)
-        current += timedelta(days=1)
-
     labels = [c.FOOD_RESTRICTIONS[getattr(c, var)] for var in c.FOOD_RESTRICTION_VARS]
-    day_counts = {d: {label: 0 for label in labels} for d in date_range}
-    totals = {label: 0 for label in labels}
-    totals['total_present'] = 0
-
-    for attendee in attendees:
-        present_days = []
-        day = attendee.arrival_date
-        while day < attendee.departure_date:
-            present_days.append(day)
-            day += timedelta(days=1)
-
-        fr = attendee.food_restrictions
-        for day in present_days:
-            day_counts[day]['total_present'] = day_counts[day].get('total_present', 0) + 1
-            totals['total_present'] += 1
+    stays = defaultdict(list)
+    for arrival, departure, standard, count in session.query(
+            Attendee.arrival_date, Attendee.departure_date, FoodRestrictions.standard, func.count(Attendee.id)
+    ).outerjoin(Attendee.food_restrictions).filter(*filters).group_by(
+            Attendee.arrival_date, Attendee.departure_date, FoodRestrictions.standard):
+        stays['total_present'].append((arrival, departure, count))
+        if standard is not None:
+            # Ask a throwaway FoodRestrictions which restrictions this combination implies
+            fr = FoodRestrictions(standard=standard)
             for var in c.FOOD_RESTRICTION_VARS:
-                label = c.FOOD_RESTRICTIONS[getattr(c, var)]
-                if fr and getattr(fr, var):
-                    day_counts[day][label] += 1
-                    totals[label] += 1
+                if getattr(fr, var):
+                    stays[c.FOOD_RESTRICTIONS[getattr(c, var)]].append((arrival, departure, count))
+
+    by_label = {label: _daily_headcounts(date_range[0], len(date_range), stays[label])
+                for label in labels + ['total_present']}
+    totals = {label: sum(day_counts) for label, day_counts in by_label.items()}
 
     rows = []
-    for d in date_range:
-        row = {'date': d, 'counts': day_counts[d], 'total_present': day_counts[d].get('total_present', 0)}
-        rows.append(row)
+    for i, d in enumerate(date_range):
+        counts = {label: by_label[label][i] for label in labels}
+        if by_label['total_present'][i]:
+            counts['total_present'] = by_label['total_present'][i]
+        rows.append({'date': d, 'counts': counts, 'total_present': by_label['total_present'][i]})
 
     return {
         'dates': date_range,
@@ -205,48 +284,34 @@ def _dietary_counts(session):
 
 def _department_headcounts_by_day(session):
     valid_statuses = [c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS, c.REFUNDED_STATUS]
-    attendees = session.query(Attendee).options(joinedload(Attendee.assigned_depts)).filter(
+    filters = [
         Attendee.badge_status.notin_(valid_statuses),
-        Attendee.arrival_date != None,
-        Attendee.departure_date != None,
-    ).all()
-
-    if not attendees:
+        Attendee.arrival_date != None,  # noqa: E711
+        Attendee.departure_date != None,  # noqa: E711
+    ]
+    date_range = _stay_date_range(session, *filters)
+    if not date_range:
         return None
 
     departments = session.query(Department).order_by(Department.name).all()
 
-    min_date = min(a.arrival_date for a in attendees)
-    max_date = max(a.departure_date for a in attendees)
-    date_range = []
-    current = min_date
-    while current <= max_date:
-        date_range.append(current)
-        current += timedelta(days=1)
+    stays = defaultdict(list)
+    for department_id, arrival, departure, count in session.query(
+            DeptMembership.department_id, Attendee.arrival_date, Attendee.departure_date, func.count(Attendee.id)
+    ).join(DeptMembership, DeptMembership.attendee_id == Attendee.id).filter(*filters).group_by(
+            DeptMembership.department_id, Attendee.arrival_date, Attendee.departure_date):
+        stays[department_id].append((arrival, departure, count))
 
-    counts = {dept.id: {d: 0 for d in date_range} for dept in departments}
-    row_totals = {dept.id: 0 for dept in departments}
     col_totals = {d: 0 for d in date_range}
-
-    for attendee in attendees:
-        present_days = []
-        day = attendee.arrival_date
-        while day < attendee.departure_date:
-            present_days.append(day)
-            day += timedelta(days=1)
-
-        for dept in attendee.assigned_depts:
-            for d in present_days:
-                counts[dept.id][d] += 1
-                row_totals[dept.id] += 1
-                col_totals[d] += 1
-
     rows = []
     for dept in departments:
+        day_counts = _daily_headcounts(date_range[0], len(date_range), stays[dept.id])
+        for d, count in zip(date_range, day_counts):
+            col_totals[d] += count
         rows.append({
             'department': dept.name,
-            'counts': counts[dept.id],
-            'total': row_totals[dept.id],
+            'counts': dict(zip(date_range, day_counts)),
+            'total': sum(day_counts),
         })
 
     return {
@@ -260,70 +325,7 @@ def _department_headcounts_by_day(session):
 @all_renderable()
 class Root:
     def index(self, session):
-        counts = defaultdict(OrderedDict)
-        counts['donation_tiers'] = OrderedDict([(k, 0) for k in sorted(c.DONATION_TIERS.keys()) if k > 0])
-
-        counts.update({
-            'groups': {'paid': 0, 'free': 0},
-            'noshows': {'paid': 0, 'free': 0},
-            'checked_in': {'yes': 0, 'no': 0}
-        })
-        count_labels = {
-            'badges': c.BADGE_OPTS,
-            'paid': c.PAYMENT_OPTS,
-            'ages': c.AGE_GROUP_OPTS,
-            'ribbons': c.RIBBON_OPTS,
-            'interests': c.INTEREST_OPTS,
-            'statuses': c.BADGE_STATUS_OPTS,
-            'checked_in_by_type': c.BADGE_OPTS,
-        }
-        for label, opts in count_labels.items():
-            for val, desc in opts:
-                counts[label][desc] = 0
-        badge_stocks = c.BADGE_PRICES['stocks']
-        for var in c.BADGE_VARS:
-            badge_type = getattr(c, var)
-            counts['badge_stocks'][c.BADGES[badge_type]] = badge_stocks.get(var.lower(), 'no limit set')
-            counts['badge_counts'][c.BADGES[badge_type]] = c.get_badge_count_by_type(badge_type)
-
-        for shirt_enum_key, name in c.SHIRT_OPTS:
-            print('shirt_enum_key:', shirt_enum_key, type(shirt_enum_key))
-            # Count number of attendees with shirt size
-            counts['shirt_counts'][name] = session.query(Attendee).filter(
-                Attendee.shirt == shirt_enum_key,
-                Attendee.badge_status.notin_([c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS,
-                                              c.REFUNDED_STATUS])
-            ).count()
-
-        for a in session.query(Attendee).options(joinedload(Attendee.group)):
-            counts['statuses'][a.badge_status_label] += 1
-
-            if a.badge_status not in [c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS, c.REFUNDED_STATUS]:
-                counts['paid'][a.paid_label] += 1
-                if a.age_group_label:
-                    counts['ages'][a.age_group_label] += 1
-                else:
-                    counts['ages'][c.AGE_GROUPS[c.AGE_UNKNOWN]]
-                for val in a.ribbon_ints:
-                    counts['ribbons'][c.RIBBONS[val]] += 1
-                counts['badges'][a.badge_type_label] += 1
-                counts['checked_in']['yes' if a.checked_in else 'no'] += 1
-                if a.checked_in:
-                    counts['checked_in_by_type'][a.badge_type_label] += 1
-                for val in a.interests_ints:
-                    counts['interests'][c.INTERESTS[val]] += 1
-                if a.paid == c.PAID_BY_GROUP and a.group:
-                    counts['groups']['paid' if a.group.amount_paid else 'free'] += 1
-
-                donation_amounts = list(counts['donation_tiers'].keys())
-                for index, amount in enumerate(donation_amounts):
-                    next_amount = donation_amounts[index + 1] if index + 1 < len(donation_amounts) else six.MAXSIZE
-                    if a.amount_extra >= amount and a.amount_extra < next_amount:
-                        counts['donation_tiers'][amount] = counts['donation_tiers'][amount] + 1
-                if not a.checked_in:
-                    is_paid = a.paid == c.HAS_PAID or a.paid == c.PAID_BY_GROUP and a.group and a.group.amount_paid
-                    key = 'paid' if is_paid else 'free'
-                    counts['noshows'][key] += 1
+        counts = _attendee_counts(session)
 
         return {
             'counts': counts,
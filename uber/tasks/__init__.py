@@ -61,3 +61,4 @@ from uber.tasks import health  # noqa: F401, E402
 from uber.tasks import registration  # noqa: F401, E402
 from uber.tasks import security  # noqa: F401, E402
 from uber.tasks import sms  # noqa: F401, E402
+from uber.tasks import tracking  # noqa: F401, E402
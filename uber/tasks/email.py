@@ -1,16 +1,22 @@
+import json
+from collections import Counter
 from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 import pytz
-from time import sleep, time
+from time import time
 import traceback
+from uuid import uuid4
 
+import redis
 from celery.schedules import crontab
+from dateutil import parser as dateparser
 from pockets import groupify, listify
 from pockets.autolog import log
 from sqlalchemy.orm import joinedload
 
 from uber import utils
-from uber.amazon_ses import email_sender
+from uber.amazon_ses import email_sender, ses_rate_limiter
 from uber.automated_emails import AutomatedEmailFixture
 from uber.config import c
 from uber.decorators import render
@@ -18,7 +24,8 @@ from uber.models import AutomatedEmail, Email, MagModel, Session
 from uber.tasks import celery
 
 
-__all__ = ['notify_admins_of_pending_emails', 'send_automated_emails', 'send_email']
+__all__ = ['notify_admins_of_pending_emails', 'send_automated_emails', 'send_email', 'send_emails_in_batch',
+           'EmailRecorder']
 
 
 celery.on_startup(AutomatedEmail.reconcile_fixtures)
@@ -34,8 +41,7 @@ def _is_dev_email(email):
     return email.endswith('mailinator.com') or email in c.DEVELOPER_EMAIL
 
 
-@celery.task
-def send_email(
+def _deliver(
         sender,
         to,
         subject,
@@ -46,9 +52,16 @@ def send_email(
         replyto=[],
         model=None,
         ident=None,
-        automated_email=None,
-        session=None):
+        automated_email=None):
+    """
+    Sends a single email through SES, waiting on our shared SES rate limit
+    first. This doesn't touch the database, so it's safe to call from a worker
+    thread.
 
+    Returns:
+        Email: An unsaved Email row to record for this email, or None if
+            there's nothing to record.
+    """
     to, cc, bcc = map(lambda x: listify(x if x else []), [to, cc, bcc])
     original_to, original_cc, original_bcc = to, cc, bcc
     ident = ident or subject
@@ -65,6 +78,7 @@ def send_email(
             }
         log.info('Attempting to send email {}', locals())
 
+        ses_rate_limiter.acquire()
         try:
             error_msg = email_sender.sendEmail(
                             source=sender,
@@ -79,12 +93,11 @@ def send_email(
                 record_email = True
         except Exception as error:
             log.error('Error while sending email: {}'.format(str(error)))
-        sleep(0.1)  # Avoid hitting rate limit
     else:
         log.error(f'Email sending turned off, so unable to send {locals()}')
         record_email = True if c.DEV_BOX else False
 
-    if original_to:
+    if original_to and record_email:
         body = body.decode('utf-8') if isinstance(body, bytes) else body
         if isinstance(model, MagModel):
             fk_kwargs = {'fk_id': model.id, 'model': model.__class__.__name__}
@@ -96,28 +109,164 @@ def send_email(
         if automated_email:
             if isinstance(automated_email, MagModel):
                 fk_kwargs['automated_email_id'] = automated_email.id
-            elif isinstance(model, Mapping):
+            elif isinstance(automated_email, Mapping):
                 fk_kwargs['automated_email_id'] = automated_email.get('id', None)
 
-        if record_email:
-            email = Email(
-                subject=subject,
-                body=body,
-                sender=sender,
-                to=','.join(original_to),
-                cc=','.join(original_cc),
-                bcc=','.join(original_bcc),
-                ident=ident,
-                **fk_kwargs)
-
-            session = session or getattr(model, 'session', getattr(automated_email, 'session', None))
-            if session:
+        return Email(
+            subject=subject,
+            body=body,
+            sender=sender,
+            to=','.join(original_to),
+            cc=','.join(original_cc),
+            bcc=','.join(original_bcc),
+            ident=ident,
+            **fk_kwargs)
+
+
+@celery.task
+def send_email(
+        sender,
+        to,
+        subject,
+        body,
+        format='text',
+        cc=(),
+        bcc=(),
+        replyto=[],
+        model=None,
+        ident=None,
+        automated_email=None,
+        session=None):
+
+    email = _deliver(sender, to, subject, body, format, cc, bcc, replyto, model, ident, automated_email)
+
+    if email:
+        session = session or getattr(model, 'session', getattr(automated_email, 'session', None))
+        if session:
+            session.add(email)
+            session.commit()
+        else:
+            with Session() as session:
                 session.add(email)
                 session.commit()
-            else:
-                with Session() as session:
-                    session.add(email)
-                    session.commit()
+
+
+class EmailRecorder:
+    """
+    Buffers the Email rows for sent emails and bulk inserts them every
+    `flush_size` rows or `flush_seconds` seconds, as well as whenever flush()
+    is called or the recorder is used as a context manager and exits.
+
+    Each row is also journaled to Redis as soon as it's added, and removed from
+    the journal once it's been inserted. If a worker dies before flushing, the
+    next EmailRecorder to start inserts the journaled rows before anything else
+    happens, so AutomatedEmail.emails_by_fk_id still knows about those emails
+    and they aren't sent a second time.
+
+    `sent_counts` counts the rows added for each automated email id, i.e. the
+    emails that were actually delivered.
+    """
+    journal_key = c.REDIS_PREFIX + 'email_recorder_journal'
+    journaled_attrs = ['id', 'subject', 'body', 'sender', 'to', 'cc', 'bcc', 'ident', 'model', 'fk_id',
+                       'automated_email_id']
+
+    def __init__(self, session, flush_size=None, flush_seconds=None):
+        self.session = session
+        self.flush_size = flush_size or c.AUTOMATED_EMAIL_BATCH_SIZE
+        self.flush_seconds = flush_seconds or c.AUTOMATED_EMAIL_FLUSH_SECONDS
+        self.pending = []
+        self.sent_counts = Counter()
+        self.last_flush = time()
+
+    def __enter__(self):
+        self.recover()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def add(self, email):
+        email.id = email.id or str(uuid4())
+        email.when = email.when or datetime.now(pytz.UTC)
+        self.pending.append(email)
+        if email.automated_email_id:
+            self.sent_counts[email.automated_email_id] += 1
+
+        data = {attr: getattr(email, attr) for attr in self.journaled_attrs}
+        data['when'] = email.when.isoformat()
+        try:
+            c.REDIS_STORE.hset(self.journal_key, email.id, json.dumps(data))
+        except redis.RedisError as e:
+            log.error('Unable to journal email {} to Redis: {}', email.id, e)
+
+        if len(self.pending) >= self.flush_size or time() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.session.bulk_insert(self.pending)
+            self._clear_journal([email.id for email in self.pending])
+            self.pending = []
+        self.sent_counts = Counter()
+        self.last_flush = time()
+
+    def recover(self):
+        """
+        Inserts any journaled rows left behind by a recorder that never
+        flushed, skipping rows that made it into the database after all.
+        """
+        try:
+            journaled = c.REDIS_STORE.hgetall(self.journal_key)
+        except redis.RedisError as e:
+            log.error('Unable to read the email journal from Redis: {}', e)
+            return
+
+        if not journaled:
+            return
+
+        existing_ids = {id for (id,) in self.session.query(Email.id).filter(Email.id.in_(list(journaled)))}
+        emails = []
+        for id, data in journaled.items():
+            if id not in existing_ids:
+                data = json.loads(data)
+                data['when'] = dateparser.parse(data['when'])
+                emails.append(Email(**data))
+
+        if emails:
+            log.info('Recording {} sent emails left behind by an interrupted run', len(emails))
+            self.session.bulk_insert(emails)
+        self._clear_journal(list(journaled))
+
+    def _clear_journal(self, ids):
+        try:
+            c.REDIS_STORE.hdel(self.journal_key, *ids)
+        except redis.RedisError as e:
+            log.error('Unable to clear emails from the Redis journal: {}', e)
+
+
+def send_emails_in_batch(emails, recorder):
+    """
+    Sends a batch of emails through SES using a bounded pool of threads,
+    handing the Email row for every email that was sent to `recorder`. The
+    threads all wait on the same rate limit as every other worker's sends.
+
+    Args:
+        emails (list): A list of dicts of keyword arguments for send_email.
+        recorder (EmailRecorder): Records the Email rows for sent emails.
+
+    Returns:
+        int: The number of emails that were sent and recorded.
+    """
+    if not emails:
+        return 0
+
+    sent = 0
+    with ThreadPoolExecutor(max_workers=c.SES_MAX_WORKERS) as executor:
+        for email in executor.map(lambda kwargs: _deliver(**kwargs), emails):
+            if email:
+                recorder.add(email)
+                sent += 1
+    return sent
 
 
 @celery.schedule(crontab(hour=6, minute=0, day_of_week=1))
@@ -157,6 +306,20 @@ def notify_admins_of_pending_emails():
         return groupify(pending_emails, 'sender', 'ident')
 
 
+def _load_in_batches(query, model, batch_size):
+    """
+    Yields the instances returned by `query` in batches of `batch_size`.
+
+    We can't use `yield_per` here, since our queries use subqueryload and
+    the sending loop commits between sends, which would close a server-side
+    cursor. Instead we grab just the ids up front and load the full instances
+    (with all their eager-loaded relations) one window of ids at a time.
+    """
+    ids = [id for (id,) in query.with_entities(model.id)]
+    for i in range(0, len(ids), batch_size):
+        yield from query.filter(model.id.in_(ids[i:i + batch_size]))
+
+
 @celery.schedule(timedelta(minutes=5 if c.DEV_BOX else 15))
 def send_automated_emails():
     """
@@ -164,6 +327,10 @@ def send_automated_emails():
     or do not need approval. For each unapproved email that needs approval from
     an admin, the unapproved_count will be updated to indicate the number of
     recepients that _would have_ received the email if it had been approved.
+
+    Each model's instances are loaded once per run and checked against every
+    active automated email for that model, rather than running the model's
+    query once per automated email.
     """
     if not (c.DEV_BOX or c.SEND_EMAILS):
         return None
@@ -172,7 +339,7 @@ def send_automated_emails():
         expiration = timedelta(hours=1)
         quantity_sent = 0
         start_time = time()
-        with Session() as session:
+        with Session() as session, EmailRecorder(session) as recorder:
             active_automated_emails = session.query(AutomatedEmail) \
                 .filter(*AutomatedEmail.filters_for_active) \
                 .options(joinedload(AutomatedEmail.emails)).all()
@@ -181,72 +348,86 @@ def send_automated_emails():
 
             for model, query_func in AutomatedEmailFixture.queries.items():
                 log.debug("Sending automated emails for " + model.__name__)
-                automated_emails = automated_emails_by_model.get(model.__name__, [])
-                log.debug("Found " + str(len(automated_emails)) + " emails for " + model.__name__)
-                for automated_email in automated_emails:
+                automated_emails = []
+                for automated_email in automated_emails_by_model.get(model.__name__, []):
                     if automated_email.currently_sending:
                         log.debug(automated_email.ident + " is marked as currently sending")
                         if automated_email.last_send_time:
                             if (datetime.now(pytz.UTC) - automated_email.last_send_time) < expiration:
                                 # Looks like another thread is still running and hasn't timed out.
                                 continue
+                    automated_emails.append(automated_email)
+
+                log.debug("Found " + str(len(automated_emails)) + " emails for " + model.__name__)
+                if not automated_emails:
+                    continue
+
+                last_send_time = datetime.now(pytz.UTC)
+                for automated_email in automated_emails:
                     automated_email.currently_sending = True
-                    last_send_time = datetime.now(pytz.UTC)
                     automated_email.last_send_time = last_send_time
                     session.add(automated_email)
-                    session.commit()
-                    unapproved_count = 0
+                session.commit()
 
-                    log.debug("Loading instances for " + automated_email.ident)
-                    model_instances = query_func(session)
-                    log.trace("Finished loading instances")
-                    for model_instance in model_instances:
+                unapproved_counts = {automated_email.id: 0 for automated_email in automated_emails}
+
+                # Emails with SQL query conditions only load their own unsent candidates; everything
+                # else shares a single pass over all of the model's instances.
+                passes = [(automated_email.unsent_query(query_func(session)), [automated_email])
+                          for automated_email in automated_emails if automated_email.query]
+                unfiltered_emails = [automated_email for automated_email in automated_emails
+                                     if not automated_email.query]
+                if unfiltered_emails:
+                    passes.append((query_func(session), unfiltered_emails))
+
+                outgoing = []
+                log.debug("Loading instances for " + model.__name__)
+                for query, pass_emails in passes:
+                    for model_instance in _load_in_batches(query, model, c.AUTOMATED_EMAIL_BATCH_SIZE):
                         log.trace("Checking " + str(model_instance.id))
-                        if model_instance.id not in automated_email.emails_by_fk_id:
-                            if automated_email.would_send_if_approved(model_instance):
-                                if automated_email.approved or not automated_email.needs_approval:
-                                    if getattr(model_instance, 'active_receipt', None):
-                                        session.refresh_receipt_and_model(model_instance)
-                                    automated_email.send_to(model_instance, delay=False)
-                                    quantity_sent += 1
-                                else:
-                                    unapproved_count += 1
+                        receipt_refreshed = False
+                        for automated_email in pass_emails:
+                            if model_instance.id in automated_email.emails_by_fk_id:
+                                continue
+                            if not automated_email.would_send_if_approved(model_instance):
+                                continue
+                            if automated_email.approved or not automated_email.needs_approval:
+                                if not receipt_refreshed and getattr(model_instance, 'active_receipt', None):
+                                    session.refresh_receipt_and_model(model_instance)
+                                    receipt_refreshed = True
+                                try:
+                                    outgoing.append(automated_email.render_email(model_instance))
+                                except Exception:
+                                    log.error('Error rendering {!r} email to {}', automated_email.subject,
+                                              model_instance.email_to_address, exc_info=True)
+                            else:
+                                unapproved_counts[automated_email.id] += 1
+
+                        if len(outgoing) >= c.AUTOMATED_EMAIL_BATCH_SIZE:
+                            send_emails_in_batch(outgoing, recorder)
+                            outgoing = []
+
                         if datetime.now(pytz.UTC) - last_send_time > (expiration / 2):
-                            automated_email.last_send_time = datetime.now(pytz.UTC)
-                            session.add(automated_email)
+                            last_send_time = datetime.now(pytz.UTC)
+                            for automated_email in automated_emails:
+                                automated_email.last_send_time = last_send_time
+                                session.add(automated_email)
                             session.commit()
+                send_emails_in_batch(outgoing, recorder)
+                recorder.flush()
+                log.trace("Finished loading instances")
 
-                    automated_email.unapproved_count = unapproved_count
+                for automated_email in automated_emails:
+                    sent = recorder.sent_counts[automated_email.id]
+                    log.debug("Sent {} emails for {}", sent, automated_email.ident)
+                    quantity_sent += sent
+                    automated_email.unapproved_count = unapproved_counts[automated_email.id]
                     automated_email.currently_sending = False
                     session.add(automated_email)
-                    session.commit()
+                session.commit()
 
             log.info("Sent " + str(quantity_sent) + " emails in " + str(time() - start_time) + " seconds")
             return {e.ident: e.unapproved_count for e in active_automated_emails if e.unapproved_count > 0}
     except Exception:
         traceback.print_exc()
 
-        # TODO: Once we finish converting each AutomatedEmailFixture.filter
-        #       into an AutomatedEmailFixture.query, we'll be able to remove
-        #       AutomatedEmailFixture.queries entirely and send our
-        #       automated emails using the code below.
-        #
-        # for automated_email in active_automated_emails:
-        #     model_class = automated_email.model_class or Attendee
-        #     model_instances = session.query(model_class).filter(
-        #         not_(exists().where(and_(
-        #             Email.fk_id == model_class.id,
-        #             Email.automated_email_id == automated_email.id))
-        #         ),
-        #         *automated_email.query
-        #     ).options(*automated_email.query_options)
-        #
-        #     automated_email.unapproved_count = 0
-        #     for model_instance in model_instances:
-        #         if automated_email.would_send_if_approved(model_instance):
-        #             if automated_email.approved or not automated_email.needs_approval:
-        #                 automated_email.send_to(model_instance, delay=False)
-        #             else:
-        #                 automated_email.unapproved_count += 1
-        #
-        # return {e.ident: e.unapproved_count for e in active_automated_emails if e.unapproved_count > 0}
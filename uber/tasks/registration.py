@@ -13,8 +13,8 @@ from sqlalchemy.orm.exc import NoResultFound
 from uber.config import c
 from uber.custom_tags import readable_join
 from uber.decorators import render
-from uber.models import (ApiJob, Attendee, AttendeeAccount, TerminalSettlement, Email, Session, BadgePickupGroup,
-                         ReceiptInfo, ReceiptTransaction)
+from uber.models import (ApiJob, Attendee, AttendeeAccount, DailyRegistrationCount, TerminalSettlement, Email, Group,
+                         Session, BadgePickupGroup, ReceiptInfo, ReceiptTransaction)
 from uber.tasks.email import send_email
 from uber.tasks import celery
 from uber.utils import localized_now, TaskUtils
@@ -23,7 +23,8 @@ from uber.payments import ReceiptManager
 
 __all__ = ['check_duplicate_registrations', 'check_placeholder_registrations', 'check_pending_badges',
            'check_unassigned_volunteers', 'check_near_cap', 'check_missed_stripe_payments', 'process_api_queue',
-           'process_terminal_sale', 'send_receipt_email', 'assign_badge_num', 'create_badge_pickup_groups', 'update_receipt']
+           'process_terminal_sale', 'send_receipt_email', 'assign_badge_num', 'create_badge_pickup_groups', 'update_receipt',
+           'refresh_registration_rollup', 'rebuild_registration_rollup', 'recalculate_default_costs']
 
 
 @celery.task
@@ -37,6 +38,12 @@ def assign_badge_num(attendee_id):
             if not attendee:
                 log.error(f"Timed out when trying to assign a badge number to attendee {attendee_id}!")
                 return
+        # Another process may have numbered this badge while we waited for the badge range
+        session.reserve_badge_range(attendee.badge_type)
+        session.refresh(attendee)
+        if attendee.badge_num:
+            return
+
         attendee.badge_num = session.get_next_badge_num(attendee.badge_type)
         session.add(attendee)
         session.commit()
@@ -170,6 +177,44 @@ def check_near_cap():
                     send_email.delay(c.REPORTS_EMAIL, [c.REGDESK_EMAIL, c.ADMIN_EMAIL], subject, body, model='n/a')
 
 
+@celery.schedule(timedelta(minutes=15))
+def refresh_registration_rollup():
+    with Session() as session:
+        DailyRegistrationCount.refresh(session)
+
+
+@celery.schedule(crontab(minute=30, hour=4))
+def rebuild_registration_rollup():
+    # Deleted registrations never show up as touched, so periodically recount every day
+    with Session() as session:
+        DailyRegistrationCount.refresh(session, full=True)
+
+
+@celery.schedule(crontab(minute=0, hour=5))
+def recalculate_default_costs(batch_size=500):
+    """
+    Attendee.default_cost and auto-recalculated Group.cost are only updated when the attendee or group is saved,
+    so they drift whenever prices change. The receipt discrepancy reports compare these stored costs against
+    receipt totals in SQL, so we recalculate them here and save the ones that changed.
+    """
+    changed = 0
+    with Session() as session:
+        attendee_ids = [id for id, in session.query(Attendee.id).filter(
+            or_(Attendee.is_valid == True, Attendee.badge_status == c.PENDING_STATUS))]  # noqa: E712
+        group_ids = [id for id, in session.query(Group.id).filter(Group.auto_recalc == True)]  # noqa: E712
+
+    for model, ids, column in [(Attendee, attendee_ids, 'default_cost'), (Group, group_ids, 'cost')]:
+        for start in range(0, len(ids), batch_size):
+            with Session() as session:
+                for instance in session.query(model).filter(model.id.in_(ids[start:start + batch_size])):
+                    cost = instance.calc_default_cost()
+                    if getattr(instance, column) != cost:
+                        setattr(instance, column, cost)
+                        changed += 1
+
+    return f"Recalculated {changed} stale default costs."
+
+
 @celery.schedule(timedelta(days=1))
 def invalidate_at_door_badges():
     if not c.POST_CON:
@@ -314,120 +359,133 @@ def close_out_terminals(workstation_and_terminal_ids, who):
             session.commit()
 
 
-@celery.task
-def process_terminal_sale(workstation_num, terminal_id, model_id=None, pickup_group_id=None, **kwargs):
+def prepare_terminal_sale(session, workstation_num, terminal_id, model_id=None, pickup_group_id=None, **kwargs):
+    """
+    Records the transactions for a terminal sale and returns the SpinTerminalRequest to send it with, or None if
+    the sale couldn't be prepared, in which case the error is on its TxnRequestTracking row.
+    """
     from uber.payments import SpinTerminalRequest
     from uber.models import TxnRequestTracking, AdminAccount
 
     message = ''
-    c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id, 'last_request_timestamp',
-                       datetime.now().timestamp())
-
-    with Session() as session:
-        txn_tracker = TxnRequestTracking(workstation_num=workstation_num, terminal_id=terminal_id,
-                                         fk_id=pickup_group_id or model_id,
-                                         who=AdminAccount.admin_name())
-        session.add(txn_tracker)
-        session.commit()
-
-        c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id, 'tracking_id', txn_tracker.id)
-        intent_id = SpinTerminalRequest.intent_id_from_txn_tracker(txn_tracker)
-
-        if pickup_group_id:
-            try:
-                pickup_group = session.badge_pickup_group(pickup_group_id)
-            except NoResultFound:
-                txn_tracker.internal_error = f"Badge pickup group {pickup_group_id} not found!"
-                session.commit()
-                return
+    SpinTerminalRequest.set_terminal_status(terminal_id, last_request_timestamp=datetime.now().timestamp())
+
+    txn_tracker = TxnRequestTracking(workstation_num=workstation_num, terminal_id=terminal_id,
+                                     fk_id=pickup_group_id or model_id,
+                                     who=AdminAccount.admin_name())
+    session.add(txn_tracker)
+    session.commit()
+
+    SpinTerminalRequest.set_terminal_status(terminal_id, tracking_id=txn_tracker.id)
+    intent_id = SpinTerminalRequest.intent_id_from_txn_tracker(txn_tracker)
+
+    if pickup_group_id:
+        try:
+            pickup_group = session.badge_pickup_group(pickup_group_id)
+        except NoResultFound:
+            txn_tracker.internal_error = f"Badge pickup group {pickup_group_id} not found!"
+            session.commit()
+            return
 
-            txn_total = 0
-            attendee_names_list = []
-            receipts = []
-            account_email = ''
-            try:
-                for attendee in pickup_group.pending_paid_attendees:
-                    if attendee.managers and not account_email:
-                        account_email = attendee.primary_account_email
-                    receipt = session.get_receipt_by_model(attendee)
-                    if receipt:
-                        incomplete_txn = receipt.get_last_incomplete_txn()
-                        if incomplete_txn:
-                            incomplete_txn.cancelled = datetime.now()
-                            session.add(incomplete_txn)
-                    else:
-                        receipt = session.get_receipt_by_model(attendee, create_if_none="DEFAULT")
-                        session.add(receipt)
-
-                    if receipt.current_amount_owed:
-                        receipts.append(receipt)
-                        txn_total += receipt.current_amount_owed
-                        attendee_names_list.append(attendee.display_name +
-                                                   (f" ({attendee.badge_printed_name})"
-                                                    if attendee.badge_printed_name else ""))
-            except Exception as e:
-                txn_tracker.internal_error = f"Exception while building at-door group payment: {str(e)}"
-                session.commit()
-                return
+        txn_total = 0
+        attendee_names_list = []
+        receipts = []
+        account_email = ''
+        try:
+            for attendee in pickup_group.pending_paid_attendees:
+                if attendee.managers and not account_email:
+                    account_email = attendee.primary_account_email
+                receipt = session.get_receipt_by_model(attendee)
+                if receipt:
+                    incomplete_txn = receipt.get_last_incomplete_txn()
+                    if incomplete_txn:
+                        incomplete_txn.cancelled = datetime.now()
+                        session.add(incomplete_txn)
+                else:
+                    receipt = session.get_receipt_by_model(attendee, create_if_none="DEFAULT")
+                    session.add(receipt)
+
+                if receipt.current_amount_owed:
+                    receipts.append(receipt)
+                    txn_total += receipt.current_amount_owed
+                    attendee_names_list.append(attendee.display_name +
+                                               (f" ({attendee.badge_printed_name})"
+                                                if attendee.badge_printed_name else ""))
+        except Exception as e:
+            txn_tracker.internal_error = f"Exception while building at-door group payment: {str(e)}"
+            session.commit()
+            return
 
-            # Pickup groups get a custom payment description defined here, so get rid of whatever was passed in
-            kwargs.pop("description", None)
-
-            payment_request = SpinTerminalRequest(terminal_id=terminal_id,
-                                                  receipt_email=account_email,
-                                                  description="At-door registration for "
-                                                  f"{readable_join(attendee_names_list)}",
-                                                  amount=txn_total,
-                                                  tracker=txn_tracker,
-                                                  **kwargs)
-            message = payment_request.create_stripe_intent(intent_id)
-            if message:
-                txn_tracker.internal_error = message
+        # Pickup groups get a custom payment description defined here, so get rid of whatever was passed in
+        kwargs.pop("description", None)
+
+        payment_request = SpinTerminalRequest(terminal_id=terminal_id,
+                                              receipt_email=account_email,
+                                              description="At-door registration for "
+                                              f"{readable_join(attendee_names_list)}",
+                                              amount=txn_total,
+                                              tracker=txn_tracker,
+                                              **kwargs)
+        message = payment_request.create_stripe_intent(intent_id)
+        if message:
+            txn_tracker.internal_error = message
+            session.commit()
+            return
+        for receipt in receipts:
+            receipt_manager = ReceiptManager(receipt)
+            error = receipt_manager.create_payment_transaction(payment_request.description,
+                                                               payment_request.intent,
+                                                               receipt.current_amount_owed,
+                                                               method=c.SQUARE)
+            if error:
+                session.rollback()
+                txn_tracker.internal_error = error
                 session.commit()
                 return
-            for receipt in receipts:
-                receipt_manager = ReceiptManager(receipt)
-                error = receipt_manager.create_payment_transaction(payment_request.description,
-                                                                   payment_request.intent,
-                                                                   receipt.current_amount_owed,
-                                                                   method=c.SQUARE)
-                if error:
-                    session.rollback()
-                    txn_tracker.internal_error = error
-                    session.commit()
-                    return
-                session.add_all(receipt_manager.items_to_add)
-        elif model_id:
+            session.add_all(receipt_manager.items_to_add)
+    elif model_id:
+        try:
+            model = session.attendee(model_id)
+        except NoResultFound:
             try:
-                model = session.attendee(model_id)
+                model = session.group(model_id)
             except NoResultFound:
-                try:
-                    model = session.group(model_id)
-                except NoResultFound:
-                    txn_tracker.internal_error = f"Could not find model {model_id}!"
-                    session.commit()
-                    return
-            receipt = session.get_receipt_by_model(model, create_if_none="DEFAULT")
-            payment_request = SpinTerminalRequest(terminal_id=terminal_id,
-                                                  receipt=receipt,
-                                                  tracker=txn_tracker,
-                                                  **kwargs)
-            message = payment_request.prepare_payment(intent_id=intent_id, payment_method=c.SQUARE)
-            if message:
-                txn_tracker.internal_error = message
+                txn_tracker.internal_error = f"Could not find model {model_id}!"
                 session.commit()
                 return
-        c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id, 'intent_id', payment_request.intent.id)
+        receipt = session.get_receipt_by_model(model, create_if_none="DEFAULT")
+        payment_request = SpinTerminalRequest(terminal_id=terminal_id,
+                                              receipt=receipt,
+                                              tracker=txn_tracker,
+                                              **kwargs)
+        message = payment_request.prepare_payment(intent_id=intent_id, payment_method=c.SQUARE)
+        if message:
+            txn_tracker.internal_error = message
+            session.commit()
+            return
+    SpinTerminalRequest.set_terminal_status(terminal_id, intent_id=payment_request.intent.id)
+    return payment_request
+
+
+def finish_terminal_sale(session, payment_request, response):
+    """
+    Records the terminal's response to a sale, or the error if there was no response.
+    """
+    if response:
+        payment_request.process_sale_response(session, response)
+    else:
+        error = payment_request.error_message or 'Terminal request timed out or was interrupted'
+        payment_request.set_terminal_status(payment_request.terminal_id, last_error=error)
+        payment_request.tracker.internal_error = error
 
-        response = payment_request.send_sale_txn()
 
-        if response:
-            payment_request.process_sale_response(session, response)
-        else:
-            error = payment_request.error_message or 'Terminal request timed out or was interrupted'
-            c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id,
-                               'last_error', error)
-            txn_tracker.internal_error = error
+@celery.task
+def process_terminal_sale(workstation_num, terminal_id, model_id=None, pickup_group_id=None, **kwargs):
+    with Session() as session:
+        payment_request = prepare_terminal_sale(session, workstation_num, terminal_id, model_id=model_id,
+                                                pickup_group_id=pickup_group_id, **kwargs)
+        if payment_request:
+            finish_terminal_sale(session, payment_request, payment_request.send_sale_txn())
 
 
 @celery.schedule(timedelta(minutes=30))
@@ -0,0 +1,11 @@
+from uber.models import Session, Tracking
+from uber.tasks import celery
+
+
+__all__ = ['record_tracking']
+
+
+@celery.task
+def record_tracking(rows):
+    with Session() as session:
+        Tracking.insert_batch(session, rows)
@@ -0,0 +1,108 @@
+"""
+Runs SPIn terminal sales for every terminal from one asyncio process, instead of tying up a Celery worker for each
+sale while the terminal waits for its customer.
+
+Reg stations queue sales in Redis (see SpinTerminalRequest.queue_sale) when c.SPIN_TERMINAL_GATEWAY is set. The
+gateway pops them off the queue and sends each sale with a non-blocking HTTP client, running one sale at a time per
+terminal but any number of terminals at once. Database work before and after each sale runs in a thread so it
+never holds up the other terminals. Status updates go through SpinTerminalRequest.set_terminal_status, which
+publishes them for reg stations waiting in registration.wait_for_terminal_payment.
+
+Start it with "sep terminal_gateway".
+"""
+import asyncio
+import json
+from collections import defaultdict
+
+import aiohttp
+import redis.asyncio
+from pockets.autolog import log
+
+import uber.spin_rest_utils as spin_rest_utils
+from uber.config import c
+from uber.models import Session
+from uber.payments import SpinTerminalRequest
+from uber.tasks.registration import finish_terminal_sale, prepare_terminal_sale
+
+
+class TerminalGateway:
+    def __init__(self, api_url=None):
+        self.api_url = api_url or c.SPIN_TERMINAL_URL
+        self.terminal_locks = defaultdict(asyncio.Lock)
+        self.running = set()
+        self.http = None
+
+    async def run(self):
+        """
+        Processes queued sales until cancelled.
+        """
+        store = redis.asyncio.Redis(host=c.REDISCONF['host'], port=c.REDISCONF['port'],
+                                    db=c.REDISCONF['db'], decode_responses=True)
+        # Sales wait on the customer at the terminal, so only connecting to the SPIn proxy has a timeout
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30)
+        async with aiohttp.ClientSession(timeout=timeout) as self.http:
+            log.info("Terminal gateway waiting for sales on {}", SpinTerminalRequest.sale_queue_key())
+            try:
+                while True:
+                    queue, sale = await store.blpop([SpinTerminalRequest.sale_queue_key()])
+                    self.start_sale(json.loads(sale))
+            finally:
+                await store.aclose()
+
+    def start_sale(self, sale):
+        task = asyncio.create_task(self.process_sale(**sale))
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+        return task
+
+    async def process_sale(self, workstation_num, terminal_id, **kwargs):
+        """
+        Prepares, sends, and records a single terminal sale. Sales for the same terminal run one at a time in the
+        order they were queued.
+        """
+        async with self.terminal_locks[terminal_id]:
+            session = Session().session
+            try:
+                payment_request = await asyncio.to_thread(prepare_terminal_sale, session, workstation_num,
+                                                          terminal_id, **kwargs)
+                if not payment_request:
+                    return
+
+                response_json = await self.post(payment_request, 'sale', payment_request.sale_request_dict)
+                await asyncio.to_thread(finish_terminal_sale, session, payment_request, response_json)
+                await asyncio.to_thread(session.commit)
+            except Exception:
+                log.exception(f"Unexpected error while processing a sale on terminal {terminal_id}")
+                await asyncio.to_thread(SpinTerminalRequest.set_terminal_status, terminal_id,
+                                        last_error="Unexpected error")
+                await asyncio.to_thread(session.rollback)
+            finally:
+                await asyncio.to_thread(session.close)
+
+    async def post(self, payment_request, call_type, data):
+        """
+        Sends a request to the SPIn proxy and returns the response JSON, or None if the request failed, in which
+        case payment_request.error_message says why.
+        """
+        url = spin_rest_utils.get_call_url(self.api_url, call_type)
+        try:
+            async with self.http.post(url, data=data) as response:
+                return await response.json(content_type=None)
+        except aiohttp.ClientConnectionError as e:
+            log.error(f"Transaction {payment_request.tracking_id} could not connect to SPIn Proxy: {str(e)}")
+            payment_request.error_message = "Could not connect to SPIn Proxy"
+        except asyncio.TimeoutError as e:
+            log.error(f"Transaction {payment_request.tracking_id} timed out while connecting to SPIn Terminal: "
+                      f"{str(e)}")
+            payment_request.error_message = "The request timed out"
+        except (aiohttp.ClientError, ValueError) as e:
+            log.error(f"Transaction {payment_request.tracking_id} errored while processing SPIn Terminal sale: "
+                      f"{str(e)}")
+            payment_request.error_message = "Unexpected error"
+
+
+def main():
+    try:
+        asyncio.run(TerminalGateway().run())
+    except KeyboardInterrupt:
+        pass
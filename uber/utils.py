@@ -12,6 +12,7 @@ import traceback
 import uber
 import urllib
 
+from bisect import bisect_left, bisect_right
 from collections import defaultdict, OrderedDict
 from datetime import date, datetime, timedelta
 from glob import glob
@@ -210,6 +211,23 @@ def extract_urls(text):
     return re.findall(regex, text, re.IGNORECASE)
 
 
+def linkify_urls(text):
+    """
+    Wrap every URL found by extract_urls in an anchor tag that opens in a
+    new tab, adding a scheme to any URL that doesn't have one.
+    """
+    urls = extract_urls(text)
+    if not urls:
+        return text
+
+    for url in urls:
+        new_url = url
+        if not url.startswith('http'):
+            new_url = 'https://' + url
+        text = text.replace(url, f'<a href="{new_url}" target="_blank">{url}</a>')
+    return text
+
+
 def create_valid_user_supplied_redirect_url(url, default_url):
     """
     Create a valid redirect from user-supplied data.
@@ -826,6 +844,82 @@ class Order:
     def __str__(self):
         return self.order
 
+
+class ShiftIntervals:
+    """
+    The jobs an attendee is working, stored as intervals sorted by start and
+    end time, plus the merged blocks of time those intervals cover. Overlap,
+    adjacency and consecutive-work questions are answered with bisect lookups
+    instead of by building a set of every minute worked.
+
+    Shifts that overlap or touch are merged into one block, since the
+    attendee is working the whole time without a break.
+    """
+    def __init__(self, jobs):
+        self.intervals = sorted(((job.start_time, job.end_time, job) for job in jobs), key=lambda i: i[:2])
+        self.starts = [start for start, end, job in self.intervals]
+        self.by_end = sorted(self.intervals, key=lambda i: i[1])
+        self.ends = [end for start, end, job in self.by_end]
+
+        self.blocks = []
+        for interval in self.intervals:
+            if self.blocks and interval[0] <= self.blocks[-1][1]:
+                block = self.blocks[-1]
+                block[1] = max(block[1], interval[1])
+                block[2].append(interval)
+            else:
+                self.blocks.append([interval[0], interval[1], [interval]])
+        self.block_starts = [block[0] for block in self.blocks]
+
+    def _block_containing(self, when):
+        index = bisect_right(self.block_starts, when) - 1
+        if index >= 0 and self.blocks[index][1] > when:
+            return self.blocks[index]
+
+    def overlaps(self, start, end):
+        """
+        Returns True if any shift covers any time from start until end.
+        """
+        index = bisect_right(self.block_starts, start) - 1
+        if index >= 0 and self.blocks[index][1] > start:
+            return True
+        return index + 1 < len(self.blocks) and self.blocks[index + 1][0] < end
+
+    def jobs_ending_at(self, when):
+        """
+        Returns the jobs whose shifts are being worked in the minute before
+        `when` and end by `when`.
+        """
+        minute_before = when - timedelta(minutes=1)
+        return [job for start, end, job in self.by_end[bisect_right(self.ends, minute_before):
+                                                       bisect_right(self.ends, when)]
+                if start <= minute_before]
+
+    def jobs_starting_at(self, when):
+        return [job for start, end, job in self.intervals[bisect_left(self.starts, when):
+                                                          bisect_right(self.starts, when)]]
+
+    def worked_before(self, when):
+        """
+        Returns how many minutes in a row are being worked right up until
+        `when`, along with the jobs being worked during those minutes.
+        """
+        block = self._block_containing(when - timedelta(minutes=1))
+        if not block:
+            return 0, []
+        return int((when - block[0]).total_seconds() // 60), [job for start, end, job in block[2] if start < when]
+
+    def worked_after(self, when):
+        """
+        Returns how many minutes in a row are being worked starting at
+        `when`, along with the jobs being worked during those minutes.
+        """
+        block = self._block_containing(when)
+        if not block:
+            return 0, []
+        return int((block[1] - when).total_seconds() // 60), [job for start, end, job in block[2] if end > when]
+
+
 class RegistrationCode():
     """
     A class that provides functions to manage human-readable unique codes that